@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Flask for MSA A-Star and PA-Star
-Main entry point for the application
+Main entry point for the application (development server, see wsgi.py for production)
 
 Author: Vinícius Manoel
 Copyright: MIT License
@@ -9,7 +9,6 @@ Copyright: MIT License
 
 from app import create_app
 from app.config import BASE_DIR, BIN_DIR, SEQS_DIR, RESULTS_DIR, SOURCES
-from app.services.binaries_service import get_available_binaries
 
 
 if __name__ == '__main__':
@@ -22,15 +21,8 @@ if __name__ == '__main__':
     print(f"Base directory: {BASE_DIR}")
     print(f"Binaries: {BIN_DIR}")
 
-    # List available binaries
-    binaries = get_available_binaries()
-    print("\nAvailable binaries:")
-    print("  A-Star versions:")
-    for binary in binaries['astar']:
-        print(f"    - {binary['name']}")
-    print("  PA-Star versions:")
-    for binary in binaries['pastar']:
-        print(f"    - {binary['name']}")
+    # Binaries are probed in the background, see /api/binaries for the ones found
+    print("  (probed in the background, listed at /api/binaries)")
 
     print(f"\nSequences: {SEQS_DIR}")
     print("Sources available:")
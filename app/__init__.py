@@ -18,11 +18,64 @@ def create_app():
     from app.routes.sequences import sequences_bp
     from app.routes.run import run_bp
     from app.routes.results import results_bp
+    from app.routes.jobs import jobs_bp
+    from app.routes.admin import admin_bp
+    from app.routes.batches import batches_bp
+    from app.routes.benchmarks import benchmarks_bp
+    from app.routes.sweeps import sweeps_bp
+    from app.routes.workers import workers_bp
+    from app.routes.metrics import metrics_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(binaries_bp)
     app.register_blueprint(sequences_bp)
     app.register_blueprint(run_bp)
     app.register_blueprint(results_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(batches_bp)
+    app.register_blueprint(benchmarks_bp)
+    app.register_blueprint(sweeps_bp)
+    app.register_blueprint(workers_bp)
+    app.register_blueprint(metrics_bp)
+
+    # Register command line commands
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Probe binaries in the background instead of on each request
+    from app.services.binaries_service import start_registry_watcher
+    start_registry_watcher()
+
+    # Request latencies and, when enabled, profiling; registered first so that requests
+    # forwarded to the leader are measured too
+    from app.services import metrics_service, profiling_service
+    metrics_service.instrument(app)
+    metrics_service.start_metrics_flusher()
+    profiling_service.instrument(app)
+
+    # Negotiated gzip/brotli compression of JSON, HTML and text responses
+    from app.utils.http_cache import enable_compression
+    enable_compression(app)
+
+    # One process owns jobs, batches, benchmarks and sweeps: the elected leader, which picks up
+    # the jobs of a previous run of the service and keeps the sequence catalog up to date. The
+    # other processes of a multi-worker server forward it those requests and read the catalog it
+    # stores. Elected on the first request so that the debug reloader's monitor process does not
+    # take part.
+    from flask import request
+    from app.services import leader_service
+    from app.services.catalog_service import start_catalog_watcher
+    from app.services.jobs_service import recover_jobs
+
+    def on_elected():
+        start_catalog_watcher()
+        recover_jobs()
+
+    @app.before_request
+    def route_to_leader():
+        leader_service.start_election(app, on_elected=on_elected)
+        if not leader_service.is_leader() and leader_service.is_leader_route(request.path):
+            return leader_service.proxy_to_leader(request)
 
     return app
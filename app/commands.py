@@ -0,0 +1,99 @@
+"""
+Command line commands
+Registered on the Flask CLI, e.g. `flask --app app reindex-results`
+"""
+
+import logging
+import time
+import click
+from flask import current_app
+from app.config import BENCHMARK_REPETITIONS, BENCHMARK_WARMUP, WORKER_TOKEN
+from app.services import benchmarks_service, leader_service
+from app.services.results_service import reindex_results
+from app.services.worker_service import run_worker
+
+
+def register_commands(app):
+    """Attach the application's commands to app.cli"""
+
+    @app.cli.command('reindex-results')
+    def reindex_results_command():
+        """Rebuild the results index from the log files in the results directory"""
+        count = reindex_results()
+        click.echo(f'Indexed {count} result(s)')
+
+    @app.cli.command('benchmark')
+    @click.option('--binary', 'binaries', multiple=True, required=True,
+                  help='Binary to benchmark, repeatable; the first one is the speedup reference')
+    @click.option('--source', help='Sequence source of the suite (e.g. BALIBASE)')
+    @click.option('--category', help='Category path below the source (e.g. RV11)')
+    @click.option('--file', 'files', multiple=True, help='Sequence file of the suite, repeatable')
+    @click.option('--cost-type', default='PAM250', show_default=True)
+    @click.option('--threads', 'num_threads', type=int, help='Threads for binaries that support them')
+    @click.option('--repetitions', default=BENCHMARK_REPETITIONS, show_default=True)
+    @click.option('--warmup', default=BENCHMARK_WARMUP, show_default=True)
+    @click.option('--baseline', help='Stored baseline to check for regressions')
+    @click.option('--save-baseline', help='Store the results as a baseline with this name')
+    @click.option('--output', type=click.Path(dir_okay=False), help='Write the summary to a .csv or .json file')
+    def benchmark_command(binaries, source, category, files, cost_type, num_threads, repetitions, warmup,
+                          baseline, save_baseline, output):
+        """Benchmark binaries over a sequence suite; exits with 1 on regressions"""
+        # Runs of a second job queue would overlap the server's jobs and their cores; holding the
+        # leader lock also keeps a server started meanwhile from recovering this command's jobs
+        if not leader_service.claim_leadership(current_app._get_current_object()):
+            raise click.ClickException('A server is running: submit the benchmark with POST /api/benchmarks')
+        try:
+            benchmark = benchmarks_service.create_benchmark(
+                binaries=list(binaries), source=source, category=category, files=list(files) or None,
+                cost_type=cost_type, num_threads=num_threads, repetitions=repetitions, warmup=warmup,
+                baseline=baseline
+            )
+        except (FileNotFoundError, ValueError) as e:
+            raise click.ClickException(str(e))
+
+        benchmark_id = benchmark['benchmark_id']
+        click.echo(f"Benchmark {benchmark_id}: {benchmark['progress']['total']} measured run(s)")
+        completed = 0
+        while benchmark['status'] == benchmarks_service.STATUS_RUNNING:
+            time.sleep(1)
+            benchmark = benchmarks_service.get_benchmark(benchmark_id)
+            if benchmark['progress']['completed'] != completed:
+                completed = benchmark['progress']['completed']
+                click.echo(f"  {completed}/{benchmark['progress']['total']}")
+
+        for row in benchmark['summary']:
+            wall = row['wall_time_median']
+            click.echo(
+                f"{row['file']:<24} {row['binary_name']:<24} "
+                f"{f'{wall:.3f}s' if wall is not None else 'failed':>10} "
+                f"IQR {row['wall_time_iqr'] or 0:.3f}s "
+                f"RSS {row['max_rss_kb_median'] or 0:.0f} KiB "
+                f"speedup {row['speedup'] or 0:.2f}"
+                f"{'  REGRESSION' if row['regression'] else ''}"
+            )
+
+        if output:
+            export_format = 'csv' if output.endswith('.csv') else 'json'
+            content, _ = benchmarks_service.export_benchmark(benchmark_id, export_format=export_format)
+            with open(output, 'w') as f:
+                f.write(content)
+            click.echo(f'Summary written to {output}')
+
+        if save_baseline:
+            benchmarks_service.save_baseline(benchmark_id, save_baseline)
+            click.echo(f'Baseline {save_baseline} saved')
+
+        if benchmark['regressions']:
+            raise click.ClickException(f"{benchmark['regressions']} regression(s) against baseline {baseline}")
+
+    @app.cli.command('worker')
+    @click.option('--server', 'server_url', required=True, help='Base URL of the MSA app to take jobs from')
+    @click.option('--worker-id', help='Name of this worker in the job list [default: host-pid]')
+    @click.option('--slots', default=1, show_default=True, help='Jobs run at the same time')
+    @click.option('--token', default=WORKER_TOKEN, help='Worker token of the server [default: $MSA_WORKER_TOKEN]')
+    def worker_command(server_url, worker_id, slots, token):
+        """Run queued jobs of a server with the binaries of this host's BIN_DIR"""
+        if slots < 1:
+            raise click.BadParameter('must be positive', param_hint='--slots')
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+        run_worker(server_url, worker_id=worker_id, slots=slots, token=token)
@@ -3,13 +3,26 @@ Configuration module for MSA Flask application
 Contains all paths and constants used across the application
 """
 
+import os
 from pathlib import Path
 
 # Base directory
 BASE_DIR = Path(__file__).parent.parent.parent.absolute()
-BIN_DIR = BASE_DIR / 'bin'
+BIN_DIR = Path(os.environ.get('MSA_BIN_DIR', BASE_DIR / 'bin'))  # Workers may point at their own build
 SEQS_DIR = BASE_DIR / 'seqs'
 RESULTS_DIR = Path(__file__).parent.parent / 'results'
+DATA_DIR = Path(__file__).parent.parent / 'data'
+BENCHMARKS_DIR = DATA_DIR / 'benchmarks'
+SWEEPS_DIR = DATA_DIR / 'sweeps'
+DATABASE_PATH = DATA_DIR / 'msa_app.db'
+LEADER_LOCK_PATH = DATA_DIR / 'leader.lock'
+LEADER_SOCKET_PATH = DATA_DIR / 'leader.sock'
+WORKER_UPLOADS_DIR = DATA_DIR / 'uploads'
+METRICS_DIR = DATA_DIR / 'metrics'
+PROFILES_DIR = DATA_DIR / 'profiles'
+HTTP_CACHE_DIR = DATA_DIR / 'http_cache'
+LOG_INDEX_DIR = DATA_DIR / 'log_index'
+SCRATCH_DIR = Path(os.environ.get('MSA_SCRATCH_DIR', DATA_DIR / 'scratch'))  # Run working directories, may be tmpfs
 
 # Flask configuration
 SECRET_KEY = 'msa-astar-pastar-secret-key'
@@ -38,9 +51,132 @@ SOURCES = {
     }
 }
 
+# Multi-process serving settings
+LEADER_RETRY_INTERVAL = 5      # Seconds between attempts of a follower process to take over from a lost leader
+# Routes served by the leader process, which owns jobs, batches, benchmarks and sweeps
+LEADER_ROUTES = ('/api/run', '/api/jobs', '/api/batches', '/api/benchmarks', '/api/sweeps', '/api/workers',
+                 '/api/admin', '/metrics')
+
 # Execution settings
 MAX_EXECUTION_TIMEOUT = 1800   # 30 minutes in seconds
 MAX_DIRECTORY_DEPTH = 5
 
+# Metrics settings
+METRICS_FLUSH_INTERVAL = 5     # Seconds between writes of the metrics of each server process for /metrics
+RESULTS_SIZE_REFRESH_INTERVAL = 30  # Seconds the size of the results directory reported by /metrics is reused
+
+# HTTP caching settings
+COMPRESSION_MIN_SIZE = 1024    # Smaller responses are sent uncompressed
+COMPRESSION_LEVEL = 6          # gzip level of responses compressed on the fly
+COMPRESSIBLE_MIMETYPES = ['application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript']
+PRECOMPRESSED_MAX_FILES = 2000  # Compressed results kept in HTTP_CACHE_DIR, older ones are removed
+
+# Profiling settings
+PROFILING_ENABLED = os.environ.get('MSA_PROFILING', '') not in ('', '0')  # Time spans of requests and jobs
+PROFILE_SAMPLE_RATE = float(os.environ.get('MSA_PROFILE_SAMPLE_RATE', 0))  # Share of requests profiled in full
+PROFILE_MODE = 'stack'         # 'stack' samples the request's thread, 'cprofile' traces every call of the process
+PROFILE_STACK_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_MAX_FILES = 200        # Profiles kept in PROFILES_DIR, older ones are removed
+
+# Run telemetry settings
+TELEMETRY_SAMPLE_INTERVAL = 1.0  # Seconds between RSS/CPU samples of a running alignment
+TELEMETRY_MAX_SAMPLES = 1000     # Samples kept per run, older ones are thinned out beyond this
+
+# Sequence catalog settings
+CATALOG_REFRESH_INTERVAL = 60  # Seconds between checks of the sequence directories for changes
+
+# Binary registry settings
+BINARY_POLL_INTERVAL = 30      # Seconds between checks of BIN_DIR for new or modified binaries
+BINARY_PROBE_WORKERS = 8       # Binaries probed with --help in parallel
+
+# Job queue settings
+MAX_CONCURRENT_JOBS = 2        # Alignments executed at the same time
+MAX_FINISHED_JOBS = 500        # Finished jobs kept in memory for status queries
+PIN_CPU_AFFINITY = False       # Pin each alignment to its own disjoint set of CPUs
+DETACHED_POLL_INTERVAL = 1.0   # Seconds between checks of alignments reattached after a restart
+SCHEDULING_POLICY = 'sjf'      # 'sjf' starts the shortest predicted jobs first, 'fifo' in submission order
+QUEUE_AGING_RATE = 1.0         # Seconds of predicted run time a queued job is credited per second it waits
+DEFAULT_PREDICTED_RUNTIME = 600  # Run time in seconds assumed for jobs nothing is known about
+
+# Run time prediction settings
+PREDICTOR_MIN_RUNS = 5         # Past runs of a binary needed before its run time and memory are predicted
+PREDICTOR_MAX_RUNS = 1000      # Most recent runs of a binary the predictor learns from
+PREDICTOR_REFRESH_INTERVAL = 60  # Seconds the run history of a binary is reused before it is read again
+PREDICTOR_MEMORY_MARGIN = 1.25   # Factor applied to the predicted peak memory of a job when reserving it
+
+# Remote worker settings
+LOCAL_EXECUTION = True         # Run queued jobs on this host; False leaves them to remote workers
+WORKER_TOKEN = os.environ.get('MSA_WORKER_TOKEN')  # Shared secret of the workers, None disables them
+WORKER_LEASE_TIMEOUT = 60      # Seconds a leased job survives without a heartbeat of its worker
+WORKER_HEARTBEAT_INTERVAL = 15  # Seconds between heartbeats of a worker for its running job
+WORKER_POLL_INTERVAL = 2       # Seconds an idle worker waits before asking for a job again
+WORKER_MAX_ATTEMPTS = 3        # Workers lost by a job before it is failed instead of re-dispatched
+
+# Memory settings
+MEMORY_BUDGET_FRACTION = 0.8   # Share of the usable memory running alignments may reserve together
+JOB_MEMORY_LIMIT = None        # Hard memory cap per alignment in bytes, None caps it at the whole budget
+MIN_JOB_MEMORY = 64 * 1024 * 1024  # Memory reserved for any alignment on top of its estimate
+JOB_MEMORY_HEADROOM = 2.0      # Each alignment is capped at this factor of its reservation, at most the per-job limit
+JOB_MEMORY_SLACK = 512 * 1024 * 1024  # Added to each cap for address space reserved but not used (stacks, arenas)
+MEMORY_ESTIMATE_BYTES_PER_CELL = 16  # Estimated bytes per cell of the pairwise sequence lattices
+MEMORY_CGROUP_PARENT = None    # Delegated cgroup v2 directory for per-job memory.max groups, None uses RLIMIT_AS
+
+# Batch settings
+BATCH_MAX_PARALLEL = 4         # Default number of jobs of a batch queued at the same time
+BATCH_MAX_CELLS = 10000        # Largest file x binary x cost type matrix accepted
+MAX_FINISHED_BATCHES = 100     # Finished batches kept in memory for status queries
+
+# Benchmark settings
+BENCHMARK_REPETITIONS = 5      # Default measured runs per binary and file
+BENCHMARK_WARMUP = 1           # Default discarded runs before the measured ones
+BENCHMARK_MAX_RUNS = 2000      # Maximum number of runs of a single benchmark, warmup included
+BENCHMARK_REGRESSION_THRESHOLD = 0.10  # Relative slowdown or memory growth flagged as a regression
+MAX_FINISHED_BENCHMARKS = 20   # Finished benchmarks kept in memory, older ones are read from their report
+BENCHMARK_RUN_TIMEOUT = 2 * MAX_EXECUTION_TIMEOUT  # Seconds a measured run may queue and run before it fails
+
+# Thread-scaling sweep settings
+SWEEP_REPETITIONS = 3          # Default measured runs per thread count
+SWEEP_WARMUP = 1               # Default discarded runs before each thread count
+SWEEP_SATURATION_TOLERANCE = 0.05  # Speedup within this share of the best counts as flattened
+MAX_FINISHED_SWEEPS = 20       # Finished sweeps kept in memory, older ones are read from their report
+
+# Result cache settings
+RESULT_CACHE_MAX_BYTES = 5 * 1024 ** 3  # Results directory size before old results are evicted
+RESULT_CACHE_MAX_ENTRIES = 10000        # Cached results kept before old ones are evicted
+
+# Result storage settings
+COMPRESS_RESULTS = True        # Store result files as chunked gzip instead of plain text
+RESULT_CHUNK_SIZE = 1024 * 1024  # Uncompressed bytes per independently compressed chunk
+RESULT_COMPRESSION_LEVEL = 6   # gzip level of stored result files
+RESULT_PREVIEW_BYTES = 64 * 1024  # Bytes of the output and verbose log returned by /api/result
+
+# Alignment quality settings
+QUALITY_MAX_OUTPUT_BYTES = 256 * 1024 * 1024  # Larger outputs are stored without quality scores
+BALIBASE_REFERENCE_EXTENSIONS = ['.msf', '.ref.fasta']  # Reference alignments next to BALIBASE inputs
+
+# Log viewer settings
+LOG_PAGE_SIZE = 200            # Lines per page of /api/result/<id>/log
+LOG_MAX_PAGE_SIZE = 5000       # Largest page or number of search matches a client may ask for
+LOG_INDEX_BLOCK_SIZE = 64 * 1024  # Bytes of log per entry of its line index
+LOG_MAX_LINE_LENGTH = 4096     # Longer lines are truncated in pages and search matches
+LOG_MAX_PATTERN_LENGTH = 256   # Longest search pattern accepted
+
+# Results listing settings
+RESULTS_PAGE_SIZE = 50         # Results per page in /api/results
+RESULTS_MAX_PAGE_SIZE = 500    # Largest page a client may ask for
+
+# Output streaming settings
+STREAM_BUFFER_LINES = 1000     # Recent output lines kept in memory per job
+STREAM_MAX_LINE_LENGTH = 4096  # Longer lines are truncated in the buffer
+STREAM_POLL_INTERVAL = 0.2     # Seconds between checks for new output
+STREAM_KEEPALIVE = 15          # Seconds between SSE keep-alive comments
+
 # File extensions
 FASTA_EXTENSIONS = ['.fasta', '.txt']
+COMPRESSED_EXTENSIONS = ['.gz', '.bz2']   # Accepted on top of a FASTA extension, e.g. .fasta.gz
+
+# Sequence file limits
+MAX_FASTA_FILE_SIZE = 1024 ** 3               # Bytes on disk
+MAX_FASTA_DECOMPRESSED_SIZE = 4 * 1024 ** 3   # Bytes after decompression
+MAX_SEQUENCE_LENGTH = 500_000_000             # Residues in a single record
+MAX_RESIDUES_PER_REQUEST = 1_000_000          # Residues returned by /api/sequence_residues
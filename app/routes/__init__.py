@@ -13,6 +13,8 @@ def index():
     """Main page"""
     from flask import render_template
     from app.services.sequences_service import scan_all_sequences
+    from app.utils.profiling import span
     
     all_sequences = scan_all_sequences()
-    return render_template('index.html', all_sequences=all_sequences)
+    with span('render'):
+        return render_template('index.html', all_sequences=all_sequences)
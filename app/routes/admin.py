@@ -0,0 +1,35 @@
+"""
+Administration routes
+"""
+
+from flask import Blueprint, jsonify, send_file
+from app.services import cores_service, memory_service, profiling_service
+
+admin_bp = Blueprint('admin', __name__)
+
+
+@admin_bp.route('/api/admin/cores')
+def get_cores():
+    """Current allocation of CPU cores to running alignments"""
+    return jsonify(cores_service.get_allocation())
+
+
+@admin_bp.route('/api/admin/memory')
+def get_memory():
+    """Current memory budget and reservations of running alignments"""
+    return jsonify(memory_service.get_allocation())
+
+
+@admin_bp.route('/api/admin/profiles')
+def list_profiles():
+    """Request profiles saved by the profiling layer, newest first"""
+    return jsonify(profiling_service.list_profiles())
+
+
+@admin_bp.route('/api/admin/profiles/<name>')
+def download_profile(name):
+    """Download a saved profile (.prof for pstats/snakeviz, .folded for flame graph tools)"""
+    try:
+        return send_file(profiling_service.get_profile_path(name), as_attachment=True)
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
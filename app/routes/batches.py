@@ -0,0 +1,58 @@
+"""
+Batch execution routes
+"""
+
+from flask import Blueprint, jsonify, request
+from app.config import BATCH_MAX_PARALLEL
+from app.services.batches_service import create_batch, get_batch, list_batches, cancel_batch
+
+batches_bp = Blueprint('batches', __name__)
+
+
+@batches_bp.route('/api/batches', methods=['POST'])
+def create_batch_route():
+    """Run a set of binaries and cost types over a dataset directory or file list"""
+    data = request.json
+    num_threads_raw = data.get('num_threads', 'auto')
+
+    try:
+        batch = create_batch(
+            binaries=data.get('binaries') or [],
+            cost_types=data.get('cost_types') or ['PAM250'],
+            source=data.get('source'),
+            category=data.get('category'),
+            files=data.get('files'),
+            num_threads=None if num_threads_raw == 'auto' else num_threads_raw,
+            verbose=data.get('verbose', False),
+            force=data.get('force', False),
+            max_parallel=int(data.get('max_parallel', BATCH_MAX_PARALLEL))
+        )
+        return jsonify(batch), 202
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@batches_bp.route('/api/batches')
+def list_batches_route():
+    """List batches with their progress"""
+    return jsonify(list_batches())
+
+
+@batches_bp.route('/api/batches/<batch_id>')
+def get_batch_route(batch_id):
+    """Get the progress, cells and summary of a batch"""
+    try:
+        return jsonify(get_batch(batch_id))
+    except KeyError:
+        return jsonify({'error': 'Batch not found'}), 404
+
+
+@batches_bp.route('/api/batches/<batch_id>', methods=['DELETE'])
+def cancel_batch_route(batch_id):
+    """Cancel a batch"""
+    try:
+        return jsonify(cancel_batch(batch_id))
+    except KeyError:
+        return jsonify({'error': 'Batch not found'}), 404
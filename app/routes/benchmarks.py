@@ -0,0 +1,96 @@
+"""
+Benchmark routes
+"""
+
+from flask import Blueprint, Response, jsonify, request
+from app.config import BENCHMARK_REPETITIONS, BENCHMARK_WARMUP
+from app.services.benchmarks_service import (create_benchmark, get_benchmark, list_benchmarks, cancel_benchmark,
+                                             export_benchmark, save_baseline, list_baselines)
+
+benchmarks_bp = Blueprint('benchmarks', __name__)
+
+
+@benchmarks_bp.route('/api/benchmarks', methods=['POST'])
+def create_benchmark_route():
+    """Benchmark a set of binaries over a sequence suite"""
+    data = request.json
+    num_threads_raw = data.get('num_threads', 'auto')
+
+    try:
+        benchmark = create_benchmark(
+            binaries=data.get('binaries') or [],
+            source=data.get('source'),
+            category=data.get('category'),
+            files=data.get('files'),
+            cost_type=data.get('cost_type', 'PAM250'),
+            num_threads=None if num_threads_raw == 'auto' else num_threads_raw,
+            repetitions=int(data.get('repetitions', BENCHMARK_REPETITIONS)),
+            warmup=int(data.get('warmup', BENCHMARK_WARMUP)),
+            baseline=data.get('baseline')
+        )
+        return jsonify(benchmark), 202
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@benchmarks_bp.route('/api/benchmarks')
+def list_benchmarks_route():
+    """List running and stored benchmarks"""
+    return jsonify(list_benchmarks())
+
+
+@benchmarks_bp.route('/api/benchmarks/baselines')
+def list_baselines_route():
+    """List the stored baselines"""
+    return jsonify(list_baselines())
+
+
+@benchmarks_bp.route('/api/benchmarks/<benchmark_id>')
+def get_benchmark_route(benchmark_id):
+    """Get the progress, runs and summary of a benchmark"""
+    try:
+        return jsonify(get_benchmark(benchmark_id))
+    except KeyError:
+        return jsonify({'error': 'Benchmark not found'}), 404
+
+
+@benchmarks_bp.route('/api/benchmarks/<benchmark_id>', methods=['DELETE'])
+def cancel_benchmark_route(benchmark_id):
+    """Cancel a running benchmark"""
+    try:
+        return jsonify(cancel_benchmark(benchmark_id))
+    except KeyError:
+        return jsonify({'error': 'Benchmark not found'}), 404
+
+
+@benchmarks_bp.route('/api/benchmarks/<benchmark_id>/export')
+def export_benchmark_route(benchmark_id):
+    """Export the summary or runs of a benchmark as CSV or JSON"""
+    export_format = request.args.get('format', 'json')
+    table = request.args.get('table', 'summary')
+
+    try:
+        content, mimetype = export_benchmark(benchmark_id, export_format=export_format, table=table)
+    except KeyError:
+        return jsonify({'error': 'Benchmark not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f'benchmark_{benchmark_id}_{table}.{export_format}'
+    return Response(content, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@benchmarks_bp.route('/api/benchmarks/<benchmark_id>/baseline', methods=['POST'])
+def save_baseline_route(benchmark_id):
+    """Store the medians of a finished benchmark as a named baseline"""
+    data = request.json or {}
+
+    try:
+        return jsonify(save_baseline(benchmark_id, data.get('name'))), 201
+    except KeyError:
+        return jsonify({'error': 'Benchmark not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
@@ -2,8 +2,9 @@
 Binary management routes
 """
 
-from flask import Blueprint, jsonify
-from app.services.binaries_service import get_available_binaries
+from flask import Blueprint
+from app.services.binaries_service import get_available_binaries, get_registry_version
+from app.utils.http_cache import cached_json, from_mtime_ns, make_etag
 
 binaries_bp = Blueprint('binaries', __name__)
 
@@ -11,5 +12,5 @@ binaries_bp = Blueprint('binaries', __name__)
 @binaries_bp.route('/api/binaries')
 def get_binaries():
     """API endpoint to get available binary versions"""
-    binaries = get_available_binaries()
-    return jsonify(binaries)
+    token, mtime_ns = get_registry_version()
+    return cached_json(get_available_binaries, make_etag('binaries', token), from_mtime_ns(mtime_ns))
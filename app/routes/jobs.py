@@ -0,0 +1,92 @@
+"""
+Job status routes
+"""
+
+import json
+import re
+from flask import Blueprint, Response, jsonify, request
+from app.config import STREAM_KEEPALIVE
+from app.services.jobs_service import get_job, get_job_output, list_jobs, cancel_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# Line ends of Server-Sent Events, any of which ends a field
+SSE_LINE_END = re.compile(r'\r\n|\r|\n')
+
+
+@jobs_bp.route('/api/jobs')
+def list_jobs_route():
+    """List queued, running and recently finished jobs"""
+    return jsonify(list_jobs())
+
+
+@jobs_bp.route('/api/jobs/<job_id>')
+def get_job_route(job_id):
+    """Get the status of a job"""
+    try:
+        return jsonify(get_job(job_id))
+    except KeyError:
+        return jsonify({'error': 'Job not found'}), 404
+
+
+@jobs_bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job_route(job_id):
+    """Cancel a queued or running job"""
+    try:
+        job = cancel_job(job_id)
+        return jsonify({
+            'success': True,
+            'message': 'Cancellation requested',
+            'job': job
+        })
+    except KeyError:
+        return jsonify({'error': 'Job not found'}), 404
+
+
+@jobs_bp.route('/api/jobs/<job_id>/stream')
+def stream_job_route(job_id):
+    """Stream the job's stdout, stderr and verbose log as Server-Sent Events"""
+    try:
+        output = get_job_output(job_id)
+    except KeyError:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # Browsers resend the last received id when they reconnect
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '0')
+    try:
+        last_seq = int(last_event_id)
+    except ValueError:
+        last_seq = 0
+
+    def generate(last_seq):
+        while True:
+            lines, skipped, finished = output.read_since(last_seq, timeout=STREAM_KEEPALIVE)
+
+            if finished:
+                try:
+                    status = get_job(job_id)['status']
+                except KeyError:
+                    status = None
+                yield f"event: end\ndata: {json.dumps({'status': status})}\n\n"
+                return
+
+            if not lines:
+                yield ': keepalive\n\n'
+                continue
+
+            if skipped:
+                yield f"event: skipped\ndata: {skipped}\n\n"
+
+            for seq, name, line in lines:
+                yield f"id: {seq}\nevent: {name}\n{_data_fields(line)}\n"
+            last_seq = lines[-1][0]
+
+    return Response(generate(last_seq), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def _data_fields(text):
+    """Data fields of an event carrying text, so that a carriage return in it cannot end the field early"""
+    return ''.join(f'data: {piece}\n' for piece in SSE_LINE_END.split(text))
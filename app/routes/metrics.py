@@ -0,0 +1,14 @@
+"""
+Metrics routes
+"""
+
+from flask import Blueprint, Response
+from app.services.metrics_service import render_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics')
+def metrics_route():
+    """Service and workload metrics in the Prometheus text format"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
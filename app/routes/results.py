@@ -2,37 +2,128 @@
 Results management routes
 """
 
-from flask import Blueprint, jsonify, send_file
-from app.services.results_service import list_results, get_result, get_result_file_path, delete_result
+import mimetypes
+from flask import Blueprint, Response, jsonify, request, send_file
+from app.config import RESULTS_PAGE_SIZE, LOG_PAGE_SIZE
+from app.services.logs_service import get_log_page, search_log
+from app.services.results_service import (list_results, get_result, open_artifact, delete_result, RESULT_ARTIFACTS,
+                                          get_results_version, get_result_version)
+from app.utils.http_cache import cached_json, from_mtime_ns, make_etag
 
 results_bp = Blueprint('results', __name__)
 
 
 @results_bp.route('/api/results')
 def list_results_route():
-    """List all previous results"""
-    results = list_results()
-    return jsonify(results)
+    """
+    List previous results, paginated, sorted and filtered by query parameters
+    Unchanged listings are answered with 304 Not Modified
+    """
+    args = request.args
+    try:
+        query = dict(
+            page=int(args.get('page', 1)),
+            per_page=int(args.get('per_page', RESULTS_PAGE_SIZE)),
+            sort=args.get('sort', 'timestamp'),
+            order=args.get('order', 'desc'),
+            filters={
+                'binary': args.get('binary'),
+                'input_file': args.get('input_file'),
+                'cost_type': args.get('cost_type'),
+                'return_code': _optional(args, 'return_code', int),
+                'date_from': args.get('date_from'),
+                'date_to': args.get('date_to'),
+                'min_time': _optional(args, 'min_time', float),
+                'max_time': _optional(args, 'max_time', float)
+            }
+        )
+        # The listing of a query changes only when results are stored or deleted
+        token, mtime_ns = get_results_version()
+        return cached_json(lambda: list_results(**query), make_etag('results', token, request.query_string),
+                           from_mtime_ns(mtime_ns))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+def _optional(args, name, convert):
+    """Convert an optional query parameter, raising ValueError if malformed"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}: {value}')
 
 
 @results_bp.route('/api/result/<result_id>')
 def get_result_route(result_id):
-    """Get specific result details"""
+    """Get specific result details; they only change when the result is deleted, clients revalidate them"""
     try:
-        result = get_result(result_id)
-        return jsonify(result)
+        token, mtime_ns = get_result_version(result_id)
+        return cached_json(lambda: get_result(result_id), make_etag('result', result_id, token),
+                           from_mtime_ns(mtime_ns), precompress=True)
     except FileNotFoundError:
         return jsonify({'error': 'Result not found'}), 404
 
 
+@results_bp.route('/api/result/<result_id>/log')
+def get_result_log_route(result_id):
+    """
+    Page through a log of a result (?artifact=verbose|stdout|stderr&offset=&limit=)
+    With grep, return the lines containing that text from line offset on instead,
+    or matching it as a regular expression with regex=1
+    """
+    args = request.args
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args.get('limit', LOG_PAGE_SIZE))
+        artifact = args.get('artifact', 'verbose')
+        if args.get('grep'):
+            return jsonify(search_log(result_id, args['grep'], artifact=artifact, offset=offset, limit=limit,
+                                      regex=bool(args.get('regex'))))
+        return jsonify(get_log_page(result_id, artifact=artifact, offset=offset, limit=limit))
+    except FileNotFoundError:
+        return jsonify({'error': 'Log not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
 @results_bp.route('/api/download/<result_id>')
 def download_result(result_id):
-    """Download result file"""
+    """
+    Download a result file (?artifact=output|stdout|stderr|verbose), decompressed while it is sent
+    A single byte range of the content may be requested; ?compressed=1 sends the stored .gz file instead
+    """
+    artifact_name = request.args.get('artifact', 'output')
     try:
-        output_file = get_result_file_path(result_id)
-        return send_file(output_file, as_attachment=True)
+        artifact = open_artifact(result_id, artifact_name)
     except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f'{result_id}{RESULT_ARTIFACTS[artifact_name]}'
+    if request.args.get('compressed') and artifact.index is not None:
+        return send_file(artifact.path, as_attachment=True, download_name=f'{filename}.gz')
+
+    start, end = 0, artifact.size
+    status = 200
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'attachment; filename={filename}'
+    }
+    if request.range is not None:
+        byte_range = request.range.range_for_length(artifact.size)
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{artifact.size}'})
+        start, end = byte_range
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{artifact.size}'
+    headers['Content-Length'] = str(end - start)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    return Response(artifact.iter_range(start, end), status=status, mimetype=mimetype, headers=headers)
 
 
 @results_bp.route('/api/result/<result_id>', methods=['DELETE'])
@@ -3,15 +3,14 @@ Alignment execution routes
 """
 
 from flask import Blueprint, jsonify, request
-import subprocess
-from app.services.runner_service import run_alignment
+from app.services.jobs_service import submit_job
 
 run_bp = Blueprint('run', __name__)
 
 
 @run_bp.route('/api/run', methods=['POST'])
 def run_alignment_route():
-    """Execute MSA alignment"""
+    """Queue an MSA alignment and return its job id"""
     data = request.json
 
     algorithm = data.get('algorithm', 'msa_astar')
@@ -21,29 +20,32 @@ def run_alignment_route():
     num_threads_raw = data.get('num_threads', 'auto')
     num_threads = None if num_threads_raw == 'auto' else num_threads_raw
     verbose = data.get('verbose', False)
+    force = data.get('force', False)
+    deadline = data.get('deadline')  # Seconds from now
 
     if not file_path_str:
         return jsonify({'error': 'File path not provided'}), 400
 
     try:
-        result = run_alignment(
+        job = submit_job(
             binary_name=binary_name,
             algorithm=algorithm,
             file_path=file_path_str,
             cost_type=cost_type,
             num_threads=num_threads,
-            verbose=verbose
+            verbose=verbose,
+            force=force,
+            deadline=deadline
         )
-        return jsonify(result)
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status']
+        }), 202
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
-    except subprocess.TimeoutExpired:
-        return jsonify({
-            'success': False,
-            'error': 'Execution timeout (10 minutes)'
-        }), 500
     except Exception as e:
         return jsonify({
             'success': False,
@@ -5,8 +5,13 @@ Sequence management routes
 from flask import Blueprint, jsonify, request
 from pathlib import Path
 from app.services.sequences_service import scan_all_sequences
+from app.services import cores_service, predictor_service
 from app.services.binaries_service import get_binary_path
-from app.utils.fasta import parse_fasta_file, analyze_sequences
+from app.services.catalog_service import get_catalog_version, get_file_info
+from app.config import MAX_RESIDUES_PER_REQUEST
+from app.utils.fasta import iter_fasta_summaries, overall_sequence_type, read_sequence_range, summarize_composition
+from app.utils.http_cache import cached_json, from_mtime_ns, make_etag
+from app.utils.profiling import span
 
 sequences_bp = Blueprint('sequences', __name__)
 
@@ -14,8 +19,8 @@ sequences_bp = Blueprint('sequences', __name__)
 @sequences_bp.route('/api/sequences')
 def get_sequences():
     """API endpoint to get available sequences"""
-    all_sequences = scan_all_sequences()
-    return jsonify(all_sequences)
+    token, mtime_ns = get_catalog_version()
+    return cached_json(scan_all_sequences, make_etag('sequences', token), from_mtime_ns(mtime_ns))
 
 
 @sequences_bp.route('/api/sequence_info', methods=['POST'])
@@ -38,11 +43,22 @@ def get_sequence_info():
     if not file_path.exists():
         return jsonify({'error': 'File not found'}), 404
 
-    # Parse FASTA file
-    sequences = parse_fasta_file(file_path)
-
-    # Analyze sequences
-    overall_type = analyze_sequences(sequences)
+    # Indexed files are answered from the catalog, others are parsed
+    with span('catalog'):
+        file_info = get_file_info(file_path)
+    if file_info is not None:
+        sequences = file_info['sequences']
+        overall_type = file_info['sequence_type']
+        composition = file_info['composition']
+    else:
+        try:
+            with span('parse'):
+                sequences = list(iter_fasta_summaries(file_path))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        with span('analyze'):
+            overall_type = overall_sequence_type([seq['type'] for seq in sequences])
+            composition = summarize_composition(sequences, overall_type)
 
     # Build example command
     command = None
@@ -63,10 +79,65 @@ def get_sequence_info():
         # If binary not selected, show generic command
         pass
 
+    # Run time and memory to expect, with the algorithm's default binary if none is selected
+    estimate = None
+    try:
+        binary_path, supports_threads = get_binary_path(binary_name=binary_name, algorithm=algorithm)
+        if not supports_threads:
+            threads = 1
+        elif num_threads is None:
+            threads = cores_service.get_total_cores()
+        else:
+            threads = int(num_threads)
+        with span('predict'):
+            estimate = predictor_service.predict(binary_path.name, file_path, cost_type, threads)
+        estimate['binary'] = binary_path.name
+        del estimate['features']
+    except Exception:
+        pass
+
     return jsonify({
         'num_sequences': len(sequences),
         'sequences': sequences,
         'sequence_type': overall_type,
+        'composition': composition,
         'file_path': str(file_path),
-        'command': command
+        'command': command,
+        'estimate': estimate
     })
+
+
+@sequences_bp.route('/api/sequence_residues', methods=['POST'])
+def get_sequence_residues():
+    """Get a range of residues of one record of a sequence file"""
+    data = request.json
+    file_path_str = data.get('file_path')
+
+    if not file_path_str:
+        return jsonify({'error': 'File path not provided'}), 400
+
+    file_path = Path(file_path_str)
+
+    if not file_path.exists():
+        return jsonify({'error': 'File not found'}), 404
+
+    try:
+        index = int(data.get('index', 0))
+        start = int(data.get('start', 0))
+        end = int(data.get('end', start + MAX_RESIDUES_PER_REQUEST))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'index, start and end must be integers'}), 400
+
+    if index < 0 or start < 0 or end < start:
+        return jsonify({'error': 'Invalid residue range'}), 400
+    end = min(end, start + MAX_RESIDUES_PER_REQUEST)
+
+    try:
+        record = read_sequence_range(file_path, index, start, end)
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    record['index'] = index
+    return jsonify(record)
@@ -0,0 +1,57 @@
+"""
+Thread-scaling sweep routes
+"""
+
+from flask import Blueprint, jsonify, request
+from app.config import SWEEP_REPETITIONS, SWEEP_WARMUP
+from app.services.sweeps_service import create_sweep, get_sweep, list_sweeps, cancel_sweep
+
+sweeps_bp = Blueprint('sweeps', __name__)
+
+
+@sweeps_bp.route('/api/sweeps', methods=['POST'])
+def create_sweep_route():
+    """Run a binary on one input across a list of thread counts"""
+    data = request.json
+
+    if not data.get('file_path'):
+        return jsonify({'error': 'File path not provided'}), 400
+
+    try:
+        sweep = create_sweep(
+            binary_name=data.get('binary_name'),
+            file_path=data.get('file_path'),
+            cost_type=data.get('cost_type', 'PAM250'),
+            thread_counts=data.get('thread_counts'),
+            repetitions=int(data.get('repetitions', SWEEP_REPETITIONS)),
+            warmup=int(data.get('warmup', SWEEP_WARMUP))
+        )
+        return jsonify(sweep), 202
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@sweeps_bp.route('/api/sweeps')
+def list_sweeps_route():
+    """List running and stored sweeps"""
+    return jsonify(list_sweeps())
+
+
+@sweeps_bp.route('/api/sweeps/<sweep_id>')
+def get_sweep_route(sweep_id):
+    """Get the runs and scaling curve of a sweep"""
+    try:
+        return jsonify(get_sweep(sweep_id))
+    except KeyError:
+        return jsonify({'error': 'Sweep not found'}), 404
+
+
+@sweeps_bp.route('/api/sweeps/<sweep_id>', methods=['DELETE'])
+def cancel_sweep_route(sweep_id):
+    """Cancel a running sweep"""
+    try:
+        return jsonify(cancel_sweep(sweep_id))
+    except KeyError:
+        return jsonify({'error': 'Sweep not found'}), 404
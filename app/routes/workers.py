@@ -0,0 +1,87 @@
+"""
+Remote worker routes
+"""
+
+import hmac
+from flask import Blueprint, jsonify, request, send_file
+from app.config import WORKER_TOKEN
+from app.services.jobs_service import (lease_job, heartbeat_job, get_leased_input, get_upload_path, complete_job,
+                                       LeaseLost)
+
+workers_bp = Blueprint('workers', __name__)
+
+# Bytes read at a time from an artifact upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@workers_bp.before_request
+def check_worker_token():
+    """Only accept workers presenting WORKER_TOKEN; without one remote workers are disabled"""
+    if not WORKER_TOKEN:
+        return jsonify({'error': 'Remote workers are disabled: WORKER_TOKEN is not configured'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Worker-Token', '').encode(), WORKER_TOKEN.encode()):
+        return jsonify({'error': 'Invalid worker token'}), 401
+
+
+@workers_bp.errorhandler(LeaseLost)
+def lease_lost(e):
+    """The worker must abandon the job, it was given to another worker or cancelled"""
+    return jsonify({'error': str(e)}), 409
+
+
+@workers_bp.errorhandler(KeyError)
+def job_not_found(e):
+    """The job was pruned or belongs to an earlier service"""
+    return jsonify({'error': 'Job not found'}), 404
+
+
+@workers_bp.route('/api/workers/lease', methods=['POST'])
+def lease_route():
+    """Give a worker the next queued job it can run, 204 if there is none"""
+    data = request.json or {}
+
+    if not data.get('worker_id'):
+        return jsonify({'error': 'Worker id not provided'}), 400
+
+    lease = lease_job(data['worker_id'], set(data.get('binaries') or []))
+    if lease is None:
+        return '', 204
+    return jsonify(lease)
+
+
+@workers_bp.route('/api/workers/jobs/<job_id>/input')
+def input_route(job_id):
+    """Download the input file of a leased job"""
+    return send_file(get_leased_input(job_id, request.args.get('lease_id')))
+
+
+@workers_bp.route('/api/workers/jobs/<job_id>/artifacts/<name>', methods=['PUT'])
+def upload_artifact_route(job_id, name):
+    """Upload an output file of a leased job, streamed to disk"""
+    try:
+        path = get_upload_path(job_id, request.args.get('lease_id'), name)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with open(path, 'wb') as f:
+        while chunk := request.stream.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+    return jsonify({'success': True, 'size': path.stat().st_size})
+
+
+@workers_bp.route('/api/workers/jobs/<job_id>/heartbeat', methods=['POST'])
+def heartbeat_route(job_id):
+    """Keep the lease on a running job; the answer says whether to cancel it"""
+    data = request.json or {}
+    return jsonify(heartbeat_job(job_id, data.get('lease_id')))
+
+
+@workers_bp.route('/api/workers/jobs/<job_id>/complete', methods=['POST'])
+def complete_route(job_id):
+    """Report the log of a finished run, or the error that prevented it"""
+    data = request.json or {}
+
+    if data.get('log') is None and not data.get('error'):
+        return jsonify({'error': 'Neither log nor error provided'}), 400
+
+    return jsonify(complete_job(job_id, data.get('lease_id'), log_content=data.get('log'), error=data.get('error')))
@@ -0,0 +1,292 @@
+"""
+Batch execution service
+Expands a dataset and a set of binaries into a matrix of alignment jobs
+"""
+
+import statistics
+import threading
+import uuid
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+from app.config import SOURCES, BATCH_MAX_PARALLEL, BATCH_MAX_CELLS, MAX_FINISHED_BATCHES
+from app.services.binaries_service import get_binary_path
+from app.services.jobs_service import submit_job, cancel_job, FINISHED_STATUSES, STATUS_CANCELLED
+from app.services.sequences_service import scan_all_sequences
+
+# Cell state before its job is submitted
+STATUS_PENDING = 'pending'
+
+_batches = {}
+_lock = threading.Lock()
+
+
+class Batch:
+    """A matrix of alignment cells executed under a concurrency limit"""
+
+    def __init__(self, cells, max_parallel, num_threads, verbose, force):
+        self.id = uuid.uuid4().hex
+        self.cells = cells
+        self.max_parallel = max_parallel
+        self.num_threads = num_threads
+        self.verbose = verbose
+        self.force = force
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.cancelled = False
+
+    def is_finished(self):
+        return all(cell['status'] in FINISHED_STATUSES for cell in self.cells)
+
+    def to_dict(self, include_cells=True):
+        """Serializable view of the batch with progress and summary"""
+        progress = {'total': len(self.cells)}
+        for cell in self.cells:
+            progress[cell['status']] = progress.get(cell['status'], 0) + 1
+
+        batch = {
+            'batch_id': self.id,
+            'status': 'cancelled' if self.cancelled else ('done' if self.is_finished() else 'running'),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'max_parallel': self.max_parallel,
+            'progress': progress,
+            'summary': _summarize(self.cells)
+        }
+        if include_cells:
+            batch['cells'] = [dict(cell) for cell in self.cells]
+        return batch
+
+
+def resolve_dataset_files(source=None, category=None, files=None):
+    """
+    Return the list of sequence files of a batch
+    Either an explicit list of files, or every file below a source and
+    optional category path (e.g. 'RV11' or 'RV11/sub') of the catalog
+    """
+    if files:
+        paths = [Path(file_path) for file_path in files]
+        for path in paths:
+            if not path.exists():
+                raise FileNotFoundError(f'File not found: {path}')
+        return paths
+
+    if not source:
+        raise ValueError('Either files or source must be provided')
+    if source not in SOURCES:
+        raise ValueError(f'Unknown source: {source}')
+
+    all_sequences = scan_all_sequences()
+    if source not in all_sequences:
+        raise FileNotFoundError(f'No sequences found for source: {source}')
+
+    node = all_sequences[source]['categories']
+    base_path = SOURCES[source]['path']
+    for part in Path(category).parts if category else []:
+        if part not in node or part == '_files':
+            raise FileNotFoundError(f'Category not found: {category}')
+        node = node[part]
+        base_path = base_path / part
+
+    return _collect_files(node, base_path)
+
+
+def _collect_files(node, base_path):
+    """All files of a directory structure node, recursively"""
+    paths = [base_path / name for name in node.get('_files', [])]
+    for name, child in node.items():
+        if name != '_files':
+            paths.extend(_collect_files(child, base_path / name))
+    return paths
+
+
+def create_batch(binaries, cost_types, source=None, category=None, files=None, num_threads=None,
+                 verbose=False, force=False, max_parallel=BATCH_MAX_PARALLEL):
+    """
+    Expand a batch request into cells and start submitting their jobs
+    Returns the batch as a dict
+    """
+    if not binaries:
+        raise ValueError('At least one binary must be provided')
+    if not cost_types:
+        raise ValueError('At least one cost type must be provided')
+    if max_parallel < 1:
+        raise ValueError('max_parallel must be positive')
+
+    for binary_name in binaries:
+        get_binary_path(binary_name=binary_name)
+
+    file_paths = resolve_dataset_files(source=source, category=category, files=files)
+    if not file_paths:
+        raise ValueError('No sequence files selected')
+
+    num_cells = len(file_paths) * len(binaries) * len(cost_types)
+    if num_cells > BATCH_MAX_CELLS:
+        raise ValueError(f'Batch has {num_cells} cells, the limit is {BATCH_MAX_CELLS}')
+
+    cells = [
+        {
+            'file_path': str(file_path),
+            'binary_name': binary_name,
+            'cost_type': cost_type,
+            'status': STATUS_PENDING,
+            'job_id': None,
+            'result_id': None,
+            'execution_time': None,
+            'return_code': None,
+            'cache': None,
+            'error': None
+        }
+        for file_path, binary_name, cost_type in product(file_paths, binaries, cost_types)
+    ]
+
+    batch = Batch(cells, max_parallel, num_threads, verbose, force)
+    with _lock:
+        _batches[batch.id] = batch
+        _prune_finished_batches()
+
+    _fill(batch)
+    return get_batch(batch.id)
+
+
+def get_batch(batch_id):
+    """Get the state of a batch"""
+    with _lock:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            raise KeyError(batch_id)
+        return batch.to_dict()
+
+
+def list_batches():
+    """List all known batches without their cells, newest first"""
+    with _lock:
+        batches = [batch.to_dict(include_cells=False) for batch in _batches.values()]
+    return sorted(batches, key=lambda x: x['created_at'], reverse=True)
+
+
+def cancel_batch(batch_id):
+    """Cancel the pending cells of a batch and the jobs already submitted"""
+    with _lock:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            raise KeyError(batch_id)
+
+        batch.cancelled = True
+        job_ids = []
+        for cell in batch.cells:
+            if cell['status'] == STATUS_PENDING:
+                cell['status'] = STATUS_CANCELLED
+            elif cell['status'] not in FINISHED_STATUSES:
+                job_ids.append(cell['job_id'])
+        _mark_finished(batch)
+
+    for job_id in job_ids:
+        try:
+            cancel_job(job_id)
+        except KeyError:
+            pass
+
+    return get_batch(batch_id)
+
+
+def _fill(batch):
+    """Submit pending cells while the batch is under its concurrency limit"""
+    while True:
+        with _lock:
+            active = sum(1 for cell in batch.cells if cell['status'] not in FINISHED_STATUSES | {STATUS_PENDING})
+            pending = [cell for cell in batch.cells if cell['status'] == STATUS_PENDING]
+            if batch.cancelled or not pending or active >= batch.max_parallel:
+                _mark_finished(batch)
+                return
+            cell = pending[0]
+            # Reserve the cell before submitting outside of the lock
+            cell['status'] = 'queued'
+
+        try:
+            job = submit_job(
+                binary_name=cell['binary_name'],
+                algorithm=None,
+                file_path=cell['file_path'],
+                cost_type=cell['cost_type'],
+                num_threads=batch.num_threads,
+                verbose=batch.verbose,
+                force=batch.force,
+                on_finish=lambda job, batch=batch, cell=cell: _on_job_finished(batch, cell, job)
+            )
+            with _lock:
+                cell['job_id'] = job['job_id']
+                if cell['status'] not in FINISHED_STATUSES:
+                    cell['status'] = job['status']
+                cancelled = batch.cancelled
+            if cancelled:
+                # The batch was cancelled while this cell was being submitted
+                cancel_job(job['job_id'])
+        except Exception as e:
+            with _lock:
+                cell['status'] = 'failed'
+                cell['error'] = str(e)
+
+
+def _on_job_finished(batch, cell, job):
+    """Record the outcome of a cell's job and submit the next cells"""
+    result = job.get('result') or {}
+    with _lock:
+        cell['job_id'] = job['job_id']
+        cell['status'] = job['status']
+        cell['error'] = job.get('error')
+        cell['result_id'] = result.get('result_id')
+        cell['execution_time'] = result.get('execution_time')
+        cell['return_code'] = result.get('return_code')
+        cell['cache'] = result.get('cache')
+
+    _fill(batch)
+
+
+def _mark_finished(batch):
+    """Set finished_at once every cell is finished (lock must be held)"""
+    if batch.finished_at is None and batch.is_finished():
+        batch.finished_at = datetime.now().isoformat()
+
+
+def _summarize(cells):
+    """Execution time and return code summary per binary and cost type"""
+    groups = {}
+    for cell in cells:
+        key = (cell['binary_name'], cell['cost_type'])
+        groups.setdefault(key, []).append(cell)
+
+    summary = []
+    for (binary_name, cost_type), group in sorted(groups.items()):
+        times = [cell['execution_time'] for cell in group if cell['execution_time'] is not None]
+        return_codes = {}
+        for cell in group:
+            if cell['return_code'] is not None:
+                code = str(cell['return_code'])
+                return_codes[code] = return_codes.get(code, 0) + 1
+
+        summary.append({
+            'binary_name': binary_name,
+            'cost_type': cost_type,
+            'cells': len(group),
+            'done': sum(1 for cell in group if cell['status'] == 'done'),
+            'failed': sum(1 for cell in group if cell['status'] == 'failed'),
+            'total_time': sum(times) if times else None,
+            'mean_time': statistics.mean(times) if times else None,
+            'median_time': statistics.median(times) if times else None,
+            'min_time': min(times) if times else None,
+            'max_time': max(times) if times else None,
+            'return_codes': return_codes
+        })
+
+    return summary
+
+
+def _prune_finished_batches():
+    """Forget the oldest finished batches beyond MAX_FINISHED_BATCHES (lock must be held)"""
+    finished = [batch for batch in _batches.values() if batch.finished_at is not None]
+    excess = len(finished) - MAX_FINISHED_BATCHES
+    if excess > 0:
+        finished.sort(key=lambda x: x.finished_at)
+        for batch in finished[:excess]:
+            del _batches[batch.id]
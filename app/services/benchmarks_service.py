@@ -0,0 +1,500 @@
+"""
+Benchmark service
+Runs binaries repeatedly over a sequence suite and compares them against stored baselines
+"""
+
+import csv
+import io
+import json
+import math
+import re
+import statistics
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from app.config import (BENCHMARKS_DIR, BENCHMARK_REPETITIONS, BENCHMARK_WARMUP, BENCHMARK_MAX_RUNS,
+                        BENCHMARK_REGRESSION_THRESHOLD, BENCHMARK_RUN_TIMEOUT, MAX_FINISHED_BENCHMARKS,
+                        LOCAL_EXECUTION)
+from app.services.batches_service import resolve_dataset_files
+from app.services.binaries_service import get_binary_path
+from app.services.jobs_service import submit_job, cancel_job, STATUS_DONE as JOB_STATUS_DONE
+
+# Create benchmarks directory if it doesn't exist
+BASELINES_DIR = BENCHMARKS_DIR / 'baselines'
+BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+
+# Benchmark states
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+
+# Score line printed by the binaries, e.g. "Score: 1234"
+SCORE_PATTERN = re.compile(r'score\s*[:=]\s*(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+BASELINE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+METRICS = ['wall_time', 'cpu_time', 'max_rss_kb']
+
+SUMMARY_FIELDS = [
+    'binary_name', 'file', 'runs', 'failed',
+    'wall_time_median', 'wall_time_iqr', 'cpu_time_median', 'cpu_time_iqr', 'max_rss_kb_median',
+    'max_rss_kb_iqr', 'score', 'score_consistent', 'speedup', 'baseline_wall_time', 'baseline_max_rss_kb',
+    'wall_time_change', 'max_rss_change', 'regression'
+]
+RUN_FIELDS = [
+    'binary_name', 'file', 'repetition', 'job_id', 'result_id', 'status', 'return_code', 'wall_time',
+    'cpu_time', 'max_rss_kb', 'score', 'error'
+]
+
+_benchmarks = {}
+_lock = threading.Lock()
+
+
+class Benchmark:
+    """A benchmark over a suite of files, executed one measurement at a time"""
+
+    def __init__(self, binaries, files, cost_type, num_threads, repetitions, warmup, baseline):
+        self.id = uuid.uuid4().hex
+        self.binaries = binaries
+        self.files = files
+        self.cost_type = cost_type
+        self.num_threads = num_threads
+        self.repetitions = repetitions
+        self.warmup = warmup
+        self.baseline = baseline
+        self.runs = []
+        self.status = STATUS_RUNNING
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.current_job_id = None
+        self.cancelled = False
+
+    def to_dict(self, include_runs=True):
+        """Serializable view of the benchmark with its summary"""
+        benchmark = {
+            'benchmark_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'binaries': self.binaries,
+            'files': [str(file_path) for file_path in self.files],
+            'cost_type': self.cost_type,
+            'num_threads': self.num_threads,
+            'repetitions': self.repetitions,
+            'warmup': self.warmup,
+            'baseline': self.baseline,
+            'progress': {
+                'total': len(self.binaries) * len(self.files) * self.repetitions,
+                'completed': len(self.runs)
+            },
+            'summary': summarize_runs(self.runs, self.binaries, self.baseline)
+        }
+        benchmark['speedups'] = speedup_by_binary(benchmark['summary'])
+        benchmark['regressions'] = sum(1 for row in benchmark['summary'] if row['regression'])
+        if include_runs:
+            benchmark['runs'] = [dict(run) for run in self.runs]
+        return benchmark
+
+
+def create_benchmark(binaries, source=None, category=None, files=None, cost_type='PAM250', num_threads=None,
+                     repetitions=BENCHMARK_REPETITIONS, warmup=BENCHMARK_WARMUP, baseline=None):
+    """
+    Validate a benchmark request and start running it in the background
+    The first binary is the reference speedups are computed against
+    Returns the benchmark as a dict
+    """
+    if not binaries:
+        raise ValueError('At least one binary must be provided')
+    if not LOCAL_EXECUTION:
+        raise ValueError('Benchmarks need LOCAL_EXECUTION: their exclusive runs never go to workers')
+    if repetitions < 1:
+        raise ValueError('repetitions must be positive')
+    if warmup < 0:
+        raise ValueError('warmup must not be negative')
+    if baseline is not None:
+        load_baseline(baseline)
+
+    for binary_name in binaries:
+        get_binary_path(binary_name=binary_name)
+
+    file_paths = resolve_dataset_files(source=source, category=category, files=files)
+    if not file_paths:
+        raise ValueError('No sequence files selected')
+
+    num_runs = len(file_paths) * len(binaries) * (repetitions + warmup)
+    if num_runs > BENCHMARK_MAX_RUNS:
+        raise ValueError(f'Benchmark needs {num_runs} runs, the limit is {BENCHMARK_MAX_RUNS}')
+
+    benchmark = Benchmark(list(binaries), file_paths, cost_type, num_threads, repetitions, warmup, baseline)
+    with _lock:
+        _benchmarks[benchmark.id] = benchmark
+        _prune_finished_benchmarks()
+
+    threading.Thread(target=_execute, args=(benchmark,), daemon=True).start()
+    return get_benchmark(benchmark.id)
+
+
+def get_benchmark(benchmark_id):
+    """Get the state of a running benchmark, or the stored report of a finished one"""
+    with _lock:
+        benchmark = _benchmarks.get(benchmark_id)
+        if benchmark is not None:
+            return benchmark.to_dict()
+
+    report_file = _report_path(benchmark_id)
+    if not report_file.exists():
+        raise KeyError(benchmark_id)
+    with open(report_file, 'r') as f:
+        return json.load(f)
+
+
+def list_benchmarks():
+    """List running and stored benchmarks without their runs, newest first"""
+    benchmarks = {}
+    for report_file in BENCHMARKS_DIR.glob('*.json'):
+        try:
+            with open(report_file, 'r') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        report.pop('runs', None)
+        benchmarks[report['benchmark_id']] = report
+
+    with _lock:
+        for benchmark in _benchmarks.values():
+            benchmarks[benchmark.id] = benchmark.to_dict(include_runs=False)
+
+    return sorted(benchmarks.values(), key=lambda x: x['created_at'], reverse=True)
+
+
+def cancel_benchmark(benchmark_id):
+    """Stop a running benchmark after cancelling its current measurement"""
+    with _lock:
+        benchmark = _benchmarks.get(benchmark_id)
+        if benchmark is None:
+            raise KeyError(benchmark_id)
+        benchmark.cancelled = True
+        job_id = benchmark.current_job_id
+
+    if job_id is not None:
+        try:
+            cancel_job(job_id)
+        except KeyError:
+            pass
+
+    return get_benchmark(benchmark_id)
+
+
+def export_benchmark(benchmark_id, export_format='json', table='summary'):
+    """
+    Export the summary or the individual runs of a benchmark
+    Returns (content, mimetype)
+    """
+    if table not in ('summary', 'runs'):
+        raise ValueError(f'Invalid table: {table}')
+    if export_format not in ('json', 'csv'):
+        raise ValueError(f'Invalid format: {export_format}')
+
+    benchmark = get_benchmark(benchmark_id)
+    rows = benchmark[table]
+
+    if export_format == 'json':
+        return json.dumps(rows, indent=2), 'application/json'
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=SUMMARY_FIELDS if table == 'summary' else RUN_FIELDS,
+                            extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue(), 'text/csv'
+
+
+def save_baseline(benchmark_id, name):
+    """Store the medians of a finished benchmark as a named baseline"""
+    if not BASELINE_NAME_PATTERN.match(name or ''):
+        raise ValueError('Invalid baseline name')
+
+    benchmark = get_benchmark(benchmark_id)
+    if benchmark['status'] == STATUS_RUNNING:
+        raise ValueError('Benchmark is still running')
+
+    baseline = {
+        'name': name,
+        'benchmark_id': benchmark_id,
+        'created_at': datetime.now().isoformat(),
+        'cost_type': benchmark['cost_type'],
+        'num_threads': benchmark['num_threads'],
+        'entries': [
+            {
+                'binary_name': row['binary_name'],
+                'file': row['file'],
+                'wall_time': row['wall_time_median'],
+                'cpu_time': row['cpu_time_median'],
+                'max_rss_kb': row['max_rss_kb_median'],
+                'score': row['score']
+            }
+            for row in benchmark['summary'] if row['wall_time_median'] is not None
+        ]
+    }
+
+    with open(BASELINES_DIR / f'{name}.json', 'w') as f:
+        json.dump(baseline, f, indent=2)
+    return baseline
+
+
+def load_baseline(name):
+    """Load a stored baseline"""
+    baseline_file = BASELINES_DIR / f'{name}.json'
+    if not BASELINE_NAME_PATTERN.match(name or '') or not baseline_file.exists():
+        raise FileNotFoundError(f'Baseline not found: {name}')
+    with open(baseline_file, 'r') as f:
+        return json.load(f)
+
+
+def list_baselines():
+    """Names and creation dates of the stored baselines"""
+    baselines = []
+    for baseline_file in sorted(BASELINES_DIR.glob('*.json')):
+        try:
+            with open(baseline_file, 'r') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError):
+            continue
+        baselines.append({
+            'name': baseline['name'],
+            'benchmark_id': baseline.get('benchmark_id'),
+            'created_at': baseline.get('created_at'),
+            'entries': len(baseline.get('entries', []))
+        })
+    return baselines
+
+
+def parse_score(stdout):
+    """Alignment score printed by a binary, or None"""
+    matches = SCORE_PATTERN.findall(stdout or '')
+    return float(matches[-1]) if matches else None
+
+
+def _execute(benchmark):
+    """Run every measurement of a benchmark in turn, each one as an exclusive job"""
+    try:
+        for file_path in benchmark.files:
+            for binary_name in benchmark.binaries:
+                for repetition in range(-benchmark.warmup, benchmark.repetitions):
+                    if benchmark.cancelled:
+                        return
+
+                    run = measure_run(
+                        binary_name, file_path, benchmark.cost_type, benchmark.num_threads,
+                        on_submit=lambda job_id: _set_current_job(benchmark, job_id)
+                    )
+                    # Warmup runs only bring CPU and page caches to a steady state
+                    if repetition >= 0:
+                        run['repetition'] = repetition + 1
+                        with _lock:
+                            benchmark.runs.append(run)
+    finally:
+        _finish(benchmark)
+
+
+def measure_run(binary_name, file_path, cost_type, num_threads, on_submit=None, timeout=BENCHMARK_RUN_TIMEOUT):
+    """
+    Run one exclusive, uncached alignment and wait for its measurements
+    on_submit, if given, is called with the job id once it is queued; a job
+    without a result after timeout seconds is cancelled and the run failed
+    Returns the run's status, result id, wall time, CPU time, peak RSS and score
+    """
+    finished = threading.Event()
+    outcome = {}
+
+    def on_finish(job):
+        outcome.update(job)
+        finished.set()
+
+    run = {
+        'binary_name': binary_name,
+        'file': Path(file_path).name,
+        'file_path': str(file_path),
+        'num_threads': num_threads,
+        'job_id': None,
+        'result_id': None,
+        'status': None,
+        'return_code': None,
+        'wall_time': None,
+        'cpu_time': None,
+        'max_rss_kb': None,
+        'score': None,
+        'error': None
+    }
+
+    try:
+        job = submit_job(
+            binary_name=binary_name,
+            algorithm=None,
+            file_path=str(file_path),
+            cost_type=cost_type,
+            num_threads=num_threads,
+            force=True,
+            exclusive=True,
+            on_finish=on_finish
+        )
+    except Exception as e:
+        run['status'] = 'failed'
+        run['error'] = str(e)
+        return run
+
+    if on_submit:
+        on_submit(job['job_id'])
+    if not finished.wait(timeout):
+        try:
+            cancel_job(job['job_id'])
+        except KeyError:
+            pass
+        run.update({'job_id': job['job_id'], 'status': 'failed', 'error': f'No result after {timeout} seconds'})
+        return run
+
+    result = outcome.get('result') or {}
+    resources = result.get('resources') or {}
+    run.update({
+        'job_id': job['job_id'],
+        'result_id': result.get('result_id'),
+        'status': outcome.get('status'),
+        'return_code': result.get('return_code'),
+        'wall_time': result.get('execution_time'),
+        'cpu_time': resources.get('cpu_time'),
+        'max_rss_kb': resources.get('max_rss_kb'),
+        'score': parse_score(result.get('stdout')),
+        'error': outcome.get('error')
+    })
+    return run
+
+
+def _set_current_job(benchmark, job_id):
+    """Remember the job being measured so the benchmark can be cancelled"""
+    with _lock:
+        benchmark.current_job_id = job_id
+
+
+def _finish(benchmark):
+    """Mark a benchmark as finished and store its report"""
+    with _lock:
+        benchmark.status = STATUS_CANCELLED if benchmark.cancelled else STATUS_DONE
+        benchmark.finished_at = datetime.now().isoformat()
+        benchmark.current_job_id = None
+        report = benchmark.to_dict()
+
+    with open(_report_path(benchmark.id), 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def summarize_runs(runs, binaries, baseline_name=None):
+    """
+    Median and IQR of each metric per binary and file, the speedup of each
+    binary over the first one, and the change against a baseline
+    """
+    groups = {}
+    for run in runs:
+        groups.setdefault((run['binary_name'], run['file']), []).append(run)
+
+    baseline = {}
+    if baseline_name is not None:
+        try:
+            for entry in load_baseline(baseline_name)['entries']:
+                baseline[(entry['binary_name'], entry['file'])] = entry
+        except FileNotFoundError:
+            pass
+
+    summary = []
+    for (binary_name, file_name), group in groups.items():
+        ok = [run for run in group if run['status'] == JOB_STATUS_DONE and run['return_code'] == 0]
+        row = {'binary_name': binary_name, 'file': file_name, 'runs': len(group), 'failed': len(group) - len(ok)}
+        for metric in METRICS:
+            values = [run[metric] for run in ok if run[metric] is not None]
+            row[f'{metric}_median'] = statistics.median(values) if values else None
+            row[f'{metric}_iqr'] = iqr(values)
+
+        # Every repetition must find the same optimal alignment
+        scores = [run['score'] for run in ok if run['score'] is not None]
+        row['score'] = statistics.median(scores) if scores else None
+        row['score_consistent'] = len(set(scores)) <= 1
+
+        row.update(_compare_to_baseline(row, baseline.get((binary_name, file_name))))
+        summary.append(row)
+
+    # Speedup of every binary over the reference binary on the same file
+    reference = {
+        row['file']: row['wall_time_median'] for row in summary if binaries and row['binary_name'] == binaries[0]
+    }
+    for row in summary:
+        reference_time = reference.get(row['file'])
+        row['speedup'] = (
+            reference_time / row['wall_time_median']
+            if reference_time and row['wall_time_median'] else None
+        )
+
+    order = {binary_name: position for position, binary_name in enumerate(binaries)}
+    summary.sort(key=lambda x: (x['file'], order.get(x['binary_name'], len(order))))
+    return summary
+
+
+def speedup_by_binary(summary):
+    """Geometric mean speedup of each binary over all files of a summary"""
+    speedups = {}
+    for row in summary:
+        if row['speedup']:
+            speedups.setdefault(row['binary_name'], []).append(row['speedup'])
+    return {
+        binary_name: math.exp(statistics.mean(math.log(value) for value in values))
+        for binary_name, values in speedups.items()
+    }
+
+
+def _compare_to_baseline(row, entry):
+    """Relative change of the medians against a baseline entry and the regression flag"""
+    comparison = {
+        'baseline_wall_time': None,
+        'baseline_max_rss_kb': None,
+        'wall_time_change': None,
+        'max_rss_change': None,
+        'regression': False
+    }
+    if entry is None:
+        return comparison
+
+    comparison['baseline_wall_time'] = entry.get('wall_time')
+    comparison['baseline_max_rss_kb'] = entry.get('max_rss_kb')
+    if entry.get('wall_time') and row['wall_time_median'] is not None:
+        comparison['wall_time_change'] = row['wall_time_median'] / entry['wall_time'] - 1
+    if entry.get('max_rss_kb') and row['max_rss_kb_median'] is not None:
+        comparison['max_rss_change'] = row['max_rss_kb_median'] / entry['max_rss_kb'] - 1
+
+    comparison['regression'] = any(
+        change is not None and change > BENCHMARK_REGRESSION_THRESHOLD
+        for change in (comparison['wall_time_change'], comparison['max_rss_change'])
+    ) or (entry.get('score') is not None and row['score'] is not None and row['score'] != entry['score'])
+    return comparison
+
+
+def iqr(values):
+    """Interquartile range of a list of values"""
+    if len(values) < 2:
+        return 0.0 if values else None
+    q1, _, q3 = statistics.quantiles(values, n=4, method='inclusive')
+    return q3 - q1
+
+
+def _report_path(benchmark_id):
+    """Path of the stored report of a benchmark"""
+    if not re.fullmatch(r'[0-9a-f]{32}', benchmark_id):
+        raise KeyError(benchmark_id)
+    return BENCHMARKS_DIR / f'{benchmark_id}.json'
+
+
+def _prune_finished_benchmarks():
+    """Forget the oldest finished benchmarks kept in memory, their reports stay on disk (lock must be held)"""
+    finished = [benchmark for benchmark in _benchmarks.values() if benchmark.finished_at is not None]
+    excess = len(finished) - MAX_FINISHED_BENCHMARKS
+    if excess > 0:
+        finished.sort(key=lambda x: x.finished_at)
+        for benchmark in finished[:excess]:
+            del _benchmarks[benchmark.id]
@@ -1,16 +1,36 @@
 """
 Binary management service
 Handles scanning and validation of executable binaries
+
+Capabilities are probed once per binary and kept in a registry keyed by
+path, modification time and size. A background poller refreshes the
+registry, so request handlers never spawn a probe themselves.
 """
 
+import logging
 import os
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from app.config import BIN_DIR
+from app.config import BIN_DIR, BINARY_POLL_INTERVAL, BINARY_PROBE_WORKERS
+from app.services import metrics_service
+from app.utils.profiling import span
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_initialized = threading.Event()
+_wakeup = threading.Event()
+_watcher = None
 
 
 def check_binary_supports_threads(binary_path):
     """Check if a binary supports the -t/--threads option"""
+    started = time.perf_counter()
     try:
         result = subprocess.run(
             [str(binary_path), '--help'],
@@ -23,41 +43,129 @@ def check_binary_supports_threads(binary_path):
         return '-t' in help_text or '--threads' in help_text
     except:
         return False
+    finally:
+        metrics_service.BINARY_PROBE_DURATION.observe(time.perf_counter() - started, binary=Path(binary_path).name)
+
+
+def _scan_executables():
+    """Return {path: (mtime, size)} for the executables in BIN_DIR"""
+    executables = {}
+
+    if not BIN_DIR.exists():
+        return executables
+
+    for binary_file in BIN_DIR.iterdir():
+        if binary_file.is_file() and os.access(binary_file, os.X_OK):
+            stat = binary_file.stat()
+            executables[str(binary_file)] = (stat.st_mtime_ns, stat.st_size)
+
+    return executables
+
+
+def refresh_registry():
+    """
+    Bring the registry in line with BIN_DIR
+    Only new or modified binaries are probed, in parallel
+    """
+    with _refresh_lock:
+        executables = _scan_executables()
+
+        with _registry_lock:
+            to_probe = [
+                path for path, signature in executables.items()
+                if path not in _registry or _registry[path]['signature'] != signature
+            ]
+
+        probed = {}
+        if to_probe:
+            with ThreadPoolExecutor(max_workers=BINARY_PROBE_WORKERS) as executor:
+                results = executor.map(check_binary_supports_threads, to_probe)
+                probed = dict(zip(to_probe, results))
+
+        with _registry_lock:
+            for path in list(_registry):
+                if path not in executables:
+                    del _registry[path]
+            for path, supports_threads in probed.items():
+                _registry[path] = {
+                    'signature': executables[path],
+                    'supports_threads': supports_threads
+                }
+
+    _initialized.set()
+
+
+def _watch_registry():
+    """Background loop refreshing the registry periodically or when woken up"""
+    while True:
+        try:
+            refresh_registry()
+        except Exception:
+            logger.exception('Refreshing the binary registry failed')
+        finally:
+            # Requests waiting for the first pass get what is known rather than block forever
+            _initialized.set()
+        _wakeup.wait(BINARY_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_registry_watcher():
+    """Start the background registry refresher once per process"""
+    global _watcher
+    with _registry_lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch_registry, daemon=True)
+        _watcher.start()
+
+
+def _get_registry():
+    """Snapshot of the registry, filling it on first use if no watcher is running"""
+    if not _initialized.is_set():
+        with span('probe'):
+            if _watcher is not None:
+                _initialized.wait()
+            else:
+                refresh_registry()
+
+    with _registry_lock:
+        return {path: dict(entry) for path, entry in _registry.items()}
+
+
+def get_registry_version():
+    """Version of the registry for HTTP validators: (token, newest binary modification time in ns)"""
+    registry = _get_registry()
+    token = sorted((path, tuple(entry['signature']), entry['supports_threads']) for path, entry in registry.items())
+    return token, max((entry['signature'][0] for entry in registry.values()), default=0)
 
 
 def get_available_binaries():
-    """Scan bin directory and return available executables"""
+    """Return the available executables grouped by algorithm"""
     binaries = {
         'astar': [],
         'pastar': []
     }
 
-    if not BIN_DIR.exists():
-        return binaries
+    for path, entry in _get_registry().items():
+        binary_file = Path(path)
+        name = binary_file.name
+        supports_threads = entry['supports_threads']
 
-    # Scan for executables
-    for binary_file in BIN_DIR.iterdir():
-        if binary_file.is_file() and os.access(binary_file, os.X_OK):
-            name = binary_file.name
-            
-            # Check if binary supports threads
-            supports_threads = check_binary_supports_threads(binary_file)
-
-            # Categorize by algorithm type
-            if 'astar' in name.lower() and 'pastar' not in name.lower():
-                binaries['astar'].append({
-                    'name': name,
-                    'path': str(binary_file),
-                    'display_name': name.replace('msa_astar_', 'A-Star - ').replace('_', ' ').title(),
-                    'supports_threads': supports_threads
-                })
-            elif 'pastar' in name.lower():
-                binaries['pastar'].append({
-                    'name': name,
-                    'path': str(binary_file),
-                    'display_name': name.replace('msa_pastar_', 'PA-Star - ').replace('_', ' ').title(),
-                    'supports_threads': supports_threads
-                })
+        # Categorize by algorithm type
+        if 'astar' in name.lower() and 'pastar' not in name.lower():
+            binaries['astar'].append({
+                'name': name,
+                'path': str(binary_file),
+                'display_name': name.replace('msa_astar_', 'A-Star - ').replace('_', ' ').title(),
+                'supports_threads': supports_threads
+            })
+        elif 'pastar' in name.lower():
+            binaries['pastar'].append({
+                'name': name,
+                'path': str(binary_file),
+                'display_name': name.replace('msa_pastar_', 'PA-Star - ').replace('_', ' ').title(),
+                'supports_threads': supports_threads
+            })
 
     # Sort by name
     binaries['astar'].sort(key=lambda x: x['name'])
@@ -71,17 +179,23 @@ def get_binary_path(binary_name=None, algorithm=None):
     Get the path and capabilities of a specific binary
     Returns (binary_path, supports_threads)
     """
-    available_binaries = get_available_binaries()
-
     if binary_name:
-        # User specified a specific binary
+        # User specified a specific binary, which must be a file of BIN_DIR
+        if Path(binary_name).name != binary_name or binary_name in ('.', '..'):
+            raise ValueError(f'Invalid binary name: {binary_name}')
         binary_path = BIN_DIR / binary_name
         if not binary_path.exists() or not os.access(binary_path, os.X_OK):
             raise ValueError(f'Binary not found or not executable: {binary_name}')
-        supports_threads = check_binary_supports_threads(binary_path)
-        return binary_path, supports_threads
+
+        entry = _get_registry().get(str(binary_path))
+        if entry is None:
+            # Added since the last refresh: guess from the name until it is probed
+            _wakeup.set()
+            return binary_path, 'pastar' in binary_name.lower()
+        return binary_path, entry['supports_threads']
     elif algorithm:
         # Use default based on algorithm type
+        available_binaries = get_available_binaries()
         if algorithm == 'msa_astar' and available_binaries['astar']:
             binary_info = available_binaries['astar'][0]
             return Path(binary_info['path']), binary_info['supports_threads']
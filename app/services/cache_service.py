@@ -0,0 +1,114 @@
+"""
+Result cache service
+Maps (binary, input, parameters) to previously computed results
+"""
+
+import hashlib
+import json
+import logging
+import time
+from app.config import RESULTS_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES
+from app.services.results_service import delete_result
+from app.utils import db
+from app.utils.filesystem import file_sha256, get_directory_size
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_cache (
+    cache_key TEXT PRIMARY KEY,
+    result_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_result_cache_last_access ON result_cache (last_access);
+"""
+
+
+def compute_cache_key(binary_path, file_path, cost_type, num_threads, verbose):
+    """Content-addressed key of an alignment: same key means same output"""
+    key_data = {
+        'binary': file_sha256(binary_path),
+        'input': file_sha256(file_path),
+        'cost_type': cost_type,
+        'num_threads': num_threads,
+        'verbose': bool(verbose)
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(cache_key):
+    """
+    Return the stored result log for a key, or None on a miss
+    Entries whose result was deleted are dropped
+    """
+    with db.transaction(SCHEMA) as conn:
+        row = conn.execute(
+            'SELECT result_id FROM result_cache WHERE cache_key = ?', (cache_key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        result_id = row['result_id']
+        log_file = RESULTS_DIR / f"{result_id}.log"
+        if not log_file.exists():
+            conn.execute('DELETE FROM result_cache WHERE cache_key = ?', (cache_key,))
+            return None
+
+        conn.execute(
+            'UPDATE result_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?',
+            (time.time(), cache_key)
+        )
+
+    with open(log_file, 'r') as f:
+        log_data = json.load(f)
+    log_data['result_id'] = result_id
+    return log_data
+
+
+def store(cache_key, result_id):
+    """Remember the result of a key and evict old results if over budget"""
+    now = time.time()
+    with db.transaction(SCHEMA) as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO result_cache (cache_key, result_id, created_at, last_access) '
+            'VALUES (?, ?, ?, ?)',
+            (cache_key, result_id, now, now)
+        )
+    evict()
+
+
+def evict():
+    """
+    Delete least recently used cached results until the results directory
+    fits in RESULT_CACHE_MAX_BYTES and RESULT_CACHE_MAX_ENTRIES
+    Returns the ids of the evicted results
+    """
+    evicted = []
+    with db.transaction(SCHEMA) as conn:
+        rows = conn.execute(
+            'SELECT cache_key, result_id FROM result_cache ORDER BY last_access'
+        ).fetchall()
+
+        num_entries = len(rows)
+        total_size = get_directory_size(RESULTS_DIR)
+
+        for row in rows:
+            if total_size <= RESULT_CACHE_MAX_BYTES and num_entries <= RESULT_CACHE_MAX_ENTRIES:
+                break
+
+            result_id = row['result_id']
+            result_files = list(RESULTS_DIR.glob(f"{result_id}.*")) + list(RESULTS_DIR.glob(f"{result_id}_*"))
+            total_size -= sum(path.stat().st_size for path in result_files if path.is_file())
+            try:
+                delete_result(result_id)
+            except FileNotFoundError:
+                pass
+            conn.execute('DELETE FROM result_cache WHERE cache_key = ?', (row['cache_key'],))
+            num_entries -= 1
+            evicted.append(result_id)
+
+    if evicted:
+        logger.info('Result cache evicted %d result(s): %s', len(evicted), ', '.join(evicted))
+    return evicted
@@ -0,0 +1,426 @@
+"""
+Sequence catalog service
+Persistent index of the sequence files and their per-record metadata
+
+Directories are only listed again when their mtime changes, and files are
+only parsed again when their size or mtime changes. A refresh first lists
+the directories, which is all the listings need, then parses the new and
+modified files; until then a file is parsed when it is asked for.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from app.config import SOURCES, MAX_DIRECTORY_DEPTH, CATALOG_REFRESH_INTERVAL
+from app.services import metrics_service
+from app.utils import db
+from app.utils.fasta import iter_fasta_summaries, overall_sequence_type, summarize_composition
+from app.utils.filesystem import file_sha256, is_fasta_file
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 2
+CATALOG_TABLES = ['catalog_dirs', 'catalog_files', 'catalog_records']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_dirs (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_dirs_parent ON catalog_dirs (parent);
+
+CREATE TABLE IF NOT EXISTS catalog_files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    num_sequences INTEGER,
+    min_length INTEGER,
+    max_length INTEGER,
+    total_length INTEGER,
+    sequence_type TEXT,
+    content_hash TEXT,
+    composition TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_files_dir ON catalog_files (dir);
+
+CREATE TABLE IF NOT EXISTS catalog_records (
+    file_path TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    header TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    gaps INTEGER,
+    ambiguous INTEGER,
+    gc_content REAL,
+    counts TEXT,
+    PRIMARY KEY (file_path, idx)
+);
+"""
+
+_refresh_lock = threading.Lock()
+_listed = threading.Event()
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def refresh_catalog():
+    """Bring the catalog in line with the sequence directories, then parse the files not indexed yet"""
+    with _refresh_lock:
+        started = time.perf_counter()
+        _list_sources()
+        _listed.set()
+        _index_pending_files()
+        metrics_service.SEQUENCE_SCAN_DURATION.observe(time.perf_counter() - started, operation='catalog_refresh')
+
+
+def _list_sources():
+    """Bring the directories and files of the catalog in line with the sequence directories, without parsing"""
+    # The catalog is derived data: rebuild it when its layout changes
+    db.ensure_schema_version('catalog', SCHEMA_VERSION, CATALOG_TABLES)
+
+    for source_key, source_info in SOURCES.items():
+        source_path = source_info['path']
+        if source_path.exists():
+            _refresh_directory(source_key, source_path, parent=None, depth=0)
+        else:
+            _forget_directory(source_path)
+
+
+def _refresh_directory(source_key, directory, parent, depth):
+    """Refresh one directory and recurse into its subdirectories"""
+    if depth >= MAX_DIRECTORY_DEPTH:
+        return
+
+    try:
+        mtime_ns = directory.stat().st_mtime_ns
+    except OSError:
+        _forget_directory(directory)
+        return
+
+    with db.transaction(SCHEMA) as conn:
+        row = conn.execute(
+            'SELECT mtime_ns FROM catalog_dirs WHERE path = ?', (str(directory),)
+        ).fetchone()
+        # Listing unchanged: only the subdirectories need to be checked
+        subdirs = [
+            Path(r['path']) for r in conn.execute(
+                'SELECT path FROM catalog_dirs WHERE parent = ?', (str(directory),)
+            )
+        ]
+
+    if row is None or row['mtime_ns'] != mtime_ns:
+        subdirs = _rescan_directory(source_key, directory, parent, mtime_ns)
+
+    for subdir in subdirs:
+        _refresh_directory(source_key, subdir, parent=directory, depth=depth + 1)
+
+
+def _rescan_directory(source_key, directory, parent, mtime_ns):
+    """
+    List a modified directory and update its files, returning its subdirectories
+    New and modified files are only recorded with their size and mtime: they are
+    parsed later, outside of any transaction
+    """
+    try:
+        items = sorted(directory.iterdir())
+    except PermissionError:
+        return []
+
+    subdirs = [item for item in items if item.is_dir()]
+    fasta_files = {}
+    for item in items:
+        if item.is_file() and is_fasta_file(item.name):
+            try:
+                fasta_files[item] = item.stat()
+            except OSError:
+                continue
+
+    with db.transaction(SCHEMA) as conn:
+        # Forget vanished subdirectories and files
+        known_subdirs = {
+            r['path'] for r in conn.execute('SELECT path FROM catalog_dirs WHERE parent = ?', (str(directory),))
+        }
+        for removed in known_subdirs - {str(subdir) for subdir in subdirs}:
+            _forget_directory(Path(removed), conn)
+
+        known_files = {
+            r['path']: (r['size'], r['mtime_ns'])
+            for r in conn.execute('SELECT path, size, mtime_ns FROM catalog_files WHERE dir = ?', (str(directory),))
+        }
+        for removed in set(known_files) - {str(item) for item in fasta_files}:
+            conn.execute('DELETE FROM catalog_files WHERE path = ?', (removed,))
+            conn.execute('DELETE FROM catalog_records WHERE file_path = ?', (removed,))
+
+        # New and modified files are listed with no content (num_sequences NULL) until parsed
+        for file_path, stat in fasta_files.items():
+            if known_files.get(str(file_path)) != (stat.st_size, stat.st_mtime_ns):
+                conn.execute(
+                    'INSERT OR REPLACE INTO catalog_files (path, source, dir, name, size, mtime_ns) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (str(file_path), source_key, str(directory), file_path.name, stat.st_size, stat.st_mtime_ns)
+                )
+                conn.execute('DELETE FROM catalog_records WHERE file_path = ?', (str(file_path),))
+
+        conn.execute(
+            'INSERT OR REPLACE INTO catalog_dirs (path, source, parent, mtime_ns) VALUES (?, ?, ?, ?)',
+            (str(directory), source_key, str(parent) if parent else None, mtime_ns)
+        )
+    return subdirs
+
+
+def _index_pending_files():
+    """Parse the listed files that are not indexed yet, smallest first"""
+    with db.transaction(SCHEMA) as conn:
+        paths = [
+            row['path'] for row in conn.execute(
+                'SELECT path FROM catalog_files WHERE num_sequences IS NULL ORDER BY size'
+            )
+        ]
+    for path in paths:
+        _index_file(Path(path))
+
+
+def _index_file(file_path):
+    """
+    Parse a listed FASTA file, then store its metadata and per-record summary in a transaction of its own
+    Nothing is stored if the file changed since it was listed: the next listing queues it again
+    """
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return
+
+    try:
+        sequences = list(iter_fasta_summaries(file_path))
+        overall_type = overall_sequence_type([seq['type'] for seq in sequences])
+        content_hash = file_sha256(file_path)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        logger.warning('Could not index %s: %s', file_path, e)
+        sequences, overall_type, content_hash = [], 'Unknown', None
+
+    lengths = [seq['length'] for seq in sequences]
+    composition = summarize_composition(sequences, overall_type)
+    with db.transaction(SCHEMA) as conn:
+        updated = conn.execute(
+            'UPDATE catalog_files SET num_sequences = ?, min_length = ?, max_length = ?, total_length = ?, '
+            'sequence_type = ?, content_hash = ?, composition = ? WHERE path = ? AND size = ? AND mtime_ns = ?',
+            (len(sequences), min(lengths, default=0), max(lengths, default=0), sum(lengths), overall_type,
+             content_hash, json.dumps(composition), str(file_path), stat.st_size, stat.st_mtime_ns)
+        ).rowcount
+        if not updated:
+            return
+        conn.execute('DELETE FROM catalog_records WHERE file_path = ?', (str(file_path),))
+        conn.executemany(
+            'INSERT INTO catalog_records (file_path, idx, header, length, type, gaps, ambiguous, gc_content, counts) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (str(file_path), idx, seq['header'], seq['length'], seq['type'], seq['gaps'], seq['ambiguous'],
+                 seq['gc_content'], json.dumps(seq['counts']))
+                for idx, seq in enumerate(sequences)
+            ]
+        )
+
+
+def _forget_directory(directory, conn=None):
+    """Remove a directory and everything below it from the catalog"""
+    if conn is None:
+        with db.transaction(SCHEMA) as conn:
+            return _forget_directory(directory, conn)
+
+    prefix = str(directory).rstrip(os.sep) + os.sep
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    conn.execute(
+        "DELETE FROM catalog_records WHERE file_path IN "
+        "(SELECT path FROM catalog_files WHERE dir = ? OR dir LIKE ? ESCAPE '\\')",
+        (str(directory), pattern)
+    )
+    conn.execute("DELETE FROM catalog_files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (str(directory), pattern))
+    conn.execute("DELETE FROM catalog_dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (str(directory), pattern))
+
+
+def _watch_catalog():
+    """Background loop refreshing the catalog periodically"""
+    while True:
+        try:
+            refresh_catalog()
+        except Exception:
+            logger.exception('Sequence catalog refresh failed')
+            _listed.set()
+        time.sleep(CATALOG_REFRESH_INTERVAL)
+
+
+def start_catalog_watcher():
+    """Start the background catalog refresher once per process; only the leader runs it"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch_catalog, daemon=True)
+        _watcher.start()
+
+
+def _ensure_listed():
+    """
+    Wait for the first listing of the directories when this process runs the watcher
+    Other processes use the catalog the leader's watcher stores, listing the
+    directories here only if it was never filled, e.g. on the first start or in
+    a command; files are then parsed when asked for
+    """
+    if _listed.is_set():
+        return
+    if _watcher is not None:
+        _listed.wait()
+        return
+
+    with db.transaction(SCHEMA) as conn:
+        filled = conn.execute('SELECT 1 FROM catalog_dirs LIMIT 1').fetchone() is not None
+    if not filled:
+        with _refresh_lock:
+            _list_sources()
+    _listed.set()
+
+
+def get_catalog_structure():
+    """
+    Return {source_key: nested directory structure} as built by
+    scan_directory_recursively, read from the catalog
+    """
+    _ensure_listed()
+
+    structures = {}
+    with db.transaction(SCHEMA) as conn:
+        rows = conn.execute('SELECT source, dir, name FROM catalog_files ORDER BY dir, name').fetchall()
+
+    for row in rows:
+        source_path = SOURCES[row['source']]['path'] if row['source'] in SOURCES else None
+        if source_path is None:
+            continue
+
+        node = structures.setdefault(row['source'], {})
+        for part in Path(row['dir']).relative_to(source_path).parts:
+            node = node.setdefault(part, {})
+        node.setdefault('_files', []).append(row['name'])
+
+    return {source_key: _sorted_structure(structure) for source_key, structure in structures.items()}
+
+
+def get_catalog_version():
+    """
+    Version of the catalog for HTTP validators: (token, newest modification time in ns)
+    The token changes whenever a directory or file of the catalog is added, removed or modified
+    """
+    _ensure_listed()
+    with db.transaction(SCHEMA) as conn:
+        # Sums are taken modulo a prime: nanosecond times would overflow them
+        dirs = conn.execute(
+            'SELECT COUNT(*), MAX(mtime_ns), SUM(mtime_ns % 1000000007) FROM catalog_dirs'
+        ).fetchone()
+        files = conn.execute(
+            'SELECT COUNT(*), MAX(mtime_ns), SUM(mtime_ns % 1000000007), SUM(size) FROM catalog_files'
+        ).fetchone()
+    return tuple(dirs) + tuple(files), max(dirs[1] or 0, files[1] or 0)
+
+
+def _sorted_structure(structure):
+    """Order a structure like the directory scan: files first, then subdirectories by name"""
+    ordered = {}
+    if '_files' in structure:
+        ordered['_files'] = structure['_files']
+    for name in sorted(key for key in structure if key != '_files'):
+        ordered[name] = _sorted_structure(structure[name])
+    return ordered
+
+
+def get_file_info(file_path):
+    """
+    Return the catalog entry of a file with its per-record summary,
+    or None if it is not indexed or changed since it was indexed
+    """
+    _ensure_listed()
+
+    file_path = Path(file_path)
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+
+    row = _get_file_row(file_path, stat)
+    if row is None and _relist_file(file_path, stat):
+        # Modified in place: its directory's mtime did not change, so no listing would queue it again
+        row = _get_file_row(file_path, stat)
+    if row is not None and row['num_sequences'] is None:
+        # Listed but not parsed yet: parse it now rather than wait for the refresh to get to it
+        _index_file(file_path)
+        row = _get_file_row(file_path, stat)
+    if row is None or row['num_sequences'] is None:
+        return None
+
+    with db.transaction(SCHEMA) as conn:
+        records = conn.execute(
+            'SELECT header, length, type, gaps, ambiguous, gc_content, counts '
+            'FROM catalog_records WHERE file_path = ? ORDER BY idx',
+            (str(file_path),)
+        ).fetchall()
+
+    info = dict(row)
+    info['composition'] = json.loads(info['composition']) if info['composition'] else None
+    info['sequences'] = []
+    for record in records:
+        record = dict(record)
+        record['counts'] = json.loads(record['counts']) if record['counts'] else {}
+        info['sequences'].append(record)
+    return info
+
+
+def _get_file_row(file_path, stat):
+    """Catalog row of a file, None if it is not listed or changed since"""
+    with db.transaction(SCHEMA) as conn:
+        row = conn.execute('SELECT * FROM catalog_files WHERE path = ?', (str(file_path),)).fetchone()
+    if row is None or (row['size'], row['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return row
+
+
+def _relist_file(file_path, stat):
+    """
+    Record a new size and mtime for a listed file and clear its content until it is parsed again
+    Returns False if the file is not listed
+    """
+    with db.transaction(SCHEMA) as conn:
+        updated = conn.execute(
+            'UPDATE catalog_files SET size = ?, mtime_ns = ?, num_sequences = NULL, min_length = NULL, '
+            'max_length = NULL, total_length = NULL, sequence_type = NULL, content_hash = NULL, composition = NULL '
+            'WHERE path = ?',
+            (stat.st_size, stat.st_mtime_ns, str(file_path))
+        ).rowcount
+        if updated:
+            conn.execute('DELETE FROM catalog_records WHERE file_path = ?', (str(file_path),))
+    return bool(updated)
+
+
+def get_input_features(file_path):
+    """
+    Size features of an input file that the run time and memory of aligning it grow with
+    pair_cells is the number of cells of the pairwise lattices of every pair of
+    sequences, which grows with the product of their lengths
+    """
+    info = get_file_info(file_path)
+    records = info['sequences'] if info is not None else iter_fasta_summaries(file_path)
+    lengths = [record['length'] for record in records]
+
+    sizes = [length + 1 for length in lengths]
+    total = sum(sizes)
+    return {
+        'num_sequences': len(lengths),
+        'total_length': sum(lengths),
+        'max_length': max(lengths, default=0),
+        'pair_cells': (total * total - sum(size * size for size in sizes)) // 2
+    }
@@ -0,0 +1,70 @@
+"""
+Core allocation service
+Keeps track of which CPU cores are reserved by running alignments
+"""
+
+import threading
+from app.utils.system import get_core_budget, get_cgroup_cpu_quota
+
+_cpu_ids, _budget = get_core_budget()
+_allocations = {}
+_lock = threading.Lock()
+
+
+def get_total_cores():
+    """Number of cores alignments may use at the same time"""
+    return _budget
+
+
+def get_free_cores():
+    """Number of cores not reserved by any running job"""
+    with _lock:
+        return _budget - _allocated_count()
+
+
+def try_allocate(job_id, num_cores):
+    """
+    Reserve num_cores for a job
+    Returns the list of CPU ids assigned to it, or None if they do not fit
+    """
+    num_cores = max(1, min(num_cores, _budget))
+
+    with _lock:
+        if _allocated_count() + num_cores > _budget:
+            return None
+
+        # Prefer CPUs that no other job is pinned to
+        used = {cpu for cpus in _allocations.values() for cpu in cpus}
+        free = [cpu for cpu in _cpu_ids if cpu not in used]
+        cpus = free[:num_cores]
+
+        _allocations[job_id] = cpus
+        return cpus
+
+
+def release(job_id):
+    """Return the cores reserved by a job to the pool"""
+    with _lock:
+        _allocations.pop(job_id, None)
+
+
+def get_allocation():
+    """Snapshot of the current core allocation"""
+    with _lock:
+        allocated = _allocated_count()
+        return {
+            'total_cores': _budget,
+            'cpu_ids': list(_cpu_ids),
+            'cgroup_quota': get_cgroup_cpu_quota(),
+            'allocated_cores': allocated,
+            'free_cores': _budget - allocated,
+            'jobs': [
+                {'job_id': job_id, 'cores': len(cpus), 'cpus': cpus}
+                for job_id, cpus in _allocations.items()
+            ]
+        }
+
+
+def _allocated_count():
+    """Number of reserved cores (lock must be held)"""
+    return sum(len(cpus) for cpus in _allocations.values())
@@ -0,0 +1,795 @@
+"""
+Job queue service
+Runs alignments asynchronously on a bounded pool of execution slots
+
+Jobs are persisted at every state change so that a restarted service can
+reattach to alignments still running and run queued jobs again.
+
+Remote workers lease queued jobs over HTTP and keep them with heartbeats;
+a job whose lease expires is queued again for another worker.
+
+Queued jobs start shortest predicted run time first; a job is credited
+QUEUE_AGING_RATE seconds per second it waits so long jobs are not starved,
+and a job with a deadline moves up as its slack runs out.
+"""
+
+import json
+import logging
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from app.config import (MAX_CONCURRENT_JOBS, MAX_FINISHED_JOBS, MAX_EXECUTION_TIMEOUT, PIN_CPU_AFFINITY,
+                        LOCAL_EXECUTION, WORKER_LEASE_TIMEOUT, WORKER_HEARTBEAT_INTERVAL, WORKER_MAX_ATTEMPTS,
+                        WORKER_UPLOADS_DIR, SCHEDULING_POLICY, QUEUE_AGING_RATE, DEFAULT_PREDICTED_RUNTIME)
+from app.services import cores_service, memory_service, metrics_service, predictor_service, profiling_service
+from app.services.binaries_service import get_binary_path
+from app.services.results_service import RESULT_ARTIFACTS
+from app.services.runner_service import (run_alignment, follow_detached_run, abandon_run, record_remote_result,
+                                         clean_scratch, get_cache_key, find_cached_result)
+from app.utils import db
+from app.utils.limits import KILLED_OOM, MEMORY_LIMIT_EXCEEDED
+from app.utils.procstats import get_process_start_time, is_same_process, kill_process
+from app.utils.stream import OutputStream
+
+logger = logging.getLogger(__name__)
+
+# Job states
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+STATUS_KILLED_OOM = KILLED_OOM
+STATUS_MEMORY_LIMIT_EXCEEDED = MEMORY_LIMIT_EXCEEDED
+
+FINISHED_STATUSES = {STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED, STATUS_KILLED_OOM, STATUS_MEMORY_LIMIT_EXCEEDED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    requested_cores INTEGER,
+    memory_estimate INTEGER,
+    exclusive INTEGER NOT NULL DEFAULT 0,
+    submitted_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    result TEXT,
+    error TEXT,
+    pid INTEGER,
+    pid_start_time INTEGER,
+    run TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+"""
+
+_jobs = {}
+_queue = []
+_running = set()
+_lock = threading.Lock()
+_reaper_started = False
+
+
+class LeaseLost(Exception):
+    """The lease of a worker on a job expired or was never granted"""
+
+
+class Job:
+    """A single alignment request and its execution state"""
+
+    def __init__(self, params, requested_cores, memory_estimate, on_finish=None, exclusive=False):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.on_finish = on_finish
+        self.exclusive = exclusive
+        self.requested_cores = requested_cores  # None means 'auto'
+        self.memory_estimate = memory_estimate
+        self.allocated_cpus = None
+        self.status = STATUS_QUEUED
+        self.submitted_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.process = None
+        self.pid = None
+        self.pid_start_time = None
+        self.run = None
+        self.cancel_requested = False
+        self.worker_id = None
+        self.lease_id = None
+        self.lease_expires = None
+        self.attempts = 0
+        self.prediction = None
+        self.output = OutputStream()
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuild a job from its row in the jobs table"""
+        job = cls(json.loads(row['params']), row['requested_cores'], row['memory_estimate'],
+                  exclusive=bool(row['exclusive']))
+        job.id = row['job_id']
+        job.status = row['status']
+        job.submitted_at = row['submitted_at']
+        job.started_at = row['started_at']
+        job.finished_at = row['finished_at']
+        job.result = json.loads(row['result']) if row['result'] else None
+        job.error = row['error']
+        job.pid = row['pid']
+        job.pid_start_time = row['pid_start_time']
+        job.run = json.loads(row['run']) if row['run'] else None
+        if job.status in FINISHED_STATUSES:
+            job.output.close()
+        return job
+
+    @property
+    def deadline(self):
+        """Time (epoch seconds) the job should be finished by, or None"""
+        return self.params.get('deadline')
+
+    @property
+    def queued_since(self):
+        """Time (epoch seconds) the job was submitted"""
+        return datetime.fromisoformat(self.submitted_at).timestamp()
+
+    def to_dict(self):
+        """Serializable view of the job"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'binary_name': self.params.get('binary_name'),
+            'algorithm': self.params.get('algorithm'),
+            'file_path': self.params.get('file_path'),
+            'cost_type': self.params.get('cost_type'),
+            'num_threads': self.params.get('num_threads'),
+            'verbose': self.params.get('verbose'),
+            'exclusive': self.exclusive,
+            'requested_cores': self.requested_cores,
+            'allocated_cores': len(self.allocated_cpus) if self.allocated_cpus else None,
+            'memory_estimate': self.memory_estimate,
+            'prediction': self.prediction,
+            'deadline': datetime.fromtimestamp(self.deadline).isoformat() if self.deadline else None,
+            'worker_id': self.worker_id,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+def submit_job(binary_name, algorithm, file_path, cost_type='PAM250', num_threads=None, verbose=False,
+               force=False, on_finish=None, exclusive=False, deadline=None):
+    """
+    Validate an alignment request and put it on the queue
+    on_finish, if given, is called with the job dict once the job is finished
+    exclusive jobs only run while no other job is running, for undisturbed measurements
+    deadline, in seconds from now, moves the job ahead of others when it would miss it
+    Returns the job as a dict
+    """
+    # Fail fast on requests that could never run
+    if exclusive and not LOCAL_EXECUTION:
+        raise ValueError('Exclusive jobs need LOCAL_EXECUTION: they never go to workers')
+    binary_path, supports_threads = get_binary_path(binary_name=binary_name, algorithm=algorithm)
+    if not Path(file_path).exists():
+        raise FileNotFoundError(f'File not found: {file_path}')
+    if deadline is not None:
+        try:
+            deadline = float(deadline)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid deadline: {deadline}')
+        if deadline <= 0:
+            raise ValueError(f'Invalid deadline: {deadline}')
+        deadline += time.time()
+
+    requested_cores = _requested_cores(supports_threads, num_threads)
+    if supports_threads and num_threads is not None:
+        # The job runs with as many threads as it is charged cores for
+        num_threads = requested_cores
+    params = {
+        'binary_name': binary_name,
+        'algorithm': algorithm,
+        'file_path': file_path,
+        'cost_type': cost_type,
+        'num_threads': num_threads,
+        'verbose': verbose,
+        'force': force,
+        'deadline': deadline
+    }
+
+    # A cached result is returned at once, without queueing behind running jobs or taking their cores
+    if not force:
+        job = _find_cached_job(params, binary_path, supports_threads, requested_cores, on_finish, exclusive)
+        if job is not None:
+            return job
+
+    # Reject inputs that could never fit in memory instead of letting them fail late; only on the
+    # heuristic estimate or a measured peak, the model's extrapolation only orders and reserves
+    prediction = _predict(binary_path, file_path, cost_type, requested_cores)
+    if prediction:
+        memory_estimate, memory_bound = prediction['memory_estimate'], prediction['memory_bound']
+    else:
+        memory_estimate = memory_bound = memory_service.estimate_job_memory(file_path)
+    memory_limit = memory_service.get_job_memory_limit()
+    if memory_limit is not None:
+        if memory_bound > memory_limit:
+            raise ValueError(
+                f'Estimated memory of {memory_bound // 2**20} MiB exceeds the per-job limit of '
+                f'{memory_limit // 2**20} MiB'
+            )
+        # A job is never held back for more than it may use
+        memory_estimate = min(memory_estimate, memory_limit)
+
+    job = Job(params, requested_cores=requested_cores, memory_estimate=memory_estimate, on_finish=on_finish,
+              exclusive=exclusive)
+    job.prediction = prediction
+
+    with _lock:
+        _jobs[job.id] = job
+        _queue.append(job)
+        _save(job)
+        _prune_finished_jobs()
+        snapshot = job.to_dict()
+
+    _dispatch()
+    return snapshot
+
+
+def _find_cached_job(params, binary_path, supports_threads, requested_cores, on_finish, exclusive):
+    """
+    Finish a job from the result cache if a previous run matches it
+    'auto' jobs match a run on all cores or on the cores free right now, what they would get
+    Returns the job as a dict, or None on a miss
+    """
+    if requested_cores is None:
+        thread_counts = sorted({cores_service.get_total_cores(), max(1, cores_service.get_free_cores())},
+                               reverse=True)
+    else:
+        thread_counts = [params['num_threads']]
+
+    for num_threads in thread_counts:
+        cache_key = get_cache_key(binary_path, supports_threads, params['file_path'], params['cost_type'],
+                                  num_threads, params['verbose'])
+        cached = find_cached_result(cache_key)
+        if cached is not None:
+            job = Job({**params, 'num_threads': num_threads}, requested_cores=requested_cores, memory_estimate=None,
+                      on_finish=on_finish, exclusive=exclusive)
+            return _finish_cached(job, cached)
+    return None
+
+
+def _finish_cached(job, result):
+    """Record a job answered from the result cache; it never takes cores or memory"""
+    with _lock:
+        job.status = STATUS_DONE
+        job.result = result
+        job.started_at = job.finished_at = datetime.now().isoformat()
+        _jobs[job.id] = job
+        _save(job)
+        _prune_finished_jobs()
+        snapshot = job.to_dict()
+    job.output.close()
+    metrics_service.JOBS_FINISHED.inc(status=STATUS_DONE)
+
+    _notify_finished(job, snapshot)
+    return snapshot
+
+
+def get_job(job_id):
+    """Get the current state of a job"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job.to_dict()
+
+
+def get_job_output(job_id):
+    """Get the live OutputStream of a job"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job.output
+
+
+def list_jobs():
+    """List all known jobs, newest first"""
+    with _lock:
+        jobs = [job.to_dict() for job in _jobs.values()]
+    return sorted(jobs, key=lambda x: x['submitted_at'], reverse=True)
+
+
+def cancel_job(job_id):
+    """
+    Cancel a queued job or kill the child process of a running one
+    Returns the job as a dict
+    """
+    finished = False
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+
+        if job.status == STATUS_QUEUED:
+            _queue.remove(job)
+            job.status = STATUS_CANCELLED
+            job.finished_at = datetime.now().isoformat()
+            job.output.close()
+            _save(job)
+            finished = True
+        elif job.status == STATUS_RUNNING:
+            job.cancel_requested = True
+            if job.process is not None and job.process.returncode is None:
+                job.process.kill()
+            elif job.process is None and job.pid is not None:
+                # Reattached after a restart: not our child, kill it by pid
+                kill_process(job.pid, job.pid_start_time)
+            # A remote worker learns about the cancellation from its next heartbeat
+
+        snapshot = job.to_dict()
+
+    if finished:
+        metrics_service.JOBS_FINISHED.inc(status=STATUS_CANCELLED)
+        _notify_finished(job, snapshot)
+    return snapshot
+
+
+def _requested_cores(supports_threads, num_threads):
+    """
+    Number of cores a job needs, or None to take whatever is free
+    A-Star binaries without thread support always count as one core
+    """
+    if not supports_threads:
+        return 1
+    if num_threads is None:
+        return None
+
+    try:
+        num_threads = int(num_threads)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid number of threads: {num_threads}')
+    if num_threads < 1:
+        raise ValueError(f'Invalid number of threads: {num_threads}')
+
+    # Never ask for more than the host can give, or the job would never start
+    return min(num_threads, cores_service.get_total_cores())
+
+
+def _predict(binary_path, file_path, cost_type, requested_cores):
+    """Run time and memory prediction of a job, None if the predictor fails"""
+    threads = requested_cores or cores_service.get_total_cores()
+    try:
+        prediction = predictor_service.predict(binary_path.name, file_path, cost_type, threads)
+    except Exception:
+        logger.exception('Predicting the run time of %s failed', file_path)
+        return None
+    # Input features are an implementation detail of the predictor
+    prediction.pop('features', None)
+    return prediction
+
+
+def _queue_order():
+    """Queued jobs in the order they should start (lock must be held)"""
+    if SCHEDULING_POLICY == 'fifo':
+        return list(_queue)
+    now = time.time()
+    return sorted(_queue, key=lambda job: _priority(job, now))
+
+
+def _priority(job, now):
+    """
+    Rank of a queued job in seconds, lowest first: its predicted run time less
+    QUEUE_AGING_RATE per second it has waited, or its slack if it has a
+    deadline and that is lower
+    """
+    runtime = (job.prediction or {}).get('wall_time') or DEFAULT_PREDICTED_RUNTIME
+    priority = runtime - QUEUE_AGING_RATE * (now - job.queued_since)
+    if job.deadline is not None:
+        priority = min(priority, job.deadline - now - runtime)
+    return priority
+
+
+def _dispatch():
+    """Start queued jobs whose requested cores and memory fit in what is free"""
+    if not LOCAL_EXECUTION:
+        return
+    with _lock:
+        for job in _queue_order():
+            if len(_running) >= MAX_CONCURRENT_JOBS or any(_jobs[job_id].exclusive for job_id in _running):
+                break
+            if job.exclusive and _running:
+                # Hold later jobs back so the machine drains for the exclusive job
+                break
+
+            num_cores = job.requested_cores or max(1, cores_service.get_free_cores())
+            cpus = cores_service.try_allocate(job.id, num_cores)
+            if cpus is None:
+                continue
+            if not memory_service.try_reserve(job.id, job.memory_estimate):
+                cores_service.release(job.id)
+                continue
+
+            _queue.remove(job)
+            job.allocated_cpus = cpus
+            job.status = STATUS_RUNNING
+            job.started_at = datetime.now().isoformat()
+            _running.add(job.id)
+            _save(job)
+            threading.Thread(target=_execute, args=(job,), daemon=True).start()
+
+
+def _attach_process(job, process, run):
+    """Remember the child process so the job can be cancelled and reattached after a restart"""
+    with _lock:
+        job.process = process
+        job.pid = process.pid
+        job.pid_start_time = get_process_start_time(process.pid)
+        job.run = run
+        _save(job)
+        if job.cancel_requested:
+            process.kill()
+
+
+def _execute(job):
+    """Run a job on the current thread and record its outcome"""
+    status = STATUS_DONE
+    result = None
+    error = None
+
+    params = dict(job.params)
+    params.pop('deadline', None)
+    # Run with exactly the cores reserved at dispatch time: resolves 'auto' and keeps a
+    # request beyond the host's cores from oversubscribing them
+    params['num_threads'] = len(job.allocated_cpus)
+
+    try:
+        with profiling_service.profile_job(job.id):
+            result = run_alignment(
+                on_start=lambda process, run: _attach_process(job, process, run),
+                cpu_set=job.allocated_cpus if PIN_CPU_AFFINITY else None,
+                output_stream=job.output,
+                memory_limit=memory_service.get_job_memory_cap(job.memory_estimate),
+                **params
+            )
+        if result.get('termination'):
+            status = result['termination']
+            error = f"Alignment exceeded its memory limit ({result['termination']})"
+    except subprocess.TimeoutExpired:
+        status = STATUS_FAILED
+        error = f'Execution timeout ({MAX_EXECUTION_TIMEOUT // 60} minutes)'
+    except Exception as e:
+        status = STATUS_FAILED
+        error = str(e)
+
+    _finish(job, status, result, error)
+
+
+def _follow(job):
+    """Wait for the alignment of a job started before a restart and record its outcome"""
+    status = STATUS_DONE
+    result = None
+    error = None
+
+    try:
+        if not is_same_process(job.pid, job.pid_start_time) and not Path(job.run['output_file']).exists():
+            result = abandon_run(job.run)
+            status = STATUS_FAILED
+            error = 'Alignment was interrupted by a restart of the service'
+        else:
+            result = follow_detached_run(job.run, job.pid, job.pid_start_time, output_stream=job.output)
+            if not Path(result['output_file']).exists():
+                status = STATUS_FAILED
+                error = 'Alignment ended without output while the service was restarting'
+    except subprocess.TimeoutExpired:
+        status = STATUS_FAILED
+        error = f'Execution timeout ({MAX_EXECUTION_TIMEOUT // 60} minutes)'
+    except Exception as e:
+        status = STATUS_FAILED
+        error = str(e)
+
+    _finish(job, status, result, error)
+
+
+def _finish(job, status, result, error):
+    """Record the outcome of a job, free its resources and start the next jobs"""
+    with _lock:
+        if job.cancel_requested:
+            status = STATUS_CANCELLED
+        job.status = status
+        job.result = result
+        job.error = error
+        job.process = None
+        job.finished_at = datetime.now().isoformat()
+        _running.discard(job.id)
+        cores_service.release(job.id)
+        memory_service.release(job.id)
+        _save(job)
+        snapshot = job.to_dict()
+    job.output.close()
+    metrics_service.JOBS_FINISHED.inc(status=status)
+
+    _notify_finished(job, snapshot)
+    _dispatch()
+
+
+def lease_job(worker_id, binaries):
+    """
+    Hand the first queued job one of the worker's binaries can run to a remote worker
+    Exclusive jobs are measurements of this host and are never leased
+    Returns the lease, or None if there is nothing to do
+    """
+    _start_lease_reaper()
+    expire_leases()
+
+    with _lock:
+        for job in _queue_order():
+            if job.exclusive:
+                continue
+            try:
+                binary_path, _ = get_binary_path(binary_name=job.params['binary_name'],
+                                                 algorithm=job.params['algorithm'])
+            except ValueError:
+                continue
+            if binary_path.name not in binaries:
+                continue
+
+            _queue.remove(job)
+            job.status = STATUS_RUNNING
+            job.started_at = datetime.now().isoformat()
+            job.worker_id = worker_id
+            job.lease_id = uuid.uuid4().hex
+            job.lease_expires = time.time() + WORKER_LEASE_TIMEOUT
+            _save(job)
+            logger.info('Job %s leased to worker %s', job.id, worker_id)
+            return {
+                'job_id': job.id,
+                'lease_id': job.lease_id,
+                'binary': binary_path.name,
+                'file_name': Path(job.params['file_path']).name,
+                'cost_type': job.params['cost_type'],
+                'num_threads': job.params['num_threads'],
+                'verbose': job.params['verbose'],
+                'memory_estimate': job.memory_estimate,
+                'lease_timeout': WORKER_LEASE_TIMEOUT,
+                'heartbeat_interval': WORKER_HEARTBEAT_INTERVAL
+            }
+    return None
+
+
+def heartbeat_job(job_id, lease_id):
+    """Extend the lease of a worker on a job; tells it whether to stop"""
+    with _lock:
+        job = _get_leased_job(job_id, lease_id)
+        job.lease_expires = time.time() + WORKER_LEASE_TIMEOUT
+        return {'cancel': job.cancel_requested, 'lease_timeout': WORKER_LEASE_TIMEOUT}
+
+
+def get_leased_input(job_id, lease_id):
+    """Path of the input file of a leased job"""
+    with _lock:
+        job = _get_leased_job(job_id, lease_id)
+        return Path(job.params['file_path'])
+
+
+def get_upload_path(job_id, lease_id, name):
+    """Path where a worker's upload of a run artifact of a leased job is staged"""
+    if name not in RESULT_ARTIFACTS:
+        raise ValueError(f'Unknown artifact: {name}')
+    with _lock:
+        _get_leased_job(job_id, lease_id)
+    upload_dir = WORKER_UPLOADS_DIR / lease_id
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir / name
+
+
+def complete_job(job_id, lease_id, log_content=None, error=None):
+    """
+    Record the outcome a worker reports for its leased job
+    log_content is the log of the run as built by the worker, error a
+    failure to run it at all; uploaded artifacts are moved into the results
+    Returns the job as a dict
+    """
+    with _lock:
+        job = _get_leased_job(job_id, lease_id)
+        # Claimed: a late heartbeat or the reaper no longer touch the job
+        job.lease_id = None
+
+    upload_dir = WORKER_UPLOADS_DIR / lease_id
+    status = STATUS_DONE
+    result = None
+    try:
+        if log_content is not None:
+            artifacts = {name: upload_dir / name for name in RESULT_ARTIFACTS if (upload_dir / name).exists()}
+            # Never trust the worker with names that end up in paths: the job says what was run
+            binary_path, _ = get_binary_path(binary_name=job.params['binary_name'],
+                                             algorithm=job.params['algorithm'])
+            result = record_remote_result(log_content, artifacts, binary_path.name, job.params['file_path'],
+                                          job.params['cost_type'], job.worker_id)
+            if result.get('termination'):
+                status = result['termination']
+                error = f"Alignment exceeded its memory limit ({result['termination']})"
+        else:
+            status = STATUS_FAILED
+            error = error or 'Worker reported no result'
+    except Exception as e:
+        status = STATUS_FAILED
+        error = str(e)
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    _finish(job, status, result, error)
+    return get_job(job_id)
+
+
+def expire_leases():
+    """
+    Queue again the jobs whose worker stopped sending heartbeats
+    A job that lost WORKER_MAX_ATTEMPTS workers is failed instead
+    Returns the number of expired leases
+    """
+    now = time.time()
+    expired = []
+    finished = []
+    with _lock:
+        for job in _jobs.values():
+            if job.lease_id is None or job.lease_expires > now:
+                continue
+            logger.warning('Lease of worker %s on job %s expired', job.worker_id, job.id)
+            shutil.rmtree(WORKER_UPLOADS_DIR / job.lease_id, ignore_errors=True)
+            expired.append(job)
+            job.lease_id = None
+            job.attempts += 1
+            if job.cancel_requested:
+                finished.append((job, None))
+            elif job.attempts >= WORKER_MAX_ATTEMPTS:
+                finished.append((job, f'Lost {job.attempts} workers while running the job'))
+            else:
+                job.status = STATUS_QUEUED
+                job.started_at = None
+                job.worker_id = None
+                _queue.insert(0, job)
+                _save(job)
+
+    for job, error in finished:
+        _finish(job, STATUS_FAILED, None, error)
+    if expired:
+        _dispatch()
+    return len(expired)
+
+
+def _get_leased_job(job_id, lease_id):
+    """The job a worker holds with lease_id (lock must be held)"""
+    job = _jobs.get(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if job.lease_id is None or job.lease_id != lease_id:
+        raise LeaseLost(f'Lease on job {job_id} was lost')
+    return job
+
+
+def _start_lease_reaper():
+    """Start the thread expiring the leases of lost workers, once"""
+    global _reaper_started
+    with _lock:
+        if _reaper_started:
+            return
+        _reaper_started = True
+
+    def reap():
+        while True:
+            time.sleep(WORKER_HEARTBEAT_INTERVAL)
+            try:
+                expire_leases()
+            except Exception:
+                logger.exception('Expiring worker leases failed')
+
+    threading.Thread(target=reap, daemon=True).start()
+
+
+def recover_jobs():
+    """
+    Reload the jobs persisted by a previous process of the service
+    Running jobs are reattached to their alignment if it is still alive (or
+    recorded if it finished meanwhile), the others are marked failed and
+    their partial output removed; queued jobs are queued again
+    Returns the number of reattached and re-queued jobs
+    """
+    with db.transaction(SCHEMA) as conn:
+        rows = conn.execute('SELECT * FROM jobs ORDER BY submitted_at').fetchall()
+
+    followed = []
+    requeued = []
+    with _lock:
+        for row in rows:
+            if row['job_id'] in _jobs:
+                continue
+            job = Job.from_row(row)
+            _jobs[job.id] = job
+
+            if job.status == STATUS_RUNNING and job.run is not None:
+                # Account for the alignment while it is followed, even if it no longer fits the budget
+                job.allocated_cpus = cores_service.try_allocate(job.id, job.requested_cores or 1) or []
+                memory_service.try_reserve(job.id, job.memory_estimate)
+                _running.add(job.id)
+                followed.append(job)
+            elif job.status in (STATUS_QUEUED, STATUS_RUNNING):
+                # Never got as far as starting its alignment
+                job.status = STATUS_QUEUED
+                job.started_at = None
+                _queue.append(job)
+                _save(job)
+                requeued.append(job)
+        _prune_finished_jobs()
+        running = [job.run for job in _jobs.values() if job.status == STATUS_RUNNING and job.run is not None]
+
+    # Working directories of runs that are no longer running were left by a crash
+    clean_scratch(keep=[run['scratch_dir'] for run in running if run.get('scratch_dir')])
+    for job in followed:
+        threading.Thread(target=_follow, args=(job,), daemon=True).start()
+    for job in requeued:
+        try:
+            binary_path, _ = get_binary_path(binary_name=job.params['binary_name'],
+                                             algorithm=job.params['algorithm'])
+        except ValueError:
+            continue
+        job.prediction = _predict(binary_path, job.params['file_path'], job.params['cost_type'],
+                                  job.requested_cores)
+    if followed or requeued:
+        logger.info('Recovered %d running and %d queued job(s)', len(followed), len(requeued))
+
+    _dispatch()
+    return {'running': len(followed), 'queued': len(requeued)}
+
+
+def _count_jobs(status):
+    """Number of jobs in a state, for the metrics"""
+    with _lock:
+        if status == STATUS_QUEUED:
+            return len(_queue)
+        return sum(1 for job in _jobs.values() if job.status == status)
+
+
+metrics_service.ALIGNMENTS_QUEUED.set_function(lambda: _count_jobs(STATUS_QUEUED))
+metrics_service.ALIGNMENTS_RUNNING.set_function(lambda: _count_jobs(STATUS_RUNNING))
+
+
+def _save(job):
+    """Persist the state of a job (lock must be held)"""
+    with db.transaction(SCHEMA) as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (job_id, status, params, requested_cores, memory_estimate, exclusive, '
+            'submitted_at, started_at, finished_at, result, error, pid, pid_start_time, run) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job.id, job.status, json.dumps(job.params), job.requested_cores, job.memory_estimate,
+             int(job.exclusive), job.submitted_at, job.started_at, job.finished_at,
+             json.dumps(job.result) if job.result is not None else None, job.error, job.pid,
+             job.pid_start_time, json.dumps(job.run) if job.run is not None else None)
+        )
+
+
+def _notify_finished(job, snapshot):
+    """Call the job's on_finish callback, outside of the lock"""
+    if job.on_finish is None:
+        return
+    try:
+        job.on_finish(snapshot)
+    except Exception:
+        logger.exception('on_finish callback of job %s failed', job.id)
+
+
+def _prune_finished_jobs():
+    """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS (lock must be held)"""
+    finished = [job for job in _jobs.values() if job.status in FINISHED_STATUSES]
+    excess = len(finished) - MAX_FINISHED_JOBS
+    if excess > 0:
+        finished.sort(key=lambda x: x.finished_at or '')
+        for job in finished[:excess]:
+            del _jobs[job.id]
+        with db.transaction(SCHEMA) as conn:
+            conn.executemany('DELETE FROM jobs WHERE job_id = ?', [(job.id,) for job in finished[:excess]])
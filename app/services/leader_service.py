@@ -0,0 +1,163 @@
+"""
+Leader election service
+Elects the process of a multi-process deployment that owns the in-memory
+state (jobs, batches, benchmarks, sweeps); the others forward it those requests
+"""
+
+import fcntl
+import http.client
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from flask import Response, jsonify
+from werkzeug.serving import make_server, WSGIRequestHandler
+from app.config import LEADER_LOCK_PATH, LEADER_SOCKET_PATH, LEADER_RETRY_INTERVAL, LEADER_ROUTES
+from app.services.metrics_service import FORWARDED_HEADER
+from app.utils.profiling import span
+
+logger = logging.getLogger(__name__)
+
+# Headers that only apply to one connection and are not forwarded
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade',
+                      'proxy-authenticate', 'proxy-authorization', 'host'}
+
+# Bytes relayed at a time, small enough for Server-Sent Events to pass through promptly
+PROXY_CHUNK_SIZE = 64 * 1024
+
+_leader = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+_lock_file = None
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over the leader's Unix socket"""
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(self.path))
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """Forwarded requests are already logged by the process that received them"""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def start_election(app, on_elected):
+    """
+    Become the leader if no other process is, else keep trying in the background
+    The leader serves app on LEADER_SOCKET_PATH for the other processes and
+    then calls on_elected; only the first call of a process does anything
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    if not _try_become_leader(app, on_elected):
+        logger.info('Process %d follows the leader', os.getpid())
+        threading.Thread(target=_retry_election, args=(app, on_elected), daemon=True).start()
+
+
+def claim_leadership(app):
+    """
+    Become the leader without retrying, for commands that run jobs themselves
+    Returns False if another process holds the lock; on_elected work such as
+    job recovery is left to the servers that take over once this process exits
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return is_leader()
+        if not _try_become_leader(app, on_elected=lambda: None):
+            return False
+        _started = True
+    return True
+
+
+def is_leader():
+    """True in the process owning jobs, batches, benchmarks and sweeps"""
+    return _leader.is_set()
+
+
+def is_leader_route(path):
+    """True for the routes only the leader can answer"""
+    return any(path == route or path.startswith(route + '/') for route in LEADER_ROUTES)
+
+
+def proxy_to_leader(request):
+    """Forward a request to the leader process and stream its response back"""
+    connection = _UnixHTTPConnection(LEADER_SOCKET_PATH)
+    target = urllib.parse.quote(request.path)
+    if request.query_string:
+        target += '?' + request.query_string.decode('latin-1')
+    headers = {name: value for name, value in request.headers if name.lower() not in HOP_BY_HOP_HEADERS}
+    headers[FORWARDED_HEADER] = '1'
+    body = request.stream if request.content_length else request.get_data()
+
+    try:
+        with span('proxy'):
+            connection.request(request.method, target, body=body, headers=headers)
+            response = connection.getresponse()
+    except OSError as e:
+        connection.close()
+        logger.warning('Leader process unavailable: %s', e)
+        return jsonify({'error': 'Leader process unavailable, retry shortly'}), 503, {
+            'Retry-After': str(LEADER_RETRY_INTERVAL)
+        }
+
+    def relay():
+        try:
+            while chunk := response.read1(PROXY_CHUNK_SIZE):
+                yield chunk
+        finally:
+            connection.close()
+
+    return Response(relay(), status=response.status, headers=[
+        (name, value) for name, value in response.getheaders() if name.lower() not in HOP_BY_HOP_HEADERS
+    ])
+
+
+def _try_become_leader(app, on_elected):
+    """Take the leader lock if it is free; it is held until the process exits"""
+    global _lock_file
+    LEADER_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(LEADER_LOCK_PATH, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+
+    _lock_file = lock_file
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(f'{os.getpid()}\n')
+    lock_file.flush()
+
+    # A socket left by a dead leader would make the bind fail
+    LEADER_SOCKET_PATH.unlink(missing_ok=True)
+    server = make_server(f'unix://{LEADER_SOCKET_PATH}', 0, app, threaded=True,
+                         request_handler=_QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    _leader.set()
+    logger.info('Process %d is the leader', os.getpid())
+    on_elected()
+    return True
+
+
+def _retry_election(app, on_elected):
+    """Take over once the leader process is gone"""
+    while not _try_become_leader(app, on_elected):
+        time.sleep(LEADER_RETRY_INTERVAL)
@@ -0,0 +1,294 @@
+"""
+Log viewer service
+Pages through and searches the stdout, stderr and verbose logs of results without loading them whole
+"""
+
+import bisect
+import json
+import re
+from app.config import (LOG_INDEX_DIR, RESULT_CHUNK_SIZE, LOG_PAGE_SIZE, LOG_MAX_PAGE_SIZE, LOG_INDEX_BLOCK_SIZE,
+                        LOG_MAX_LINE_LENGTH, LOG_MAX_PATTERN_LENGTH)
+from app.services.results_service import open_artifact, RESULT_ARTIFACTS
+
+# Artifacts the log viewer serves
+LOG_ARTIFACTS = ('verbose', 'stdout', 'stderr')
+
+# Longest line kept whole while searching, longer ones are only searched in their beginning
+SEARCH_MAX_LINE_BYTES = 4 * RESULT_CHUNK_SIZE
+
+# Repetitions of a search pattern: *, + and {m,n} ranges
+QUANTIFIER = re.compile(r'[*+]|\{\d*,\d*\}')
+
+
+def get_log_page(result_id, artifact='verbose', offset=0, limit=LOG_PAGE_SIZE):
+    """
+    Lines offset to offset + limit of a log of a result
+    Returns the lines with their numbers and the total number of lines
+    """
+    log, index = _open_log(result_id, artifact)
+    limit = _check_paging(offset, limit)
+
+    lines = []
+    if offset < index['total_lines']:
+        start = _line_start(log, index, offset)
+        lines = [
+            {'number': offset + i, 'text': text}
+            for i, text in enumerate(_read_lines(log, start, limit))
+        ]
+
+    next_offset = offset + len(lines)
+    return {
+        'result_id': result_id,
+        'artifact': artifact,
+        'size': log.size,
+        'total_lines': index['total_lines'],
+        'offset': offset,
+        'lines': lines,
+        'next_offset': next_offset if next_offset < index['total_lines'] else None
+    }
+
+
+def search_log(result_id, pattern, artifact='verbose', offset=0, limit=LOG_PAGE_SIZE, regex=False):
+    """
+    Lines of a log of a result containing pattern, or matching it as a regular expression with regex,
+    from line offset on
+    At most limit matches are returned; next_offset is where to resume the search
+    """
+    regex = _compile_pattern(pattern, regex)
+    log, index = _open_log(result_id, artifact)
+    limit = _check_paging(offset, limit)
+
+    matches = []
+    next_offset = None
+    if offset < index['total_lines']:
+        start = _line_start(log, index, offset)
+        line_number = offset
+        for text in _iter_line_blocks(log, start):
+            line_number, next_offset = _search_block(regex, text, line_number, matches, limit)
+            if next_offset is not None:
+                break
+
+    return {
+        'result_id': result_id,
+        'artifact': artifact,
+        'pattern': pattern,
+        'total_lines': index['total_lines'],
+        'offset': offset,
+        'matches': matches,
+        'next_offset': next_offset if next_offset is not None and next_offset < index['total_lines'] else None
+    }
+
+
+def _open_log(result_id, artifact):
+    """Open a log of a result with its line index, building the index on first access"""
+    if artifact not in LOG_ARTIFACTS:
+        raise ValueError(f'Unknown log: {artifact}')
+    log = open_artifact(result_id, artifact)
+
+    # Stored results never change, an index of the same size is still valid; indexes are kept
+    # out of RESULTS_DIR so that viewing a log does not change the validators of the results list
+    index_file = LOG_INDEX_DIR / f"{result_id}{RESULT_ARTIFACTS[artifact]}.lines"
+    try:
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index['size'] == log.size and index['block_size'] == LOG_INDEX_BLOCK_SIZE:
+            return log, index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = _build_line_index(log)
+    LOG_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    with open(index_file, 'w') as f:
+        json.dump(index, f)
+    return log, index
+
+
+def _build_line_index(log):
+    """
+    Count the lines of a log in one pass
+    counts[i] is the number of line ends before block i of LOG_INDEX_BLOCK_SIZE bytes
+    """
+    counts = []
+    newlines = 0
+    position = 0
+    last_byte = b''
+
+    for data in log.iter_range():
+        offset = 0
+        while offset < len(data):
+            if position % LOG_INDEX_BLOCK_SIZE == 0:
+                counts.append(newlines)
+            take = min(LOG_INDEX_BLOCK_SIZE - position % LOG_INDEX_BLOCK_SIZE, len(data) - offset)
+            newlines += data.count(b'\n', offset, offset + take)
+            offset += take
+            position += take
+        if data:
+            last_byte = data[-1:]
+
+    # A last line without line end still counts
+    total_lines = newlines + (1 if last_byte not in (b'', b'\n') else 0)
+    return {
+        'size': log.size,
+        'block_size': LOG_INDEX_BLOCK_SIZE,
+        'total_lines': total_lines,
+        'counts': counts
+    }
+
+
+def _line_start(log, index, line):
+    """Byte offset where a line (counted from 0) starts, reading only the block holding it"""
+    if line == 0:
+        return 0
+
+    # Last block with fewer line ends before it than needed: the line end before the line is in it
+    block = bisect.bisect_left(index['counts'], line) - 1
+    block_start = block * index['block_size']
+    data = log.read(block_start, index['block_size'])
+
+    position = -1
+    for _ in range(line - index['counts'][block]):
+        position = data.find(b'\n', position + 1)
+    return block_start + position + 1
+
+
+def _read_lines(log, start, limit):
+    """Up to limit lines from byte offset start, each cut to LOG_MAX_LINE_LENGTH"""
+    lines = []
+    current = bytearray()
+
+    for data in log.iter_range(start):
+        position = 0
+        while True:
+            end = data.find(b'\n', position)
+            piece_end = end if end >= 0 else len(data)
+            if len(current) < LOG_MAX_LINE_LENGTH:
+                current += data[position:min(piece_end, position + LOG_MAX_LINE_LENGTH - len(current))]
+            if end < 0:
+                break
+
+            lines.append(current.decode('utf-8', errors='replace'))
+            if len(lines) == limit:
+                return lines
+            current = bytearray()
+            position = end + 1
+
+    if current:
+        lines.append(current.decode('utf-8', errors='replace'))
+    return lines
+
+
+def _iter_line_blocks(log, start):
+    """Yield the log from byte offset start as text blocks of whole lines"""
+    carry = b''
+    for data in log.iter_range(start):
+        data = carry + data
+        end = data.rfind(b'\n')
+        if end < 0:
+            # Keep only the beginning of a line longer than SEARCH_MAX_LINE_BYTES
+            carry = data[:SEARCH_MAX_LINE_BYTES]
+            continue
+        carry = data[end + 1:]
+        yield data[:end + 1].decode('utf-8', errors='replace')
+
+    if carry:
+        yield carry.decode('utf-8', errors='replace')
+
+
+def _search_block(regex, text, line_number, matches, limit):
+    """
+    Append the lines of text matching regex to matches, text starting at line_number
+    Returns the line number after text and, once limit is reached, the line to resume from
+    """
+    position = 0
+    for match in regex.finditer(text):
+        if match.start() == len(text) and text.endswith('\n'):
+            # An empty match after the last line end belongs to the next block
+            break
+        matched_line = line_number + text.count('\n', position, match.start())
+        if matches and matches[-1]['number'] == matched_line:
+            continue
+        line_number, position = matched_line, match.start()
+
+        line_start = text.rfind('\n', 0, match.start()) + 1
+        line_end = text.find('\n', match.start())
+        matches.append({
+            'number': matched_line,
+            'text': text[line_start:line_end if line_end >= 0 else len(text)][:LOG_MAX_LINE_LENGTH]
+        })
+        if len(matches) == limit:
+            return line_number, matched_line + 1
+
+    return line_number + text.count('\n', position), None
+
+
+def _compile_pattern(pattern, regex):
+    """
+    Compile a search pattern, plain text unless regex is set
+    Regular expressions that can backtrack without end on a long line are refused:
+    the search cannot be interrupted once it runs
+    """
+    if len(pattern) > LOG_MAX_PATTERN_LENGTH:
+        raise ValueError(f'Search pattern longer than {LOG_MAX_PATTERN_LENGTH} characters')
+    if not regex:
+        return re.compile(re.escape(pattern))
+
+    hazard = _backtracking_hazard(pattern)
+    if hazard:
+        raise ValueError(f'Unsupported search pattern: {hazard}')
+    try:
+        return re.compile(pattern, re.MULTILINE)
+    except re.error as e:
+        raise ValueError(f'Invalid search pattern: {e}')
+
+
+def _backtracking_hazard(pattern):
+    """Why a regular expression may backtrack catastrophically (backreferences, nested quantifiers), or None"""
+    # Whether each open group, the whole pattern first, holds a quantifier
+    quantified = [False]
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == '\\':
+            if pattern[position + 1:position + 2] in tuple('123456789'):
+                return 'backreferences'
+            position += 2
+            continue
+        if char == '[':
+            position = _class_end(pattern, position)
+            continue
+
+        if char == '(':
+            if pattern.startswith('(?P=', position):
+                return 'backreferences'
+            quantified.append(False)
+        elif char == ')' and len(quantified) > 1:
+            inner = quantified.pop()
+            if inner and QUANTIFIER.match(pattern, position + 1):
+                return 'nested quantifiers'
+            quantified[-1] = quantified[-1] or inner
+        elif QUANTIFIER.match(pattern, position):
+            quantified[-1] = True
+        position += 1
+    return None
+
+
+def _class_end(pattern, start):
+    """Position after the character class opened at start"""
+    position = start + 1
+    if pattern[position:position + 1] == '^':
+        position += 1
+    # A ] right after the opening bracket is a literal
+    if pattern[position:position + 1] == ']':
+        position += 1
+    while position < len(pattern) and pattern[position] != ']':
+        position += 2 if pattern[position] == '\\' else 1
+    return position + 1
+
+
+def _check_paging(offset, limit):
+    """Validate offset and limit, returning the limit capped at LOG_MAX_PAGE_SIZE"""
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, LOG_MAX_PAGE_SIZE)
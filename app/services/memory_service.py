@@ -0,0 +1,92 @@
+"""
+Memory allocation service
+Estimates the memory of alignment jobs and admits them against a global budget
+"""
+
+import threading
+from app.config import (MEMORY_BUDGET_FRACTION, JOB_MEMORY_LIMIT, MIN_JOB_MEMORY, JOB_MEMORY_HEADROOM,
+                        JOB_MEMORY_SLACK, MEMORY_ESTIMATE_BYTES_PER_CELL)
+from app.services.catalog_service import get_input_features
+from app.utils.system import get_total_memory, get_cgroup_memory_limit
+
+_total_memory = get_total_memory()
+_budget = int(_total_memory * MEMORY_BUDGET_FRACTION) if _total_memory else None
+_reservations = {}
+_lock = threading.Lock()
+
+
+def get_memory_budget():
+    """Bytes alignments may reserve at the same time, or None if unknown"""
+    return _budget
+
+
+def get_job_memory_limit():
+    """Hard memory cap of a single alignment in bytes, or None for no cap"""
+    if JOB_MEMORY_LIMIT is None:
+        return _budget
+    if _budget is None:
+        return JOB_MEMORY_LIMIT
+    return min(JOB_MEMORY_LIMIT, _budget)
+
+
+def get_job_memory_cap(reservation):
+    """
+    Hard memory cap in bytes of an alignment holding reservation bytes, or None for no cap
+    Jobs may outgrow their estimate by JOB_MEMORY_HEADROOM before they are stopped,
+    so that one job cannot take the memory reserved by the others
+    """
+    limit = get_job_memory_limit()
+    if reservation is None:
+        return limit
+    cap = int(reservation * JOB_MEMORY_HEADROOM) + JOB_MEMORY_SLACK
+    return cap if limit is None else min(cap, limit)
+
+
+def estimate_job_memory(file_path):
+    """
+    Rough memory estimate in bytes of aligning a file
+    The pairwise lattices the heuristic is built from grow with the
+    product of the lengths of every pair of sequences
+    """
+    return MIN_JOB_MEMORY + MEMORY_ESTIMATE_BYTES_PER_CELL * get_input_features(file_path)['pair_cells']
+
+
+def try_reserve(job_id, num_bytes):
+    """
+    Reserve memory for a job
+    Returns False if it does not fit in what is left of the budget
+    """
+    with _lock:
+        if _budget is not None and _reserved() + num_bytes > _budget:
+            return False
+        _reservations[job_id] = num_bytes
+        return True
+
+
+def release(job_id):
+    """Return the memory reserved by a job to the budget"""
+    with _lock:
+        _reservations.pop(job_id, None)
+
+
+def get_allocation():
+    """Snapshot of the current memory reservations"""
+    with _lock:
+        reserved = _reserved()
+        return {
+            'total_memory': _total_memory,
+            'cgroup_limit': get_cgroup_memory_limit(),
+            'budget': _budget,
+            'job_limit': get_job_memory_limit(),
+            'reserved': reserved,
+            'free': _budget - reserved if _budget is not None else None,
+            'jobs': [
+                {'job_id': job_id, 'reserved': num_bytes}
+                for job_id, num_bytes in _reservations.items()
+            ]
+        }
+
+
+def _reserved():
+    """Number of reserved bytes (lock must be held)"""
+    return sum(_reservations.values())
@@ -0,0 +1,129 @@
+"""
+Metrics service
+Defines the service and workload metrics and serves them, merged over all server processes, for /metrics
+"""
+
+import atexit
+import os
+import threading
+import time
+from flask import g, request
+from app.config import METRICS_DIR, METRICS_FLUSH_INTERVAL, RESULTS_DIR, RESULTS_SIZE_REFRESH_INTERVAL
+from app.utils.metrics import Registry, SnapshotStore, Counter, Gauge, Histogram, render
+
+# Header marking requests a follower process forwarded to the leader, already measured by the follower
+FORWARDED_HEADER = 'X-MSA-Forwarded'
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'msa_http_request_duration_seconds', 'Time to answer HTTP requests, by route',
+    ('method', 'route', 'status')
+))
+ALIGNMENTS_RUNNING = registry.register(Gauge(
+    'msa_alignments_running', 'Alignments running, locally or on remote workers'
+))
+ALIGNMENTS_QUEUED = registry.register(Gauge(
+    'msa_alignments_queued', 'Alignments waiting in the job queue'
+))
+ALIGNMENT_DURATION = registry.register(Histogram(
+    'msa_alignment_duration_seconds', 'Wall time of finished alignment runs',
+    ('binary', 'cost_type'), buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+))
+JOBS_FINISHED = registry.register(Counter(
+    'msa_jobs_finished_total', 'Jobs finished, by final status', ('status',)
+))
+BINARY_PROBE_DURATION = registry.register(Histogram(
+    'msa_binary_probe_duration_seconds', 'Time to probe a binary for its options', ('binary',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+))
+SEQUENCE_SCAN_DURATION = registry.register(Histogram(
+    'msa_sequence_scan_duration_seconds',
+    'Time to list the sequence sources (listing) or to bring the catalog in line with them (catalog_refresh)',
+    ('operation',)
+))
+
+_store = SnapshotStore(METRICS_DIR, registry)
+_flusher_started = False
+_results_size = None
+_lock = threading.Lock()
+
+
+def start_metrics_flusher():
+    """Write the metrics of this process every METRICS_FLUSH_INTERVAL seconds, and when it exits"""
+    global _flusher_started
+    with _lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+
+    def flush():
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                _store.flush()
+            except OSError:
+                pass
+
+    threading.Thread(target=flush, daemon=True).start()
+    atexit.register(_store.flush)
+
+
+def instrument(app):
+    """Measure the latency of every request of app, by method, route and status"""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_duration(response):
+        started = g.pop('request_started', None)
+        if started is not None and FORWARDED_HEADER not in request.headers:
+            # Routes rather than paths keep the number of label values bounded
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_DURATION.observe(time.perf_counter() - started, method=request.method, route=route,
+                                     status=response.status_code)
+        return response
+
+
+def render_metrics():
+    """All metrics in the Prometheus text format"""
+    families = _store.collect()
+
+    # Measured once by the process answering, not per process
+    size, files = _get_results_size()
+    families['msa_results_directory_bytes'] = {
+        'type': 'gauge', 'help': 'Size of the files in the results directory', 'labelnames': [],
+        'values': [[[], size]]
+    }
+    families['msa_results_directory_files'] = {
+        'type': 'gauge', 'help': 'Number of files in the results directory', 'labelnames': [],
+        'values': [[[], files]]
+    }
+    return render(families)
+
+
+def _get_results_size():
+    """(bytes, files) in RESULTS_DIR, measured at most every RESULTS_SIZE_REFRESH_INTERVAL seconds"""
+    global _results_size
+    now = time.monotonic()
+    with _lock:
+        if _results_size is not None and now - _results_size[0] < RESULTS_SIZE_REFRESH_INTERVAL:
+            return _results_size[1]
+
+    size = files = 0
+    if RESULTS_DIR.exists():
+        with os.scandir(RESULTS_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        size += entry.stat().st_size
+                        files += 1
+                except OSError:
+                    # Deleted while scanning
+                    pass
+
+    with _lock:
+        _results_size = (now, (size, files))
+    return size, files
@@ -0,0 +1,181 @@
+"""
+Run time and memory predictor
+Estimates the wall time and peak memory of alignments from their input and the past runs of their binary
+"""
+
+import math
+import statistics
+import threading
+import time
+from app.config import (PREDICTOR_MIN_RUNS, PREDICTOR_MAX_RUNS, PREDICTOR_REFRESH_INTERVAL, PREDICTOR_MEMORY_MARGIN,
+                        MAX_EXECUTION_TIMEOUT, MIN_JOB_MEMORY)
+from app.services import memory_service
+from app.services.catalog_service import get_input_features
+from app.services.results_service import get_run_history
+
+# Penalty keeping the fit defined when a feature does not vary in the history, per run
+RIDGE = 0.01
+
+# Cached history per binary: (read at, runs, fitted models)
+_history = {}
+_lock = threading.Lock()
+
+
+def predict(binary, file_path, cost_type, num_threads):
+    """
+    Predict the wall time (seconds) and peak memory (bytes) of aligning a file with a binary
+    Past runs on the same input with the same threads are used as they are;
+    otherwise a model fitted to the binary's past runs extrapolates from the
+    input size, the number of sequences and the thread count. Without enough
+    history wall_time is None and memory falls back to the heuristic estimate.
+    basis tells where the prediction comes from; memory_estimate is what to
+    reserve, never more than the heuristic estimate unless measured on this
+    input; memory_bound is what the job may be refused on: the measured peak
+    or the heuristic estimate, never a model extrapolation
+    """
+    features = get_input_features(file_path)
+    threads = num_threads or 1
+    runs, models = _get_history(binary)
+
+    same_input = [run for run in runs if run['input_file'] == str(file_path) and run['cost_type'] == cost_type]
+    same_setup = [run for run in same_input if (run['num_threads'] or 1) == threads]
+
+    if same_setup:
+        basis, used = 'same_input', same_setup
+        wall_time, peak_memory = _medians(same_setup)
+    elif len(runs) >= PREDICTOR_MIN_RUNS:
+        # Runs of the same cost type, if there are enough of them
+        same_cost = [run for run in runs if run['cost_type'] == cost_type]
+        group = cost_type if len(same_cost) >= PREDICTOR_MIN_RUNS else None
+        used = same_cost if group else runs
+        basis = 'history'
+        x = _feature_vector(features['pair_cells'], features['num_sequences'], threads)
+        wall_time = _evaluate(_get_model(models, used, group, 'execution_time'), x)
+        peak_memory = _evaluate(_get_model(models, used, group, 'max_rss'), x)
+    elif same_input:
+        # Same input with another thread count: better than nothing
+        basis, used = 'same_input', same_input
+        wall_time, peak_memory = _medians(same_input)
+    else:
+        basis, used = 'heuristic', []
+        wall_time = peak_memory = None
+
+    if wall_time is not None:
+        wall_time = min(wall_time, MAX_EXECUTION_TIMEOUT)
+    heuristic_memory = memory_service.estimate_job_memory(file_path)
+    measured = basis == 'same_input' and peak_memory is not None
+    if peak_memory is None:
+        memory_estimate = heuristic_memory
+    elif measured:
+        memory_estimate = max(MIN_JOB_MEMORY, int(peak_memory * PREDICTOR_MEMORY_MARGIN))
+    else:
+        # Extrapolations far outside the fitted range are not trusted beyond the heuristic
+        memory_estimate = min(heuristic_memory, max(MIN_JOB_MEMORY, int(peak_memory * PREDICTOR_MEMORY_MARGIN)))
+
+    return {
+        'wall_time': wall_time,
+        'peak_memory': int(peak_memory) if peak_memory is not None else None,
+        'memory_estimate': memory_estimate,
+        'memory_bound': int(peak_memory) if measured else heuristic_memory,
+        'basis': basis,
+        'runs': len(used),
+        'features': features
+    }
+
+
+def _get_history(binary):
+    """Recent runs of a binary and the models fitted to them, read again every PREDICTOR_REFRESH_INTERVAL"""
+    now = time.monotonic()
+    with _lock:
+        cached = _history.get(binary)
+        if cached is not None and now - cached[0] < PREDICTOR_REFRESH_INTERVAL:
+            return cached[1], cached[2]
+
+    runs = get_run_history(binary, PREDICTOR_MAX_RUNS)
+    with _lock:
+        _history[binary] = (now, runs, {})
+        return runs, _history[binary][2]
+
+
+def _medians(runs):
+    """Median wall time and peak memory of runs"""
+    memory = [run['max_rss_kb'] * 1024 for run in runs if run['max_rss_kb']]
+    return (statistics.median(run['execution_time'] for run in runs),
+            statistics.median(memory) if memory else None)
+
+
+def _feature_vector(pair_cells, num_sequences, threads):
+    """
+    Features the logarithm of run time and memory is modelled as linear in
+    The search space grows exponentially with the number of sequences and
+    polynomially with their lengths; threads divide the run time
+    """
+    return [1.0, math.log1p(pair_cells), float(num_sequences), math.log(max(threads, 1))]
+
+
+def _get_model(models, runs, group, target):
+    """Fitted weights for a target ('execution_time' or 'max_rss') and cost type group, cached with the history"""
+    key = (group, target)
+    with _lock:
+        if key in models:
+            return models[key]
+
+    samples = []
+    for run in runs:
+        value = run['execution_time'] if target == 'execution_time' else (run['max_rss_kb'] or 0) * 1024
+        if value > 0:
+            samples.append((_feature_vector(run['pair_cells'], run['num_sequences'] or 0, run['num_threads'] or 1),
+                            math.log(value)))
+    model = _fit(samples) if len(samples) >= PREDICTOR_MIN_RUNS else None
+
+    with _lock:
+        models[key] = model
+    return model
+
+
+def _evaluate(model, x):
+    """Prediction of a model for a feature vector, None without a model"""
+    if model is None:
+        return None
+    # Keep far extrapolations finite
+    return math.exp(min(sum(w * v for w, v in zip(model, x)), 700))
+
+
+def _fit(samples):
+    """
+    Least squares weights of (features, log value) samples
+    A small ridge penalty on all weights but the intercept keeps the
+    normal equations solvable when a feature is constant in the history
+    """
+    size = len(samples[0][0])
+    a = [[0.0] * size for _ in range(size)]
+    b = [0.0] * size
+    for x, y in samples:
+        for i in range(size):
+            b[i] += x[i] * y
+            for j in range(size):
+                a[i][j] += x[i] * x[j]
+    for i in range(1, size):
+        a[i][i] += RIDGE * len(samples)
+    return _solve(a, b)
+
+
+def _solve(a, b):
+    """Solve a x = b by Gaussian elimination with partial pivoting"""
+    size = len(b)
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(a[row][column]))
+        a[column], a[pivot] = a[pivot], a[column]
+        b[column], b[pivot] = b[pivot], b[column]
+        if abs(a[column][column]) < 1e-12:
+            return None
+        for row in range(column + 1, size):
+            factor = a[row][column] / a[column][column]
+            for k in range(column, size):
+                a[row][k] -= factor * a[column][k]
+            b[row] -= factor * b[column]
+
+    x = [0.0] * size
+    for row in reversed(range(size)):
+        x[row] = (b[row] - sum(a[row][k] * x[k] for k in range(row + 1, size))) / a[row][row]
+    return x
@@ -0,0 +1,200 @@
+"""
+Profiling service
+Opt-in timing of requests and jobs: spans as Server-Timing headers and JSON logs, sampled full profiles on disk
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+from app.config import (PROFILING_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_MODE, PROFILE_STACK_INTERVAL,
+                        PROFILE_MAX_FILES, PROFILES_DIR)
+from app.services.metrics_service import FORWARDED_HEADER
+from app.utils.profiling import span, start_spans, stop_spans, format_server_timing, StackSampler
+
+logger = logging.getLogger(__name__)
+
+# Header asking for a full profile of a request, when profiling is enabled
+PROFILE_HEADER = 'X-MSA-Profile'
+
+# Profile file extension by mode
+PROFILE_EXTENSIONS = {'cprofile': '.prof', 'stack': '.folded'}
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider timing the serialization of responses"""
+
+    def dumps(self, obj, **kwargs):
+        with span('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+def instrument(app):
+    """
+    Time the spans of every request of app when PROFILING_ENABLED
+    Each response gets a Server-Timing header and each request a JSON log
+    line; PROFILE_SAMPLE_RATE of the requests, and those sending
+    PROFILE_HEADER, are profiled in full into PROFILES_DIR
+    """
+    if not PROFILING_ENABLED:
+        return
+
+    if not logging.getLogger().handlers:
+        # Nothing configured logging (e.g. under gunicorn): the timings must still show
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    app.json = _TimedJSONProvider(app)
+
+    @app.before_request
+    def start_profiling():
+        profiler = None
+        if PROFILE_SAMPLE_RATE > random.random() or request.headers.get(PROFILE_HEADER) == '1':
+            profiler = _start_profiler()
+        g.profiling = {'token': start_spans(), 'started': time.perf_counter(), 'profiler': profiler}
+
+    @app.after_request
+    def finish_profiling(response):
+        state = g.pop('profiling', None)
+        if state is None:
+            return response
+        duration = time.perf_counter() - state['started']
+        spans = stop_spans(state['token'])
+        profile = _save_profile(state['profiler']) if state['profiler'] is not None else None
+
+        # The leader's timings of a forwarded request are relayed next to the follower's
+        prefix = 'leader.' if FORWARDED_HEADER in request.headers else ''
+        response.headers.add('Server-Timing', format_server_timing(spans, total=duration, prefix=prefix))
+
+        logger.info('%s', json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule is not None else None,
+            'status': response.status_code,
+            'forwarded': bool(prefix),
+            'duration_ms': round(duration * 1000, 3),
+            'spans': spans.to_dict(),
+            'profile': profile
+        }))
+        return response
+
+    @app.teardown_request
+    def abort_profiling(exc):
+        # after_request did not run: do not leak the spans or a running profiler into the next request
+        state = g.pop('profiling', None)
+        if state is not None:
+            stop_spans(state['token'])
+            if state['profiler'] is not None:
+                _stop_profiler(state['profiler'])
+
+
+@contextmanager
+def profile_job(job_id):
+    """Time the spans of a job run on the current thread, logged as JSON when it ends"""
+    if not PROFILING_ENABLED:
+        yield
+        return
+
+    token = start_spans()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans = stop_spans(token)
+        logger.info('%s', json.dumps({
+            'event': 'job',
+            'job_id': job_id,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'spans': spans.to_dict()
+        }))
+
+
+def list_profiles():
+    """Saved profiles, newest first"""
+    if not PROFILES_DIR.exists():
+        return []
+    profiles = []
+    for path in PROFILES_DIR.iterdir():
+        if path.suffix not in PROFILE_EXTENSIONS.values():
+            continue
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        profiles.append({
+            'name': path.name,
+            'size': stat.st_size,
+            'created': datetime.fromtimestamp(stat.st_mtime).isoformat()
+        })
+    return sorted(profiles, key=lambda x: x['created'], reverse=True)
+
+
+def get_profile_path(name):
+    """Path of a saved profile, raising FileNotFoundError for unknown names"""
+    path = PROFILES_DIR / name
+    valid_name = re.fullmatch(r'[\w.-]+', name) and path.suffix in PROFILE_EXTENSIONS.values()
+    if not valid_name or not path.is_file():
+        raise FileNotFoundError(f'Profile not found: {name}')
+    return path
+
+
+def _start_profiler():
+    """Start profiling the current request, None if another profile is running"""
+    if PROFILE_MODE == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one cProfile can be active in a process at a time
+            return None
+        return profiler
+
+    sampler = StackSampler(threading.get_ident(), PROFILE_STACK_INTERVAL)
+    sampler.start()
+    return sampler
+
+
+def _stop_profiler(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def _save_profile(profiler):
+    """Stop a profiler and write its profile to PROFILES_DIR; returns the file name"""
+    _stop_profiler(profiler)
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'index'
+    mode = 'cprofile' if isinstance(profiler, cProfile.Profile) else 'stack'
+    name = f"{datetime.now():%Y%m%d_%H%M%S_%f}_{os.getpid()}_{request.method}_{slug}{PROFILE_EXTENSIONS[mode]}"
+
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        if mode == 'cprofile':
+            profiler.dump_stats(PROFILES_DIR / name)
+        else:
+            (PROFILES_DIR / name).write_text(profiler.collapsed())
+    except OSError as e:
+        logger.warning('Could not save profile %s: %s', name, e)
+        return None
+
+    _prune_profiles()
+    return name
+
+
+def _prune_profiles():
+    """Remove the oldest profiles beyond PROFILE_MAX_FILES"""
+    for profile in list_profiles()[PROFILE_MAX_FILES:]:
+        (PROFILES_DIR / profile['name']).unlink(missing_ok=True)
@@ -0,0 +1,63 @@
+"""
+Alignment quality service
+Scores the output of finished runs, against the BAliBASE reference when there is one
+"""
+
+import logging
+from pathlib import Path
+from app.config import (SOURCES, FASTA_EXTENSIONS, COMPRESSED_EXTENSIONS, QUALITY_MAX_OUTPUT_BYTES,
+                        BALIBASE_REFERENCE_EXTENSIONS)
+from app.utils.alignment import Alignment, SCORING_SCHEMES, sum_of_pairs, column_statistics, compare_to_reference
+
+logger = logging.getLogger(__name__)
+
+
+def score_output(output_file, input_file, cost_type):
+    """
+    Quality measures of an aligned output: sum-of-pairs score under the
+    run's cost type, column identity, gap statistics and, for BALIBASE
+    inputs with a reference alignment, the BAliBASE SP and TC scores
+    Returns None if the output is missing or too large to score
+    """
+    output_file = Path(output_file)
+    if not output_file.exists() or output_file.stat().st_size > QUALITY_MAX_OUTPUT_BYTES:
+        return None
+
+    alignment = Alignment.from_fasta(output_file)
+    quality = column_statistics(alignment)
+    quality['cost_type'] = cost_type
+    quality['sp_score'] = sum_of_pairs(alignment, cost_type) if cost_type in SCORING_SCHEMES else None
+
+    quality['reference'] = None
+    reference_file = find_reference(input_file)
+    if reference_file is not None:
+        try:
+            reference = Alignment.from_msf(reference_file) if reference_file.suffix == '.msf' \
+                else Alignment.from_fasta(reference_file)
+            quality['reference'] = compare_to_reference(alignment, reference)
+            if quality['reference'] is not None:
+                quality['reference']['file'] = reference_file.name
+        except (OSError, ValueError) as e:
+            logger.warning('Could not read reference alignment %s: %s', reference_file, e)
+
+    return quality
+
+
+def find_reference(input_file):
+    """Reference alignment of a BALIBASE input, stored next to it under the same name, or None"""
+    input_file = Path(input_file)
+    try:
+        input_file.resolve().relative_to(SOURCES['BALIBASE']['path'].resolve())
+    except ValueError:
+        return None
+
+    name = input_file.name
+    for extension in COMPRESSED_EXTENSIONS + FASTA_EXTENSIONS:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+
+    for extension in BALIBASE_REFERENCE_EXTENSIONS:
+        reference_file = input_file.with_name(name + extension)
+        if reference_file.exists():
+            return reference_file
+    return None
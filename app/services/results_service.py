@@ -4,15 +4,124 @@ Handles result storage and retrieval
 """
 
 import json
+from datetime import datetime
 from pathlib import Path
-from app.config import RESULTS_DIR
+from app.config import (RESULTS_DIR, LOG_INDEX_DIR, RESULTS_PAGE_SIZE, RESULTS_MAX_PAGE_SIZE, COMPRESS_RESULTS,
+                        RESULT_CHUNK_SIZE, RESULT_COMPRESSION_LEVEL, RESULT_PREVIEW_BYTES)
+from app.services.catalog_service import get_input_features
+from app.utils import db
+from app.utils.chunked import compress_file, ChunkedFile
+from app.utils.filesystem import move_file
 
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results_index (
+    result_id TEXT PRIMARY KEY,
+    binary TEXT,
+    input_file TEXT,
+    input_name TEXT,
+    cost_type TEXT,
+    num_threads INTEGER,
+    return_code INTEGER,
+    execution_time REAL,
+    cpu_time REAL,
+    max_rss_kb INTEGER,
+    sp_score REAL,
+    column_identity REAL,
+    reference_sp REAL,
+    reference_tc REAL,
+    num_sequences INTEGER,
+    pair_cells INTEGER,
+    timestamp TEXT,
+    started_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_index_started_at ON results_index (started_at);
+CREATE INDEX IF NOT EXISTS idx_results_index_binary ON results_index (binary);
+"""
+
+# Columns /api/results can be sorted by
+SORT_COLUMNS = {
+    'id': 'result_id',
+    'timestamp': 'started_at',
+    'execution_time': 'execution_time',
+    'cpu_time': 'cpu_time',
+    'max_rss': 'max_rss_kb',
+    'sp_score': 'sp_score',
+    'column_identity': 'column_identity',
+    'reference_sp': 'reference_sp',
+    'reference_tc': 'reference_tc',
+    'binary': 'binary',
+    'input_file': 'input_name',
+    'cost_type': 'cost_type',
+    'return_code': 'return_code'
+}
+
+# Files stored with a result next to its .log, by artifact name
+RESULT_ARTIFACTS = {
+    'output': '.fasta',
+    'stdout': '_stdout.txt',
+    'stderr': '_stderr.txt',
+    'verbose': '_verbose.txt'
+}
+
+_index_checked = False
+
+
+def _ensure_index():
+    """Rebuild the results index from the logs when its layout changed"""
+    global _index_checked
+    if _index_checked:
+        return
+    _index_checked = True
+    if db.ensure_schema_version('results_index', SCHEMA_VERSION, ['results_index']):
+        reindex_results()
 
-def list_results():
-    """List all previous results"""
-    results = []
 
-    for log_file in sorted(RESULTS_DIR.glob('*.log'), reverse=True):
+def index_result(result_id, log_data):
+    """Add or update the summary of a result in the results index"""
+    _ensure_index()
+    resources = log_data.get('resources') or {}
+    quality = log_data.get('quality') or {}
+    reference = quality.get('reference') or {}
+    input_file = log_data.get('input_file') or ''
+    features = log_data.get('input_features')
+    if features is None and input_file:
+        # Logs written before features were recorded
+        try:
+            features = get_input_features(input_file)
+        except (OSError, ValueError):
+            pass
+    features = features or {}
+    timestamp = log_data.get('timestamp')
+    try:
+        started_at = datetime.strptime(timestamp, '%Y%m%d_%H%M%S').isoformat()
+    except (TypeError, ValueError):
+        started_at = None
+
+    with db.transaction(SCHEMA) as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO results_index (result_id, binary, input_file, input_name, cost_type, '
+            'num_threads, return_code, execution_time, cpu_time, max_rss_kb, sp_score, column_identity, '
+            'reference_sp, reference_tc, num_sequences, pair_cells, timestamp, started_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (result_id, log_data.get('binary'), input_file, Path(input_file).name if input_file else None,
+             log_data.get('cost_type'), log_data.get('num_threads'), log_data.get('return_code'),
+             log_data.get('execution_time'), resources.get('cpu_time'), resources.get('max_rss_kb'),
+             quality.get('sp_score'), quality.get('column_identity'), reference.get('sp'), reference.get('tc'),
+             features.get('num_sequences'), features.get('pair_cells'), timestamp, started_at)
+        )
+
+
+def reindex_results():
+    """
+    Rebuild the results index from the .log files in RESULTS_DIR
+    Returns the number of indexed results
+    """
+    _ensure_index()
+    indexed = set()
+
+    for log_file in RESULTS_DIR.glob('*.log'):
         # Skip verbose log files
         if log_file.stem.endswith('_verbose'):
             continue
@@ -20,76 +129,272 @@ def list_results():
         try:
             with open(log_file, 'r') as f:
                 log_data = json.load(f)
-                # Extract just the filename from the input_file path
-                input_file = log_data.get('input_file', '')
-                input_filename = Path(input_file).name if input_file else 'N/A'
-                results.append({
-                    'id': log_file.stem,
-                    'timestamp': log_data.get('timestamp'),
-                    'execution_time': log_data.get('execution_time'),
-                    'return_code': log_data.get('return_code'),
-                    'input_file': input_filename
-                })
-        except:
-            pass
+        except (OSError, ValueError):
+            continue
 
-    return results
+        index_result(log_file.stem, log_data)
+        indexed.add(log_file.stem)
 
+    # Drop entries whose log file is gone
+    with db.transaction(SCHEMA) as conn:
+        stale = [
+            row['result_id'] for row in conn.execute('SELECT result_id FROM results_index')
+            if row['result_id'] not in indexed
+        ]
+        conn.executemany('DELETE FROM results_index WHERE result_id = ?', [(result_id,) for result_id in stale])
 
-def get_result(result_id):
-    """Get specific result details"""
-    log_file = RESULTS_DIR / f"{result_id}.log"
-    output_file = RESULTS_DIR / f"{result_id}.fasta"
-    verbose_log_file = RESULTS_DIR / f"{result_id}_verbose.log"
+    return len(indexed)
 
-    if not log_file.exists():
-        raise FileNotFoundError('Result not found')
 
-    with open(log_file, 'r') as f:
-        log_data = json.load(f)
+def get_run_history(binary, limit):
+    """
+    The most recent successful runs of a binary with the size of their input
+    Returns dicts with input_file, cost_type, num_threads, execution_time,
+    max_rss_kb, num_sequences and pair_cells
+    """
+    _ensure_index()
+    with db.transaction(SCHEMA) as conn:
+        rows = conn.execute(
+            'SELECT input_file, cost_type, num_threads, execution_time, max_rss_kb, num_sequences, pair_cells '
+            'FROM results_index WHERE binary = ? AND return_code = 0 AND execution_time IS NOT NULL '
+            'AND pair_cells IS NOT NULL ORDER BY started_at DESC LIMIT ?',
+            (binary, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def list_results(page=1, per_page=RESULTS_PAGE_SIZE, sort='timestamp', order='desc', filters=None):
+    """
+    List previous results from the results index
+    filters may contain binary, input_file, cost_type, return_code,
+    date_from, date_to, min_time and max_time
+    Returns a page of summaries with the total number of matches
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f'Invalid sort column: {sort}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Invalid sort order: {order}')
+    if page < 1 or per_page < 1:
+        raise ValueError('page and per_page must be positive')
+    per_page = min(per_page, RESULTS_MAX_PAGE_SIZE)
+    _ensure_index()
+
+    conditions = []
+    params = []
+    filters = filters or {}
+
+    if filters.get('binary'):
+        conditions.append('binary = ?')
+        params.append(filters['binary'])
+    if filters.get('input_file'):
+        conditions.append('input_name LIKE ?')
+        params.append(f"%{filters['input_file']}%")
+    if filters.get('cost_type'):
+        conditions.append('cost_type = ?')
+        params.append(filters['cost_type'])
+    if filters.get('return_code') is not None:
+        conditions.append('return_code = ?')
+        params.append(filters['return_code'])
+    if filters.get('date_from'):
+        conditions.append('started_at >= ?')
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        # Dates without time include the whole day
+        date_to = filters['date_to']
+        conditions.append('started_at <= ?')
+        params.append(date_to + 'T23:59:59' if len(date_to) == 10 else date_to)
+    if filters.get('min_time') is not None:
+        conditions.append('execution_time >= ?')
+        params.append(filters['min_time'])
+    if filters.get('max_time') is not None:
+        conditions.append('execution_time <= ?')
+        params.append(filters['max_time'])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order_by = f"{SORT_COLUMNS[sort]} {order.upper()}, result_id {order.upper()}"
+
+    with db.transaction(SCHEMA) as conn:
+        total = conn.execute(f'SELECT COUNT(*) FROM results_index {where}', params).fetchone()[0]
+        rows = conn.execute(
+            f'SELECT * FROM results_index {where} ORDER BY {order_by} LIMIT ? OFFSET ?',
+            params + [per_page, (page - 1) * per_page]
+        ).fetchall()
+
+    results = [
+        {
+            'id': row['result_id'],
+            'timestamp': row['timestamp'],
+            'execution_time': row['execution_time'],
+            'cpu_time': row['cpu_time'],
+            'max_rss_kb': row['max_rss_kb'],
+            'sp_score': row['sp_score'],
+            'column_identity': row['column_identity'],
+            'reference_sp': row['reference_sp'],
+            'reference_tc': row['reference_tc'],
+            'return_code': row['return_code'],
+            'input_file': row['input_name'] or 'N/A',
+            'binary': row['binary'],
+            'cost_type': row['cost_type'],
+            'num_threads': row['num_threads']
+        }
+        for row in rows
+    ]
 
-    output_content = ""
-    if output_file.exists():
-        with open(output_file, 'r') as f:
-            output_content = f.read()
+    return {
+        'results': results,
+        'total': total,
+        'page': page,
+        'per_page': per_page
+    }
 
-    verbose_log_content = ""
-    if verbose_log_file.exists():
-        with open(verbose_log_file, 'r') as f:
-            verbose_log_content = f.read()
 
+def get_results_version():
+    """
+    Version of the results for HTTP validators: (token, modification time in ns)
+    Storing or deleting a result modifies the results directory
+    """
+    mtime_ns = RESULTS_DIR.stat().st_mtime_ns if RESULTS_DIR.exists() else 0
+    return (SCHEMA_VERSION, mtime_ns), mtime_ns
+
+
+def get_result_version(result_id):
+    """
+    Version of a result for HTTP validators: (token, modification time in ns)
+    A result never changes once stored, short of being deleted and stored again
+    """
+    stat = (RESULTS_DIR / f"{result_id}.log").stat()
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size), stat.st_mtime_ns
+
+
+def get_result(result_id):
+    """
+    Get specific result details
+    Output and verbose log are previews of their first RESULT_PREVIEW_BYTES,
+    the full files are served by /api/download
+    """
+    log_data = _read_log(result_id)
+
+    output_content, output_truncated = _preview(result_id, 'output', log_data)
+    verbose_log_content, verbose_log_truncated = _preview(result_id, 'verbose', log_data)
+
+    # The chunk offsets are only needed to read the files
+    log_data['artifacts'] = {
+        name: {'size': entry['size'], 'compressed_size': entry.get('compressed_size')}
+        for name, entry in (log_data.get('artifacts') or {}).items()
+    }
     log_data['output_content'] = output_content
+    log_data['output_truncated'] = output_truncated
     log_data['verbose_log_content'] = verbose_log_content
+    log_data['verbose_log_truncated'] = verbose_log_truncated
     log_data['result_id'] = result_id
 
     return log_data
 
 
-def get_result_file_path(result_id):
-    """Get the file path for a result"""
-    output_file = RESULTS_DIR / f"{result_id}.fasta"
+def store_artifacts(result_id, directory):
+    """
+    Compress the files of a new result in directory into chunked gzip, removing the plain ones
+    Returns the artifact index kept in the result's .log
+    """
+    artifacts = {}
+    for name, suffix in RESULT_ARTIFACTS.items():
+        path = directory / f"{result_id}{suffix}"
+        if not path.exists():
+            continue
+        if not COMPRESS_RESULTS:
+            artifacts[name] = {'file': path.name, 'size': path.stat().st_size}
+            continue
+
+        target = path.with_name(f'{path.name}.gz')
+        index = compress_file(path, target, RESULT_CHUNK_SIZE, RESULT_COMPRESSION_LEVEL)
+        path.unlink()
+        artifacts[name] = {'file': target.name, **index}
+    return artifacts
+
+
+def publish_result(result_id, log_content, directory):
+    """
+    Move the stored files of a new result from its working directory into RESULTS_DIR
+    and write its .log, which is renamed into place last: until then readers do not see the result
+    """
+    RESULTS_DIR.mkdir(exist_ok=True)
+    for entry in log_content['artifacts'].values():
+        move_file(directory / entry['file'], RESULTS_DIR / entry['file'])
+
+    staged_log = directory / f"{result_id}.log"
+    with open(staged_log, 'w') as f:
+        json.dump(log_content, f, indent=2)
+    move_file(staged_log, RESULTS_DIR / f"{result_id}.log")
+
 
-    if not output_file.exists():
+def open_artifact(result_id, name, log_data=None):
+    """
+    Open a stored file of a result for reading at any offset
+    Results stored before compression are read from their plain files
+    """
+    if name not in RESULT_ARTIFACTS:
+        raise ValueError(f'Unknown artifact: {name}')
+    if log_data is None:
+        log_data = _read_log(result_id)
+
+    entry = (log_data.get('artifacts') or {}).get(name)
+    if entry is not None:
+        path = RESULTS_DIR / entry['file']
+        index = entry if 'offsets' in entry else None
+    else:
+        path = RESULTS_DIR / f"{result_id}{RESULT_ARTIFACTS[name]}"
+        if name == 'verbose' and not path.exists():
+            # Older results used _verbose.log
+            path = RESULTS_DIR / f"{result_id}_verbose.log"
+        index = None
+
+    if not path.exists():
         raise FileNotFoundError('File not found')
+    return ChunkedFile(path, index)
 
-    return output_file
+
+def _read_log(result_id):
+    """Load the .log of a result"""
+    log_file = RESULTS_DIR / f"{result_id}.log"
+    if not log_file.exists():
+        raise FileNotFoundError('Result not found')
+
+    with open(log_file, 'r') as f:
+        return json.load(f)
+
+
+def _preview(result_id, name, log_data):
+    """First RESULT_PREVIEW_BYTES of an artifact as text, and whether it was truncated"""
+    try:
+        artifact = open_artifact(result_id, name, log_data)
+    except FileNotFoundError:
+        return '', False
+
+    content = artifact.read(0, RESULT_PREVIEW_BYTES)
+    return content.decode('utf-8', errors='replace'), artifact.size > len(content)
 
 
 def delete_result(result_id):
     """Delete a result and all associated files"""
     log_file = RESULTS_DIR / f"{result_id}.log"
-    output_file = RESULTS_DIR / f"{result_id}.fasta"
-    verbose_log_file = RESULTS_DIR / f"{result_id}_verbose.log"
-    verbose_txt_file = RESULTS_DIR / f"{result_id}_verbose.txt"
 
     if not log_file.exists():
         raise FileNotFoundError('Result not found')
 
+    result_files = [log_file, RESULTS_DIR / f"{result_id}_verbose.log"]
+    for suffix in RESULT_ARTIFACTS.values():
+        result_files.append(RESULTS_DIR / f"{result_id}{suffix}")
+        result_files.append(RESULTS_DIR / f"{result_id}{suffix}.gz")
+        result_files.append(LOG_INDEX_DIR / f"{result_id}{suffix}.lines")
+
     # Delete all associated files
     deleted_files = []
-    for file_path in [log_file, output_file, verbose_log_file, verbose_txt_file]:
+    for file_path in result_files:
         if file_path.exists():
             file_path.unlink()
             deleted_files.append(file_path.name)
 
+    with db.transaction(SCHEMA) as conn:
+        conn.execute('DELETE FROM results_index WHERE result_id = ?', (result_id,))
+
     return deleted_files
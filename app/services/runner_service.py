@@ -3,24 +3,94 @@ Alignment execution service
 Handles running MSA algorithms
 """
 
+import logging
+import os
+import shutil
 import subprocess
 import time
-import json
+import uuid
 from datetime import datetime
 from pathlib import Path
-from app.config import RESULTS_DIR, MAX_EXECUTION_TIMEOUT
+from app.config import RESULTS_DIR, SCRATCH_DIR, MAX_EXECUTION_TIMEOUT, MEMORY_CGROUP_PARENT, DETACHED_POLL_INTERVAL
+from app.services import cache_service, metrics_service, quality_service
 from app.services.binaries_service import get_binary_path
+from app.services.catalog_service import get_input_features
+from app.services.results_service import index_result, store_artifacts, publish_result, RESULT_ARTIFACTS
+from app.utils.fasta import get_compression, decompress_to
+from app.utils.filesystem import link_or_copy, move_file
+from app.utils.limits import (set_address_space_limit, create_memory_cgroup, join_cgroup, cgroup_oom_killed,
+                              remove_cgroup, classify_termination, KILLED_OOM, MEMORY_LIMIT_EXCEEDED)
+from app.utils.procstats import ProcessMonitor, rusage_to_dict, is_same_process, kill_process
+from app.utils.profiling import span
+from app.utils.stream import FileTailer, read_tail
+
+logger = logging.getLogger(__name__)
+
+# Termination of a run whose process was lost in a restart of the service
+INTERRUPTED = 'interrupted'
+
+# Log entries holding the paths of the files of a run, by artifact name
+ARTIFACT_LOG_KEYS = {
+    'stdout': 'stdout_file',
+    'stderr': 'stderr_file',
+    'verbose': 'verbose_log_file'
+}
+
+# Fields kept from the log of a run reported by a remote worker, with their accepted types;
+# the binary, input, cost type and file paths come from the leased job instead
+_NUMBER = (int, float)
+REMOTE_LOG_FIELDS = {
+    'command': (str,),
+    'execution_time': _NUMBER + (type(None),),
+    'return_code': (int, type(None)),
+    'stdout': (str,),
+    'stderr': (str,),
+    'num_threads': (int, type(None)),
+    'supports_threads': (bool,),
+    'verbose': (bool,),
+    'memory_limit': (int, type(None)),
+    'memory_cgroup': (bool,),
+    'termination': (str, type(None)),
+    'resources': (dict, type(None)),
+    'timeline': (dict, type(None))
+}
+REMOTE_RESOURCE_FIELDS = ['user_time', 'system_time', 'cpu_time', 'cpu_utilization', 'max_rss_kb',
+                          'voluntary_context_switches', 'involuntary_context_switches', 'minor_page_faults',
+                          'major_page_faults']
 
 # Create results directory if it doesn't exist
 RESULTS_DIR.mkdir(exist_ok=True)
 
 
-def run_alignment(binary_name, algorithm, file_path, cost_type='PAM250', num_threads=4, verbose=False):
+def _child_setup(cpu_set, memory_limit=None, memory_cgroup=None):
+    """Build the function run in the child before exec, or None if nothing to do"""
+    if not cpu_set and not memory_limit:
+        return None
+
+    def setup():
+        if cpu_set:
+            os.sched_setaffinity(0, cpu_set)
+        # A cgroup limits resident memory; without one, cap the address space
+        if memory_cgroup:
+            join_cgroup(memory_cgroup)
+        elif memory_limit:
+            set_address_space_limit(memory_limit)
+
+    return setup
+
+
+def run_alignment(binary_name, algorithm, file_path, cost_type='PAM250', num_threads=4, verbose=False,
+                  on_start=None, cpu_set=None, output_stream=None, force=False, memory_limit=None):
     """
     Execute MSA alignment
 
     Args:
         verbose: If True, include -l flag for verbose output
+        on_start: Optional callback receiving the child process and the run description once it is started
+        cpu_set: Optional list of CPU ids the child process is pinned to
+        output_stream: Optional OutputStream receiving stdout, stderr and verbose lines live
+        force: If True, run even when a cached result for the same inputs exists
+        memory_limit: Optional memory cap of the child process in bytes
 
     Returns:
         dict: Result information including execution time, output, etc.
@@ -36,13 +106,93 @@ def run_alignment(binary_name, algorithm, file_path, cost_type='PAM250', num_thr
     if not file_path.exists():
         raise FileNotFoundError(f'File not found: {file_path}')
 
-    # Create unique result identifier
+    # Reuse a previous result of the same binary, input and parameters
+    cache_key = get_cache_key(binary_path, supports_threads, file_path, cost_type, num_threads, verbose)
+    if not force:
+        cached = find_cached_result(cache_key)
+        if cached is not None:
+            return cached
+    cache_status = 'bypass' if force else 'miss'
+    logger.info('Result cache %s for %s on %s', cache_status, binary_path.name, file_path.name)
+
+    run = prepare_run(binary_path, supports_threads, file_path, cost_type, num_threads, verbose, SCRATCH_DIR,
+                      cpu_set=cpu_set, memory_limit=memory_limit)
+    run['cache_key'] = cache_key
+    run['cache'] = cache_status
+
+    try:
+        with span('subprocess'):
+            outcome = execute_run(run, on_start=on_start, output_stream=output_stream)
+    except (subprocess.TimeoutExpired, OSError):
+        _remove_work_dir(Path(run['scratch_dir']))
+        raise
+    return _record_run(run, **outcome)
+
+
+def get_cache_key(binary_path, supports_threads, file_path, cost_type, num_threads, verbose):
+    """Result cache key of an alignment; the thread count only matters to binaries that support threads"""
+    with span('hash'):
+        return cache_service.compute_cache_key(binary_path, file_path, cost_type,
+                                               num_threads if supports_threads else None, verbose)
+
+
+def find_cached_result(cache_key):
+    """Result of a previous successful run with this cache key, marked as a cache hit, or None"""
+    cached = cache_service.lookup(cache_key)
+    if cached is None:
+        return None
+    logger.info('Result cache hit for %s: %s', cached['binary'], cached['result_id'])
+    return {
+        'success': True,
+        'result_id': cached['result_id'],
+        'binary': cached['binary'],
+        'execution_time': cached['execution_time'],
+        'stdout': cached['stdout'],
+        'stderr': cached['stderr'],
+        'output_file': _stored_output_file(cached['result_id'], cached),
+        'return_code': cached['return_code'],
+        'verbose': cached['verbose'],
+        'resources': cached.get('resources'),
+        'termination': None,
+        'quality': cached.get('quality'),
+        'cache': 'hit'
+    }
+
+
+def new_result_id(binary_version):
+    """
+    Identifier of a new result of a binary: its name, the time and a random suffix,
+    so that runs started in the same second do not share their files
+    """
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    binary_version = binary_path.name
-    result_id = f"{binary_version}_{timestamp}"
-    output_file = RESULTS_DIR / f"{result_id}.fasta"
-    log_file = RESULTS_DIR / f"{result_id}.log"
-    verbose_log_file = RESULTS_DIR / f"{result_id}_verbose.txt" if verbose else None
+    return f"{binary_version}_{timestamp}_{uuid.uuid4().hex[:8]}", timestamp
+
+
+def prepare_run(binary_path, supports_threads, file_path, cost_type, num_threads, verbose, work_dir,
+                cpu_set=None, memory_limit=None):
+    """
+    Describe a run of a binary on a file, in a directory of its own below work_dir
+    The input is staged there too, expanded if compressed since the binaries only
+    read plain FASTA; the files stay there until the result is published
+    Returns a serializable dict holding everything needed to execute and record the run
+    """
+    result_id, timestamp = new_result_id(binary_path.name)
+    scratch_dir = work_dir / result_id
+    scratch_dir.mkdir(parents=True)
+    output_file = scratch_dir / f"{result_id}.fasta"
+    verbose_log_file = scratch_dir / f"{result_id}_verbose.txt" if verbose else None
+    stdout_file = scratch_dir / f"{result_id}_stdout.txt"
+    stderr_file = scratch_dir / f"{result_id}_stderr.txt"
+
+    binary_input = scratch_dir / f"{result_id}_input.fasta"
+    try:
+        if get_compression(file_path):
+            decompress_to(file_path, binary_input)
+        else:
+            link_or_copy(file_path, binary_input)
+    except BaseException:
+        _remove_work_dir(scratch_dir)
+        raise
 
     # Build command
     cmd = [str(binary_path)]
@@ -62,60 +212,373 @@ def run_alignment(binary_name, algorithm, file_path, cost_type='PAM250', num_thr
         cmd.extend(['-l', str(verbose_log_file)])
 
     # Add input file
-    cmd.append(str(file_path))
+    cmd.append(str(binary_input))
 
-    # Execute
-    start_time = time.time()
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=MAX_EXECUTION_TIMEOUT
-    )
-    execution_time = time.time() - start_time
+    memory_cgroup = None
+    if memory_limit and MEMORY_CGROUP_PARENT:
+        memory_cgroup = create_memory_cgroup(MEMORY_CGROUP_PARENT, f"msa_{result_id}", memory_limit)
 
-    # Save log
-    log_content = {
-        'binary': binary_version,
-        'command': ' '.join(cmd),
-        'execution_time': execution_time,
-        'return_code': result.returncode,
-        'stdout': result.stdout,
-        'stderr': result.stderr,
+    return {
+        'result_id': result_id,
+        'scratch_dir': str(scratch_dir),
+        'binary': binary_path.name,
+        'command': cmd,
         'timestamp': timestamp,
         'input_file': str(file_path),
+        'binary_input': str(binary_input),
         'cost_type': cost_type,
         'num_threads': num_threads if supports_threads else None,
         'supports_threads': supports_threads,
+        'cpu_set': cpu_set,
         'verbose': verbose,
-        'verbose_log_file': str(verbose_log_file) if verbose_log_file else None
+        'output_file': str(output_file),
+        'verbose_log_file': str(verbose_log_file) if verbose_log_file else None,
+        'stdout_file': str(stdout_file),
+        'stderr_file': str(stderr_file),
+        'memory_limit': memory_limit,
+        'memory_cgroup': str(memory_cgroup) if memory_cgroup else None,
+        'cache_key': None,
+        'cache': None,
+        'started_at': None
+    }
+
+
+def execute_run(run, on_start=None, output_stream=None, timeout=MAX_EXECUTION_TIMEOUT):
+    """
+    Execute a prepared run, spilling stdout/stderr to disk and following them as they are written
+    The child gets its own session so it survives a restart of the service
+    Returns the outcome as keyword arguments of build_log
+    """
+    memory_cgroup = Path(run['memory_cgroup']) if run['memory_cgroup'] else None
+
+    start_time = time.time()
+    with open(run['stdout_file'], 'w') as stdout_handle, open(run['stderr_file'], 'w') as stderr_handle:
+        process = subprocess.Popen(
+            run['command'],
+            stdout=stdout_handle,
+            stderr=stderr_handle,
+            preexec_fn=_child_setup(run['cpu_set'], run['memory_limit'], memory_cgroup),
+            start_new_session=True
+        )
+    run['started_at'] = start_time
+    monitor = ProcessMonitor(process)
+    tailers = _start_tailers(run, output_stream)
+    if on_start:
+        on_start(process, run)
+
+    try:
+        # The child is killed and reaped if it runs past the timeout
+        monitor.wait(timeout=timeout)
+    finally:
+        cgroup_oom = _release_run(run, tailers)
+    execution_time = time.time() - start_time
+    resources = rusage_to_dict(monitor.rusage, execution_time)
+
+    # Only the last lines are kept in the log, the full output stays on disk
+    stdout = tailers[0].tail()
+    stderr = tailers[1].tail()
+
+    termination = classify_termination(
+        process.returncode, run['memory_limit'],
+        max_rss_kb=resources['max_rss_kb'] if resources else None,
+        stderr=stderr, cgroup_oom=cgroup_oom
+    )
+    if termination:
+        logger.warning('Alignment %s ended with %s (limit %s bytes)', run['result_id'], termination,
+                       run['memory_limit'])
+
+    return {
+        'return_code': process.returncode,
+        'execution_time': execution_time,
+        'stdout': stdout,
+        'stderr': stderr,
+        'resources': resources,
+        'timeline': monitor.timeline(),
+        'termination': termination
+    }
+
+
+def follow_detached_run(run, pid, pid_start_time, output_stream=None):
+    """
+    Wait for a run started by an earlier process of the service and record it
+    Its exit code cannot be collected, so the result has a return_code of None
+    """
+    tailers = _start_tailers(run, output_stream)
+    deadline = run['started_at'] + MAX_EXECUTION_TIMEOUT
+    timed_out = False
+
+    try:
+        while is_same_process(pid, pid_start_time):
+            if not timed_out and time.time() >= deadline:
+                timed_out = True
+                kill_process(pid, pid_start_time)
+            time.sleep(DETACHED_POLL_INTERVAL)
+    finally:
+        _release_run(run, tailers)
+
+    if timed_out:
+        _remove_work_dir(_work_dir(run))
+        raise subprocess.TimeoutExpired(run['command'], MAX_EXECUTION_TIMEOUT)
+
+    execution_time = time.time() - run['started_at']
+    return _record_run(run, return_code=None, execution_time=execution_time, stdout=tailers[0].tail(),
+                       stderr=tailers[1].tail(), recovered=True)
+
+
+def abandon_run(run):
+    """Record a run whose process was lost and remove its partial output"""
+    Path(run['output_file']).unlink(missing_ok=True)
+    _release_run(run, [])
+
+    execution_time = time.time() - run['started_at'] if run.get('started_at') else None
+    logger.warning('Alignment %s was interrupted by a restart of the service', run['result_id'])
+    return _record_run(run, return_code=None, execution_time=execution_time,
+                       stdout=read_tail(Path(run['stdout_file'])), stderr=read_tail(Path(run['stderr_file'])),
+                       termination=INTERRUPTED, recovered=True)
+
+
+def _start_tailers(run, output_stream):
+    """Follow the stdout, stderr and verbose log files of a run"""
+    tailers = [
+        FileTailer(Path(run['stdout_file']), 'stdout', output_stream),
+        FileTailer(Path(run['stderr_file']), 'stderr', output_stream)
+    ]
+    if run['verbose_log_file']:
+        tailers.append(FileTailer(Path(run['verbose_log_file']), 'verbose', output_stream))
+    for tailer in tailers:
+        tailer.start()
+    return tailers
+
+
+def _release_run(run, tailers):
+    """
+    Stop following a finished run and remove its temporary files and cgroup
+    Returns True if the cgroup recorded an OOM kill
+    """
+    for tailer in tailers:
+        tailer.stop()
+    if run['binary_input'] != run['input_file']:
+        Path(run['binary_input']).unlink(missing_ok=True)
+
+    cgroup_oom = False
+    if run['memory_cgroup']:
+        memory_cgroup = Path(run['memory_cgroup'])
+        cgroup_oom = cgroup_oom_killed(memory_cgroup)
+        remove_cgroup(memory_cgroup)
+    return cgroup_oom
+
+
+def build_log(run, return_code, execution_time, stdout, stderr, resources=None, timeline=None,
+              termination=None, recovered=False):
+    """Log content of a finished run, as stored in its .log file"""
+    return {
+        'binary': run['binary'],
+        'command': ' '.join(run['command']),
+        'execution_time': execution_time,
+        'return_code': return_code,
+        'stdout': stdout,
+        'stderr': stderr,
+        'timestamp': run['timestamp'],
+        'input_file': run['input_file'],
+        'cost_type': run['cost_type'],
+        'num_threads': run['num_threads'],
+        'supports_threads': run['supports_threads'],
+        'cpu_set': run['cpu_set'],
+        'verbose': run['verbose'],
+        'verbose_log_file': run['verbose_log_file'],
+        'stdout_file': run['stdout_file'],
+        'stderr_file': run['stderr_file'],
+        'memory_limit': run['memory_limit'],
+        'memory_cgroup': run['memory_cgroup'] is not None,
+        'termination': termination,
+        'recovered': recovered,
+        'resources': resources,
+        'timeline': timeline
     }
 
-    with open(log_file, 'w') as f:
-        json.dump(log_content, f, indent=2)
 
-    # Read output if successful
-    output_content = ""
-    if output_file.exists():
-        with open(output_file, 'r') as f:
-            output_content = f.read()
+def record_result(result_id, log_content, work_dir, cache_key=None, cache_status=None):
+    """
+    Score and compress the files of a finished run in work_dir, publish them with
+    its log into RESULTS_DIR, index it and return the run's result
+    work_dir is removed afterwards
+    """
+    try:
+        _store_result(result_id, log_content, work_dir)
+    finally:
+        _remove_work_dir(work_dir)
+
+    with span('index'):
+        index_result(result_id, log_content)
+    if log_content['execution_time'] is not None:
+        metrics_service.ALIGNMENT_DURATION.observe(log_content['execution_time'], binary=log_content['binary'],
+                                                   cost_type=log_content['cost_type'])
 
-    # Read verbose log if it exists
-    verbose_log_content = ""
-    if verbose_log_file and verbose_log_file.exists():
-        with open(verbose_log_file, 'r') as f:
-            verbose_log_content = f.read()
+    # Only successful runs are worth reusing
+    output_file = _stored_output_file(result_id, log_content)
+    if cache_key and log_content['return_code'] == 0 and Path(output_file).exists():
+        cache_service.store(cache_key, result_id)
 
+    # Output and verbose log are not returned, they are fetched from the result on demand
     return {
         'success': True,
         'result_id': result_id,
-        'binary': binary_version,
-        'execution_time': execution_time,
-        'stdout': result.stdout,
-        'stderr': result.stderr,
-        'output_file': str(output_file),
-        'output_content': output_content,
-        'return_code': result.returncode,
-        'verbose': verbose,
-        'verbose_log_content': verbose_log_content
+        'binary': log_content['binary'],
+        'execution_time': log_content['execution_time'],
+        'stdout': log_content['stdout'],
+        'stderr': log_content['stderr'],
+        'output_file': output_file,
+        'return_code': log_content['return_code'],
+        'verbose': log_content['verbose'],
+        'resources': log_content['resources'],
+        'termination': log_content['termination'],
+        'recovered': log_content['recovered'],
+        'quality': log_content['quality'],
+        'cache': cache_status
     }
+
+
+def _store_result(result_id, log_content, work_dir):
+    """Score and compress the files of a run in work_dir, then publish them with its log"""
+    # Scored once here so that listings and comparisons never parse outputs
+    log_content['quality'] = None
+    if log_content['return_code'] in (0, None):
+        try:
+            with span('score'):
+                log_content['quality'] = quality_service.score_output(
+                    work_dir / f"{result_id}.fasta", log_content['input_file'], log_content['cost_type']
+                )
+        except (OSError, ValueError) as e:
+            logger.warning('Could not score the output of %s: %s', result_id, e)
+
+    # Input sizes let the run time predictor learn from this run
+    try:
+        log_content['input_features'] = get_input_features(log_content['input_file'])
+    except (OSError, ValueError) as e:
+        log_content['input_features'] = None
+        logger.warning('Could not measure the input of %s: %s', result_id, e)
+
+    with span('compress'):
+        log_content['artifacts'] = store_artifacts(result_id, work_dir)
+    # Point the log at the published files instead of the working directory
+    for name, key in ARTIFACT_LOG_KEYS.items():
+        entry = log_content['artifacts'].get(name)
+        log_content[key] = str(RESULTS_DIR / entry['file']) if entry else None
+
+    with span('publish'):
+        publish_result(result_id, log_content, work_dir)
+
+
+def run_artifacts(run):
+    """Paths of the files a run produced, by artifact name"""
+    paths = {
+        'output': Path(run['output_file']),
+        'stdout': Path(run['stdout_file']),
+        'stderr': Path(run['stderr_file'])
+    }
+    if run['verbose_log_file']:
+        paths['verbose'] = Path(run['verbose_log_file'])
+    return {name: path for name, path in paths.items() if path.exists()}
+
+
+def record_remote_result(log_content, artifacts, binary, input_file, cost_type, worker_id):
+    """
+    Record a run executed by a remote worker under a new result id
+    Only the REMOTE_LOG_FIELDS of the reported log are kept; binary, input_file and
+    cost_type are those of the leased job. artifacts maps artifact names to the
+    uploaded files, which are moved into a working directory and published from
+    there like local runs. Raises ValueError if the log is malformed
+    """
+    log_content = sanitize_remote_log(log_content)
+    result_id, timestamp = new_result_id(binary)
+    work_dir = SCRATCH_DIR / result_id
+    work_dir.mkdir(parents=True)
+    try:
+        for name, path in artifacts.items():
+            move_file(path, work_dir / f"{result_id}{RESULT_ARTIFACTS[name]}")
+    except BaseException:
+        _remove_work_dir(work_dir)
+        raise
+
+    log_content.update({
+        'binary': binary,
+        'timestamp': timestamp,
+        'input_file': str(input_file),
+        'cost_type': cost_type,
+        'cpu_set': None,
+        'verbose_log_file': None,
+        'stdout_file': None,
+        'stderr_file': None,
+        'recovered': False,
+        'worker': worker_id
+    })
+    return record_result(result_id, log_content, work_dir)
+
+
+def sanitize_remote_log(log_content):
+    """The REMOTE_LOG_FIELDS of a log reported by a worker, raising ValueError if one is malformed"""
+    if not isinstance(log_content, dict):
+        raise ValueError('Invalid log')
+    sanitized = {}
+    for name, types in REMOTE_LOG_FIELDS.items():
+        sanitized[name] = _checked(name, log_content.get(name), types)
+
+    if sanitized['termination'] not in (None, KILLED_OOM, MEMORY_LIMIT_EXCEEDED):
+        raise ValueError('Invalid termination in the log')
+    if sanitized['resources'] is not None:
+        sanitized['resources'] = {
+            name: _checked(name, sanitized['resources'].get(name), _NUMBER + (type(None),))
+            for name in REMOTE_RESOURCE_FIELDS
+        }
+    if sanitized['timeline'] is not None:
+        timeline = sanitized['timeline']
+        samples = _checked('samples', timeline.get('samples'), (list,))
+        for sample in samples:
+            for value in _checked('samples', sample, (list,)):
+                _checked('samples', value, _NUMBER + (type(None),))
+        sanitized['timeline'] = {
+            'interval': _checked('interval', timeline.get('interval'), _NUMBER),
+            'columns': ['elapsed', 'rss_kb', 'cpu_percent'],
+            'samples': samples
+        }
+    return sanitized
+
+
+def _checked(name, value, types):
+    """value if it is of one of types (bool only if listed), else ValueError"""
+    if (isinstance(value, bool) and bool not in types) or not isinstance(value, types):
+        raise ValueError(f'Invalid {name} in the log')
+    return value
+
+
+def _stored_output_file(result_id, log_content):
+    """Path of the stored output file of a result, compressed or not"""
+    output = (log_content.get('artifacts') or {}).get('output')
+    return str(RESULTS_DIR / (output['file'] if output else f"{result_id}.fasta"))
+
+
+def _record_run(run, **outcome):
+    """Record a run executed by this host"""
+    return record_result(run['result_id'], build_log(run, **outcome), _work_dir(run), cache_key=run['cache_key'],
+                         cache_status=run['cache'])
+
+
+def _work_dir(run):
+    """Directory holding the files of a run; runs prepared before working directories wrote into RESULTS_DIR"""
+    return Path(run['scratch_dir']) if run.get('scratch_dir') else RESULTS_DIR
+
+
+def _remove_work_dir(work_dir):
+    """Remove the working directory of a run, never RESULTS_DIR itself"""
+    if work_dir != RESULTS_DIR:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def clean_scratch(keep=()):
+    """Remove the working directories left in SCRATCH_DIR by runs that are gone, except those in keep"""
+    if not SCRATCH_DIR.exists():
+        return
+    keep = {Path(path) for path in keep}
+    for entry in SCRATCH_DIR.iterdir():
+        if entry.is_dir() and entry not in keep:
+            shutil.rmtree(entry, ignore_errors=True)
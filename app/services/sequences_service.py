@@ -3,13 +3,19 @@ Sequence management service
 Handles scanning and organizing sequence files
 """
 
+import time
 from app.config import SOURCES
-from app.utils.filesystem import scan_directory_recursively
+from app.services import metrics_service
+from app.services.catalog_service import get_catalog_structure
+from app.utils.profiling import span
 
 
 def scan_all_sequences():
     """Scan all sequence sources and return organized structure"""
+    started = time.perf_counter()
     all_sequences = {}
+    with span('scan'):
+        catalog = get_catalog_structure()
 
     for source_key, source_info in SOURCES.items():
         source_path = source_info['path']
@@ -24,11 +30,12 @@ def scan_all_sequences():
             'categories': {}
         }
 
-        # Scan the source directory
-        categories = scan_directory_recursively(source_path)
+        # Directory structure comes from the sequence catalog
+        categories = catalog.get(source_key)
 
         if categories:
             source_structure['categories'] = categories
             all_sequences[source_key] = source_structure
 
+    metrics_service.SEQUENCE_SCAN_DURATION.observe(time.perf_counter() - started, operation='listing')
     return all_sequences
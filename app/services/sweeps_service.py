@@ -0,0 +1,283 @@
+"""
+Thread-scaling sweep service
+Runs a PA-Star binary on one input across thread counts and builds its scaling curve
+"""
+
+import json
+import re
+import statistics
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from app.config import (SWEEPS_DIR, SWEEP_REPETITIONS, SWEEP_WARMUP, SWEEP_SATURATION_TOLERANCE, MAX_FINISHED_SWEEPS,
+                        LOCAL_EXECUTION)
+from app.services import cores_service
+from app.services.benchmarks_service import measure_run, iqr
+from app.services.binaries_service import get_binary_path
+from app.services.jobs_service import cancel_job, STATUS_DONE as JOB_STATUS_DONE
+
+# Create sweeps directory if it doesn't exist
+SWEEPS_DIR.mkdir(parents=True, exist_ok=True)
+
+# Sweep states
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+
+_sweeps = {}
+_lock = threading.Lock()
+
+
+class Sweep:
+    """Measurements of one binary and input at several thread counts"""
+
+    def __init__(self, binary_name, file_path, cost_type, thread_counts, repetitions, warmup):
+        self.id = uuid.uuid4().hex
+        self.binary_name = binary_name
+        self.file_path = file_path
+        self.cost_type = cost_type
+        self.thread_counts = thread_counts
+        self.repetitions = repetitions
+        self.warmup = warmup
+        self.runs = []
+        self.status = STATUS_RUNNING
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.current_job_id = None
+        self.cancelled = False
+
+    def to_dict(self, include_runs=True):
+        """Serializable view of the sweep with its scaling curve"""
+        curve = scaling_curve(self.runs, self.thread_counts)
+        sweep = {
+            'sweep_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'binary_name': self.binary_name,
+            'file_path': str(self.file_path),
+            'cost_type': self.cost_type,
+            'thread_counts': self.thread_counts,
+            'repetitions': self.repetitions,
+            'warmup': self.warmup,
+            'progress': {
+                'total': len(self.thread_counts) * self.repetitions,
+                'completed': len(self.runs)
+            },
+            'curve': curve,
+            'saturation_threads': saturation_point(curve)
+        }
+        if include_runs:
+            sweep['runs'] = [dict(run) for run in self.runs]
+        return sweep
+
+
+def default_thread_counts():
+    """1, 2, 4, ... up to the number of cores alignments may use, which is always included"""
+    total = cores_service.get_total_cores()
+    counts = []
+    count = 1
+    while count < total:
+        counts.append(count)
+        count *= 2
+    counts.append(total)
+    return counts
+
+
+def create_sweep(binary_name, file_path, cost_type='PAM250', thread_counts=None, repetitions=SWEEP_REPETITIONS,
+                 warmup=SWEEP_WARMUP):
+    """
+    Validate a sweep request and start running it in the background
+    The 1-thread run is always measured, it is the reference of the speedups
+    Returns the sweep as a dict
+    """
+    if not LOCAL_EXECUTION:
+        raise ValueError('Sweeps need LOCAL_EXECUTION: their exclusive runs never go to workers')
+    _, supports_threads = get_binary_path(binary_name=binary_name)
+    if not supports_threads:
+        raise ValueError(f'Binary {binary_name} does not support threads')
+
+    file_path = Path(file_path)
+    if not file_path.exists():
+        raise FileNotFoundError(f'File not found: {file_path}')
+    if repetitions < 1:
+        raise ValueError('repetitions must be positive')
+    if warmup < 0:
+        raise ValueError('warmup must not be negative')
+
+    total = cores_service.get_total_cores()
+    try:
+        thread_counts = sorted({1, *(int(count) for count in thread_counts)}) if thread_counts \
+            else default_thread_counts()
+    except (TypeError, ValueError):
+        raise ValueError('Thread counts must be integers')
+    if thread_counts[0] < 1 or thread_counts[-1] > total:
+        # Oversubscribed points would measure contention instead of scaling
+        raise ValueError(f'Thread counts must be between 1 and {total}')
+
+    sweep = Sweep(binary_name, file_path, cost_type, thread_counts, repetitions, warmup)
+    with _lock:
+        _sweeps[sweep.id] = sweep
+        _prune_finished_sweeps()
+
+    threading.Thread(target=_execute, args=(sweep,), daemon=True).start()
+    return get_sweep(sweep.id)
+
+
+def get_sweep(sweep_id):
+    """Get the state of a running sweep, or the stored report of a finished one"""
+    with _lock:
+        sweep = _sweeps.get(sweep_id)
+        if sweep is not None:
+            return sweep.to_dict()
+
+    report_file = _report_path(sweep_id)
+    if not report_file.exists():
+        raise KeyError(sweep_id)
+    with open(report_file, 'r') as f:
+        return json.load(f)
+
+
+def list_sweeps():
+    """List running and stored sweeps without their runs, newest first"""
+    sweeps = {}
+    for report_file in SWEEPS_DIR.glob('*.json'):
+        try:
+            with open(report_file, 'r') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        report.pop('runs', None)
+        sweeps[report['sweep_id']] = report
+
+    with _lock:
+        for sweep in _sweeps.values():
+            sweeps[sweep.id] = sweep.to_dict(include_runs=False)
+
+    return sorted(sweeps.values(), key=lambda x: x['created_at'], reverse=True)
+
+
+def cancel_sweep(sweep_id):
+    """Stop a running sweep after cancelling its current measurement"""
+    with _lock:
+        sweep = _sweeps.get(sweep_id)
+        if sweep is None:
+            raise KeyError(sweep_id)
+        sweep.cancelled = True
+        job_id = sweep.current_job_id
+
+    if job_id is not None:
+        try:
+            cancel_job(job_id)
+        except KeyError:
+            pass
+
+    return get_sweep(sweep_id)
+
+
+def scaling_curve(runs, thread_counts):
+    """
+    Median wall time of each thread count with its speedup and parallel
+    efficiency relative to the 1-thread median
+    """
+    curve = []
+    for num_threads in thread_counts:
+        point_runs = [run for run in runs if run['num_threads'] == num_threads]
+        if not point_runs:
+            continue
+
+        ok = [run for run in point_runs if run['status'] == JOB_STATUS_DONE and run['return_code'] == 0]
+        times = [run['wall_time'] for run in ok if run['wall_time'] is not None]
+        cpu_times = [run['cpu_time'] for run in ok if run['cpu_time'] is not None]
+        rss = [run['max_rss_kb'] for run in ok if run['max_rss_kb'] is not None]
+
+        curve.append({
+            'num_threads': num_threads,
+            'runs': len(point_runs),
+            'failed': len(point_runs) - len(ok),
+            'wall_time_median': statistics.median(times) if times else None,
+            'wall_time_iqr': iqr(times),
+            'cpu_time_median': statistics.median(cpu_times) if cpu_times else None,
+            'max_rss_kb_median': statistics.median(rss) if rss else None,
+            'speedup': None,
+            'efficiency': None
+        })
+
+    reference = next((point['wall_time_median'] for point in curve if point['num_threads'] == 1), None)
+    for point in curve:
+        if reference and point['wall_time_median']:
+            point['speedup'] = reference / point['wall_time_median']
+            point['efficiency'] = point['speedup'] / point['num_threads']
+
+    return curve
+
+
+def saturation_point(curve):
+    """
+    Smallest thread count reaching the best speedup within
+    SWEEP_SATURATION_TOLERANCE, i.e. where the curve flattens
+    """
+    points = [point for point in curve if point['speedup'] is not None]
+    if not points:
+        return None
+
+    best = max(point['speedup'] for point in points)
+    for point in points:
+        if point['speedup'] >= best * (1 - SWEEP_SATURATION_TOLERANCE):
+            return point['num_threads']
+
+
+def _execute(sweep):
+    """Measure every thread count in turn, each run as an exclusive job"""
+    try:
+        for num_threads in sweep.thread_counts:
+            for repetition in range(-sweep.warmup, sweep.repetitions):
+                if sweep.cancelled:
+                    return
+
+                run = measure_run(
+                    sweep.binary_name, sweep.file_path, sweep.cost_type, num_threads,
+                    on_submit=lambda job_id: _set_current_job(sweep, job_id)
+                )
+                if repetition >= 0:
+                    run['repetition'] = repetition + 1
+                    with _lock:
+                        sweep.runs.append(run)
+    finally:
+        _finish(sweep)
+
+
+def _set_current_job(sweep, job_id):
+    """Remember the job being measured so the sweep can be cancelled"""
+    with _lock:
+        sweep.current_job_id = job_id
+
+
+def _finish(sweep):
+    """Mark a sweep as finished and store its report"""
+    with _lock:
+        sweep.status = STATUS_CANCELLED if sweep.cancelled else STATUS_DONE
+        sweep.finished_at = datetime.now().isoformat()
+        sweep.current_job_id = None
+        report = sweep.to_dict()
+
+    with open(_report_path(sweep.id), 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def _report_path(sweep_id):
+    """Path of the stored report of a sweep"""
+    if not re.fullmatch(r'[0-9a-f]{32}', sweep_id):
+        raise KeyError(sweep_id)
+    return SWEEPS_DIR / f'{sweep_id}.json'
+
+
+def _prune_finished_sweeps():
+    """Forget the oldest finished sweeps kept in memory, their reports stay on disk (lock must be held)"""
+    finished = [sweep for sweep in _sweeps.values() if sweep.finished_at is not None]
+    excess = len(finished) - MAX_FINISHED_SWEEPS
+    if excess > 0:
+        finished.sort(key=lambda x: x.finished_at)
+        for sweep in finished[:excess]:
+            del _sweeps[sweep.id]
@@ -0,0 +1,196 @@
+"""
+Remote worker service
+Pulls jobs from the queue of an MSA app over HTTP and runs them with this host's binaries
+"""
+
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from app.config import WORKER_TOKEN, WORKER_POLL_INTERVAL, WORKER_HEARTBEAT_INTERVAL, MAX_EXECUTION_TIMEOUT
+from app.services import cores_service, memory_service
+from app.services.binaries_service import get_available_binaries, get_binary_path
+from app.services.runner_service import prepare_run, execute_run, build_log, run_artifacts
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a request to the server is given up
+REQUEST_TIMEOUT = 60
+
+
+class _Server:
+    """Minimal client of the worker API of an MSA app"""
+
+    def __init__(self, url, token):
+        self.url = url.rstrip('/')
+        self.token = token
+
+    def request(self, method, path, payload=None, body=None, params=None, size=None):
+        """Send a request and return the open response"""
+        url = self.url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = {}
+        if self.token:
+            headers['X-Worker-Token'] = self.token
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return urllib.request.urlopen(urllib.request.Request(url, data=body, method=method, headers=headers),
+                                      timeout=REQUEST_TIMEOUT)
+
+    def post(self, path, payload):
+        """POST a JSON payload, returning the decoded answer or None if it is empty"""
+        with self.request('POST', path, payload=payload) as response:
+            content = response.read()
+        return json.loads(content) if content else None
+
+
+class _Heartbeat:
+    """Keeps the lease on a job and kills its alignment when the job is cancelled or lost"""
+
+    def __init__(self, server, lease):
+        self.server = server
+        self.lease = lease
+        self.process = None
+        self.cancelled = False
+        self.lost = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def attach(self, process, run):
+        """on_start callback of execute_run"""
+        with self._lock:
+            self.process = process
+            if self.cancelled or self.lost:
+                process.kill()
+
+    def _run(self):
+        interval = self.lease.get('heartbeat_interval', WORKER_HEARTBEAT_INTERVAL)
+        while not self._stop.wait(interval):
+            try:
+                answer = self.server.post(f"/api/workers/jobs/{self.lease['job_id']}/heartbeat",
+                                          {'lease_id': self.lease['lease_id']})
+                stop = answer['cancel']
+                if stop:
+                    self.cancelled = True
+            except urllib.error.HTTPError as e:
+                if e.code not in (404, 409):
+                    logger.warning('Heartbeat for job %s failed: %s', self.lease['job_id'], e)
+                    continue
+                logger.warning('Lost the lease on job %s', self.lease['job_id'])
+                self.lost = stop = True
+            except OSError as e:
+                # Keep running: the lease survives short outages of the server
+                logger.warning('Heartbeat for job %s failed: %s', self.lease['job_id'], e)
+                continue
+
+            if stop:
+                with self._lock:
+                    if self.process is not None and self.process.returncode is None:
+                        self.process.kill()
+                return
+
+
+def run_worker(server_url, worker_id=None, slots=1, token=WORKER_TOKEN, poll_interval=WORKER_POLL_INTERVAL):
+    """
+    Run jobs of the server at server_url until interrupted, slots of them at a time
+    Each slot leases jobs for the binaries of this host's BIN_DIR
+    """
+    server = _Server(server_url, token)
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+
+    threads = []
+    for slot in range(slots):
+        slot_id = worker_id if slots == 1 else f'{worker_id}/{slot + 1}'
+        thread = threading.Thread(target=_work, args=(server, slot_id, slots, poll_interval), daemon=True)
+        thread.start()
+        threads.append(thread)
+    logger.info('Worker %s running %d slot(s) for %s', worker_id, slots, server.url)
+
+    for thread in threads:
+        thread.join()
+
+
+def _work(server, worker_id, slots, poll_interval):
+    """Lease and run jobs one after the other"""
+    while True:
+        binaries = [binary['name'] for group in get_available_binaries().values() for binary in group]
+        try:
+            lease = server.post('/api/workers/lease', {'worker_id': worker_id, 'binaries': binaries})
+        except OSError as e:
+            logger.warning('Could not lease a job from %s: %s', server.url, e)
+            lease = None
+
+        if lease is None:
+            time.sleep(poll_interval)
+            continue
+
+        try:
+            _run_lease(server, lease, slots)
+        except Exception:
+            logger.exception('Job %s could not be reported', lease['job_id'])
+
+
+def _run_lease(server, lease, slots):
+    """Run a leased job in a scratch directory and report its log and files"""
+    job_path = f"/api/workers/jobs/{lease['job_id']}"
+    params = {'lease_id': lease['lease_id']}
+    scratch = Path(tempfile.mkdtemp(prefix='msa_worker_'))
+    heartbeat = _Heartbeat(server, lease)
+    heartbeat.start()
+
+    try:
+        try:
+            input_file = scratch / lease['file_name']
+            with server.request('GET', f'{job_path}/input', params=params) as response, open(input_file, 'wb') as f:
+                shutil.copyfileobj(response, f)
+
+            binary_path, supports_threads = get_binary_path(binary_name=lease['binary'])
+            # 'auto' shares the host's cores between the slots
+            num_threads = lease['num_threads'] or max(1, cores_service.get_total_cores() // slots)
+            run = prepare_run(binary_path, supports_threads, input_file, lease['cost_type'], num_threads,
+                              lease['verbose'], scratch,
+                              memory_limit=memory_service.get_job_memory_cap(lease.get('memory_estimate')))
+            outcome = execute_run(run, on_start=heartbeat.attach)
+        except subprocess.TimeoutExpired:
+            report = {'error': f'Execution timeout ({MAX_EXECUTION_TIMEOUT // 60} minutes)'}
+        except Exception as e:
+            report = {'error': str(e)}
+        else:
+            report = {'log': build_log(run, **outcome)}
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.lost:
+            return
+
+        if 'log' in report:
+            for name, path in run_artifacts(run).items():
+                with open(path, 'rb') as f:
+                    server.request('PUT', f'{job_path}/artifacts/{name}', body=f, params=params,
+                                   size=path.stat().st_size).close()
+
+        server.post(f'{job_path}/complete', {'lease_id': lease['lease_id'], **report})
+        logger.info('Job %s reported', lease['job_id'])
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
@@ -0,0 +1,240 @@
+"""
+Alignment parsing and scoring utilities
+Column-major alignments with sum-of-pairs, gap and reference (BAliBASE SP/TC) measures
+"""
+
+import re
+from collections import Counter
+from app.utils.fasta import iter_fasta
+
+GAP_CHARS = b'-.'
+GAP_RUN = re.compile(rb'[-.]+')
+
+# PAM250 log-odds scores, in the order of PAM250_ALPHABET
+PAM250_ALPHABET = b'ARNDCQEGHILKMFPSTWYVBZX'
+PAM250_ROWS = [
+    [2, -2, 0, 0, -2, 0, 0, 1, -1, -1, -2, -1, -1, -3, 1, 1, 1, -6, -3, 0, 0, 0, 0],
+    [-2, 6, 0, -1, -4, 1, -1, -3, 2, -2, -3, 3, 0, -4, 0, 0, -1, 2, -4, -2, -1, 0, -1],
+    [0, 0, 2, 2, -4, 1, 1, 0, 2, -2, -3, 1, -2, -3, 0, 1, 0, -4, -2, -2, 2, 1, 0],
+    [0, -1, 2, 4, -5, 2, 3, 1, 1, -2, -4, 0, -3, -6, -1, 0, 0, -7, -4, -2, 3, 3, -1],
+    [-2, -4, -4, -5, 12, -5, -5, -3, -3, -2, -6, -5, -5, -4, -3, 0, -2, -8, 0, -2, -4, -5, -3],
+    [0, 1, 1, 2, -5, 4, 2, -1, 3, -2, -2, 1, -1, -5, 0, -1, -1, -5, -4, -2, 1, 3, -1],
+    [0, -1, 1, 3, -5, 2, 4, 0, 1, -2, -3, 0, -2, -5, -1, 0, 0, -7, -4, -2, 3, 3, -1],
+    [1, -3, 0, 1, -3, -1, 0, 5, -2, -3, -4, -2, -3, -5, 0, 1, 0, -7, -5, -1, 0, 0, -1],
+    [-1, 2, 2, 1, -3, 3, 1, -2, 6, -2, -2, 0, -2, -2, 0, -1, -1, -3, 0, -2, 1, 2, -1],
+    [-1, -2, -2, -2, -2, -2, -2, -3, -2, 5, 2, -2, 2, 1, -2, -1, 0, -5, -1, 4, -2, -2, -1],
+    [-2, -3, -3, -4, -6, -2, -3, -4, -2, 2, 6, -3, 4, 2, -3, -3, -2, -2, -1, 2, -3, -3, -1],
+    [-1, 3, 1, 0, -5, 1, 0, -2, 0, -2, -3, 5, 0, -5, -1, 0, 0, -3, -4, -2, 1, 0, -1],
+    [-1, 0, -2, -3, -5, -1, -2, -3, -2, 2, 4, 0, 6, 0, -2, -2, -1, -4, -2, 2, -2, -2, -1],
+    [-3, -4, -3, -6, -4, -5, -5, -5, -2, 1, 2, -5, 0, 9, -5, -3, -3, 0, 7, -1, -4, -5, -2],
+    [1, 0, 0, -1, -3, 0, -1, 0, 0, -2, -3, -1, -2, -5, 6, 1, 0, -6, -5, -1, -1, 0, -1],
+    [1, 0, 1, 0, 0, -1, 0, 1, -1, -1, -3, 0, -2, -3, 1, 2, 1, -2, -3, -1, 0, 0, 0],
+    [1, -1, 0, 0, -2, -1, 0, 0, -1, 0, -2, 0, -1, -3, 0, 1, 3, -5, -3, 0, 0, -1, 0],
+    [-6, 2, -4, -7, -8, -5, -7, -7, -3, -5, -2, -3, -4, 0, -6, -2, -5, 17, 0, -6, -5, -6, -4],
+    [-3, -4, -2, -4, 0, -4, -4, -5, 0, -1, -1, -4, -2, 7, -5, -3, -3, 0, 10, -2, -3, -4, -2],
+    [0, -2, -2, -2, -2, -2, -2, -1, -2, 4, 2, -2, 2, -1, -1, -1, 0, -6, -2, 4, -2, -2, -1],
+    [0, -1, 2, 3, -4, 1, 3, 0, 1, -2, -3, 1, -2, -4, -1, 0, 0, -5, -3, -2, 3, 2, -1],
+    [0, 0, 1, 3, -5, 3, 3, 0, 2, -2, -3, 0, -2, -5, 0, 0, -1, -6, -4, -2, 2, 3, -1],
+    [0, -1, 0, -1, -3, -1, -1, -1, -1, -1, -1, -1, -1, -2, -1, 0, 0, -4, -2, -1, -1, -1, -1]
+]
+
+# Scoring of the cost types of the binaries: substitution scores and the linear score of a residue-gap pair
+SCORING_SCHEMES = {
+    'PAM250': {
+        'scores': {(a, b): PAM250_ROWS[i][j]
+                   for i, a in enumerate(PAM250_ALPHABET) for j, b in enumerate(PAM250_ALPHABET)},
+        'unknown': ord('X'),
+        'gap': -8
+    },
+    'NUC': {
+        'scores': {(a, b): 1 if a == b else -1 for a in b'ACGTUN' for b in b'ACGTUN'},
+        'unknown': ord('N'),
+        'gap': -2
+    }
+}
+
+_UPPERCASE = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_LOWERCASE = frozenset(b'abcdefghijklmnopqrstuvwxyz')
+_UPPER_LETTERS = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+
+class Alignment:
+    """Aligned sequences stored column by column, each column one byte per sequence"""
+
+    def __init__(self, names, rows):
+        lengths = {len(row) for row in rows}
+        if len(lengths) > 1:
+            raise ValueError('Aligned sequences have different lengths')
+        self.names = names
+        self.columns = [bytes(column) for column in zip(*rows)]
+
+    @classmethod
+    def from_fasta(cls, file_path):
+        """Read an aligned FASTA file"""
+        names = []
+        rows = []
+        for record in iter_fasta(file_path):
+            names.append(record['header'].split()[0] if record['header'].strip() else '')
+            rows.append(record['sequence'].encode('ascii', 'replace'))
+        return cls(names, rows)
+
+    @classmethod
+    def from_msf(cls, file_path):
+        """Read an MSF (GCG) file, the format of the BAliBASE reference alignments"""
+        names = []
+        rows = {}
+        in_alignment = False
+        with open(file_path, 'r', errors='replace') as f:
+            for line in f:
+                if not in_alignment:
+                    stripped = line.strip()
+                    if stripped.startswith('Name:'):
+                        names.append(stripped.split()[1])
+                    elif stripped.startswith('//'):
+                        in_alignment = True
+                        rows = {name: [] for name in names}
+                    continue
+
+                fields = line.split()
+                if fields and fields[0] in rows:
+                    rows[fields[0]].append(''.join(fields[1:]))
+
+        return cls(names, [''.join(rows[name]).encode('ascii', 'replace') for name in names])
+
+    @property
+    def num_sequences(self):
+        return len(self.names)
+
+    @property
+    def length(self):
+        return len(self.columns)
+
+    def rows(self):
+        """Sequences with their gaps, one bytes per sequence"""
+        return [bytes(row) for row in zip(*self.columns)] if self.columns else [b''] * self.num_sequences
+
+    def residues(self):
+        """Sequences without gaps, uppercased"""
+        return [row.translate(_UPPERCASE, GAP_CHARS) for row in self.rows()]
+
+
+def sum_of_pairs(alignment, cost_type):
+    """
+    Sum-of-pairs score: substitution scores of every pair of residues in a
+    column plus a linear penalty for every residue-gap pair
+    Identical columns are scored once; a column is scored from its residue
+    counts, so the work grows with the alphabet, not with the sequences
+    """
+    scheme = SCORING_SCHEMES.get(cost_type)
+    if scheme is None:
+        raise ValueError(f'No scoring scheme for cost type {cost_type}')
+    scores = scheme['scores']
+    known = {a for a, _ in scores}
+
+    total = 0
+    for column, repeats in Counter(alignment.columns).items():
+        counts = Counter(column.translate(_UPPERCASE))
+        gaps = sum(counts.pop(gap, 0) for gap in GAP_CHARS)
+
+        residues = Counter()
+        for residue, count in counts.items():
+            residues[residue if residue in known else scheme['unknown']] += count
+        items = list(residues.items())
+
+        score = gaps * sum(residues.values()) * scheme['gap']
+        for i, (a, count_a) in enumerate(items):
+            score += count_a * (count_a - 1) // 2 * scores[a, a]
+            for b, count_b in items[i + 1:]:
+                score += count_a * count_b * scores[a, b]
+        total += score * repeats
+    return total
+
+
+def column_statistics(alignment):
+    """Column identity and gap statistics of an alignment"""
+    identical = 0
+    gapped_columns = 0
+    gap_count = 0
+    for column in alignment.columns:
+        upper = column.translate(_UPPERCASE)
+        gaps = sum(upper.count(gap) for gap in GAP_CHARS)
+        gap_count += gaps
+        if gaps:
+            gapped_columns += 1
+        elif upper.count(upper[:1]) == len(upper):
+            identical += 1
+
+    # Gap openings: runs of gaps within each sequence
+    gap_openings = sum(len(GAP_RUN.findall(row)) for row in alignment.rows())
+    cells = alignment.length * alignment.num_sequences
+    return {
+        'length': alignment.length,
+        'num_sequences': alignment.num_sequences,
+        'column_identity': identical / alignment.length if alignment.length else None,
+        'gap_fraction': gap_count / cells if cells else None,
+        'gapped_columns': gapped_columns,
+        'gap_openings': gap_openings,
+        'mean_gap_length': gap_count / gap_openings if gap_openings else None
+    }
+
+
+def compare_to_reference(alignment, reference):
+    """
+    BAliBASE scores of an alignment against a reference alignment
+    SP is the share of residue pairs aligned in the reference that the
+    alignment aligns too, TC the share of reference columns it reproduces
+    entirely. When the reference marks its core blocks in uppercase only
+    fully uppercase columns count. Sequences are matched by their residues,
+    so their names may differ; returns None if fewer than two match
+    """
+    available = {}
+    for index, residues in enumerate(alignment.residues()):
+        available.setdefault(residues, []).append(index)
+
+    pairs = []
+    for ref_index, residues in enumerate(reference.residues()):
+        if available.get(residues):
+            pairs.append((ref_index, available[residues].pop(0)))
+    if len(pairs) < 2:
+        return None
+
+    # Column of every residue of the matched sequences in the alignment
+    rows = alignment.rows()
+    positions = [
+        [column for column, char in enumerate(rows[index]) if char not in GAP_CHARS]
+        for _, index in pairs
+    ]
+    reference_rows = reference.rows()
+    core_only = any(char in _LOWERCASE for row in reference_rows for char in row) and \
+        any(char in _UPPER_LETTERS for row in reference_rows for char in row)
+
+    consumed = [0] * len(pairs)
+    reference_pairs = aligned_pairs = columns = identical_columns = 0
+    for column in reference.columns:
+        groups = Counter()
+        core = True
+        for k, (ref_index, _) in enumerate(pairs):
+            char = column[ref_index]
+            if char in GAP_CHARS:
+                continue
+            if char in _LOWERCASE:
+                core = False
+            groups[positions[k][consumed[k]]] += 1
+            consumed[k] += 1
+
+        residues = sum(groups.values())
+        if residues < 2 or (core_only and not core):
+            continue
+        columns += 1
+        reference_pairs += residues * (residues - 1) // 2
+        aligned_pairs += sum(count * (count - 1) // 2 for count in groups.values())
+        if len(groups) == 1:
+            identical_columns += 1
+
+    return {
+        'sp': aligned_pairs / reference_pairs if reference_pairs else None,
+        'tc': identical_columns / columns if columns else None,
+        'columns': columns,
+        'sequences': len(pairs),
+        'core_only': core_only
+    }
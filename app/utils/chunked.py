@@ -0,0 +1,79 @@
+"""
+Chunked gzip storage
+Files compressed as independent gzip members of a fixed uncompressed size, readable at any offset
+"""
+
+import gzip
+
+# Bytes handed out at a time when reading plain files
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def compress_file(source, target, chunk_size, level=6):
+    """
+    Compress source into target, one gzip member per chunk_size bytes
+    The members concatenate to a valid .gz file; the returned index locates
+    each of them so a range can be read by decompressing only its chunks
+    """
+    offsets = []
+    size = 0
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk and offsets:
+                break
+            offsets.append(dst.tell())
+            dst.write(gzip.compress(chunk, compresslevel=level, mtime=0))
+            size += len(chunk)
+            if not chunk:
+                break
+        compressed_size = dst.tell()
+
+    return {
+        'size': size,
+        'compressed_size': compressed_size,
+        'chunk_size': chunk_size,
+        'offsets': offsets
+    }
+
+
+class ChunkedFile:
+    """Random access to the uncompressed content of a chunked gzip file, or of a plain file if index is None"""
+
+    def __init__(self, path, index=None):
+        self.path = path
+        self.index = index
+        self.size = index['size'] if index else path.stat().st_size
+
+    def iter_range(self, start=0, end=None):
+        """Yield the bytes from start to end (exclusive), one chunk at a time"""
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return
+
+        with open(self.path, 'rb') as f:
+            if self.index is None:
+                f.seek(start)
+                position = start
+                while position < end:
+                    block = f.read(min(READ_BLOCK_SIZE, end - position))
+                    if not block:
+                        return
+                    position += len(block)
+                    yield block
+                return
+
+            chunk_size = self.index['chunk_size']
+            offsets = self.index['offsets'] + [self.index['compressed_size']]
+            for number in range(start // chunk_size, len(offsets) - 1):
+                chunk_start = number * chunk_size
+                if chunk_start >= end:
+                    return
+                f.seek(offsets[number])
+                chunk = gzip.decompress(f.read(offsets[number + 1] - offsets[number]))
+                yield chunk[max(start - chunk_start, 0):end - chunk_start]
+
+    def read(self, start=0, length=None):
+        """Bytes from start, at most length of them"""
+        end = None if length is None else start + length
+        return b''.join(self.iter_range(start, end))
@@ -0,0 +1,66 @@
+"""
+Database utilities
+Shared SQLite connection handling for the application's metadata stores
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from app.config import DATA_DIR, DATABASE_PATH
+
+# Create data directory if it doesn't exist
+DATA_DIR.mkdir(exist_ok=True)
+
+_initialized_schemas = set()
+
+
+def connect():
+    """Open a new connection to the application database"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers work while a writer is active
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+@contextmanager
+def transaction(schema=None):
+    """
+    Yield a connection inside a transaction, committing on success
+    If schema is given, it is created on first use
+    """
+    conn = connect()
+    try:
+        if schema and schema not in _initialized_schemas:
+            conn.executescript(schema)
+            _initialized_schemas.add(schema)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def ensure_schema_version(name, version, tables):
+    """
+    Drop the given tables when the stored schema version of name differs
+    Used for derived data that can simply be rebuilt after a layout change
+    """
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS schema_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+            row = conn.execute('SELECT version FROM schema_versions WHERE name = ?', (name,)).fetchone()
+            if row is not None and row['version'] == version:
+                return False
+
+            for table in tables:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            conn.execute(
+                'INSERT OR REPLACE INTO schema_versions (name, version) VALUES (?, ?)', (name, version)
+            )
+            _initialized_schemas.clear()
+            return True
+    finally:
+        conn.close()
@@ -2,73 +2,271 @@
 FASTA file parsing and analysis utilities
 """
 
+import bz2
+import gzip
+import io
+import shutil
+from collections import Counter
+from pathlib import Path
+from app.config import MAX_FASTA_FILE_SIZE, MAX_FASTA_DECOMPRESSED_SIZE, MAX_SEQUENCE_LENGTH
 
-def detect_sequence_type(sequence):
-    """Detect if sequence is protein or nucleotide"""
-    # Remove whitespace and convert to uppercase
-    seq = sequence.upper().replace(' ', '').replace('\n', '')
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
 
-    if not seq:
-        return 'Unknown'
 
-    # Count nucleotide and protein specific characters
-    nucleotide_chars = set('ATGCU')
-    protein_specific_chars = set('EFILPQZ')
+# Translation table folding lowercase residues to uppercase
+_UPPERCASE = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+WHITESPACE_CHARS = b' \t\r\n'
+
+NUCLEOTIDE_CHARS = b'ATGCU'
+PROTEIN_SPECIFIC_CHARS = b'EFILPQZ'
+GAP_CHARS = b'-.'
+NUCLEOTIDE_AMBIGUITY_CHARS = b'NRYKMSWBDHV'
+PROTEIN_AMBIGUITY_CHARS = b'BZJX'
+RESIDUE_CHARS = b'ABCDEFGHIJKLMNOPQRSTUVWXYZ*'
+
+
+def _normalize(sequence):
+    """Uppercase ASCII bytes of a sequence without whitespace, in a single translate pass"""
+    if isinstance(sequence, str):
+        sequence = sequence.encode('ascii', 'replace')
+    return sequence.translate(_UPPERCASE, WHITESPACE_CHARS)
+
 
-    total_chars = len(seq)
-    nucleotide_count = sum(1 for c in seq if c in nucleotide_chars)
-    protein_specific_count = sum(1 for c in seq if c in protein_specific_chars)
+def _count_chars(seq, chars):
+    """Number of bytes of seq that belong to chars"""
+    return len(seq) - len(seq.translate(None, chars))
 
+
+def _classify(seq):
+    """Type of a normalized, non-empty sequence"""
     # If has protein-specific amino acids, it's definitely protein
-    if protein_specific_count > 0:
+    if _count_chars(seq, PROTEIN_SPECIFIC_CHARS) > 0:
         return 'Proteína'
 
-    # If more than 95% are nucleotides (A, T, G, C, U, N), likely nucleotide
-    if nucleotide_count / total_chars > 0.95:
+    # If more than 95% are nucleotides (A, T, G, C, U), likely nucleotide
+    if _count_chars(seq, NUCLEOTIDE_CHARS) / len(seq) > 0.95:
         return 'Nucleotídeo'
 
     # Otherwise, likely protein (could have A, T, G, C which are also amino acids)
     return 'Proteína'
 
 
-def parse_fasta_file(file_path):
-    """Read and parse FASTA file, return list of sequences"""
-    sequences = []
-    current_seq = None
+def detect_sequence_type(sequence):
+    """Detect if sequence is protein or nucleotide"""
+    seq = _normalize(sequence)
+
+    if not seq:
+        return 'Unknown'
+
+    return _classify(seq)
+
+
+def sequence_composition(sequence):
+    """
+    Residue composition and type of a sequence
+    Returns type, residue counts, gap/ambiguity/other counts, per-residue
+    frequencies and, for nucleotides, GC content
+    """
+    seq = _normalize(sequence)
+    seq_type = _classify(seq) if seq else 'Unknown'
+
+    counts = {}
+    for char in RESIDUE_CHARS:
+        count = seq.count(char)
+        if count:
+            counts[chr(char)] = count
+
+    gaps = _count_chars(seq, GAP_CHARS)
+    composition = composition_from_counts(counts, seq_type)
+    composition['gaps'] = gaps
+    composition['other'] = len(seq) - gaps - sum(counts.values())
+    return composition
+
+
+def composition_from_counts(counts, seq_type):
+    """Derive frequencies, ambiguity count and GC content from residue counts"""
+    total = sum(counts.values())
+    ambiguity_chars = NUCLEOTIDE_AMBIGUITY_CHARS if seq_type == 'Nucleotídeo' else PROTEIN_AMBIGUITY_CHARS
+
+    composition = {
+        'type': seq_type,
+        'counts': counts,
+        'ambiguous': sum(counts.get(chr(char), 0) for char in ambiguity_chars),
+        'frequencies': {residue: count / total for residue, count in counts.items()} if total else {},
+        'gc_content': None
+    }
+
+    if seq_type == 'Nucleotídeo':
+        gc = counts.get('G', 0) + counts.get('C', 0)
+        acgtu = gc + counts.get('A', 0) + counts.get('T', 0) + counts.get('U', 0)
+        composition['gc_content'] = gc / acgtu if acgtu else None
+
+    return composition
+
+
+def get_compression(file_path):
+    """Return 'gzip', 'bz2' or None depending on the file's magic bytes"""
+    with open(file_path, 'rb') as f:
+        magic = f.read(3)
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic.startswith(BZIP2_MAGIC):
+        return 'bz2'
+    return None
 
-    with open(file_path, 'r') as f:
+
+class _LimitedReader(io.RawIOBase):
+    """Binary reader that fails once more than limit bytes were read"""
+
+    def __init__(self, raw, limit):
+        self._raw = raw
+        self._limit = limit
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        self._read += len(data)
+        if self._read > self._limit:
+            raise ValueError(f'Sequence file exceeds the size limit of {self._limit} bytes')
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def open_sequence_file(file_path):
+    """
+    Open a plain, gzip or bz2 FASTA file as text, enforcing the size limits
+    Raises ValueError if the file is too large
+    """
+    file_path = Path(file_path)
+    if file_path.stat().st_size > MAX_FASTA_FILE_SIZE:
+        raise ValueError(f'Sequence file exceeds the size limit of {MAX_FASTA_FILE_SIZE} bytes')
+
+    compression = get_compression(file_path)
+    if compression == 'gzip':
+        raw = gzip.open(file_path, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.open(file_path, 'rb')
+    else:
+        raw = open(file_path, 'rb')
+
+    limited = io.BufferedReader(_LimitedReader(raw, MAX_FASTA_DECOMPRESSED_SIZE))
+    return io.TextIOWrapper(limited, errors='replace')
+
+
+def iter_fasta(file_path):
+    """
+    Stream the records of a FASTA file one at a time
+    Yields dicts with 'header' and 'sequence'
+    """
+    header = None
+    chunks = []
+    length = 0
+
+    with open_sequence_file(file_path) as f:
         for line in f:
             line = line.strip()
             if line.startswith('>'):
-                if current_seq:
-                    sequences.append(current_seq)
-                current_seq = {
-                    'header': line[1:],
-                    'sequence': ''
-                }
-            elif current_seq is not None:
-                current_seq['sequence'] += line
+                if header is not None:
+                    yield {'header': header, 'sequence': ''.join(chunks)}
+                header = line[1:]
+                chunks = []
+                length = 0
+            elif header is not None and line:
+                length += len(line)
+                if length > MAX_SEQUENCE_LENGTH:
+                    raise ValueError(f'Sequence {header} exceeds the length limit of {MAX_SEQUENCE_LENGTH}')
+                chunks.append(line)
 
-        if current_seq:
-            sequences.append(current_seq)
+    if header is not None:
+        yield {'header': header, 'sequence': ''.join(chunks)}
 
-    return sequences
+
+def parse_fasta_file(file_path):
+    """Read and parse FASTA file, return list of sequences"""
+    return list(iter_fasta(file_path))
+
+
+def iter_fasta_summaries(file_path):
+    """
+    Stream per-record summaries of a FASTA file without keeping the residues
+    Yields dicts with 'header', 'length', 'type', residue 'counts', 'gaps',
+    'ambiguous' and 'gc_content'
+    """
+    for record in iter_fasta(file_path):
+        composition = sequence_composition(record['sequence'])
+        yield {
+            'header': record['header'],
+            'length': len(record['sequence']),
+            'type': composition['type'],
+            'counts': composition['counts'],
+            'gaps': composition['gaps'],
+            'ambiguous': composition['ambiguous'],
+            'gc_content': composition['gc_content']
+        }
+
+
+def read_sequence_range(file_path, index, start=0, end=None):
+    """
+    Return the record at position index with only residues[start:end]
+    Raises IndexError if the file has fewer records
+    """
+    for position, record in enumerate(iter_fasta(file_path)):
+        if position == index:
+            sequence = record['sequence']
+            end = len(sequence) if end is None else min(end, len(sequence))
+            start = max(0, min(start, end))
+            return {
+                'header': record['header'],
+                'length': len(sequence),
+                'start': start,
+                'end': end,
+                'residues': sequence[start:end]
+            }
+
+    raise IndexError(f'Sequence {index} not found')
+
+
+def decompress_to(file_path, destination):
+    """Write the uncompressed content of a (possibly compressed) FASTA file to destination"""
+    with open_sequence_file(file_path) as source, open(destination, 'w') as target:
+        shutil.copyfileobj(source, target)
 
 
 def analyze_sequences(sequences):
     """Calculate statistics and detect sequence types"""
     sequence_types = []
-    
+
     for seq in sequences:
+        composition = sequence_composition(seq['sequence'])
         seq['length'] = len(seq['sequence'])
-        seq_type = detect_sequence_type(seq['sequence'])
-        seq['type'] = seq_type
-        sequence_types.append(seq_type)
+        seq['type'] = composition['type']
+        seq['composition'] = composition
+        sequence_types.append(composition['type'])
+
+    return overall_sequence_type(sequence_types)
 
-    # Determine overall type (most common)
-    if sequence_types:
-        overall_type = max(set(sequence_types), key=sequence_types.count)
-    else:
-        overall_type = 'Unknown'
 
-    return overall_type
+def summarize_composition(records, seq_type):
+    """File-level composition from per-record summaries holding residue 'counts'"""
+    counts = Counter()
+    for record in records:
+        counts.update(record['counts'])
+    composition = composition_from_counts(dict(counts), seq_type)
+    composition['gaps'] = sum(record['gaps'] for record in records)
+    return composition
+
+
+def overall_sequence_type(sequence_types):
+    """Most common type among the records of a file"""
+    if not sequence_types:
+        return 'Unknown'
+    return Counter(sequence_types).most_common(1)[0][0]
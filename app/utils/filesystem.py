@@ -3,8 +3,25 @@ Filesystem utility functions
 Handles directory scanning and file operations
 """
 
+import errno
+import hashlib
+import os
+import shutil
+import threading
 from pathlib import Path
-from app.config import MAX_DIRECTORY_DEPTH, FASTA_EXTENSIONS
+from app.config import MAX_DIRECTORY_DEPTH, FASTA_EXTENSIONS, COMPRESSED_EXTENSIONS
+
+# Content hashes keyed by path, valid while mtime and size are unchanged
+_hash_cache = {}
+_hash_lock = threading.Lock()
+
+
+def is_fasta_file(file_name):
+    """Check if a file name has one of the FASTA extensions, optionally compressed"""
+    path = Path(file_name)
+    if path.suffix in COMPRESSED_EXTENSIONS:
+        path = path.with_suffix('')
+    return path.suffix in FASTA_EXTENSIONS
 
 
 def scan_directory_recursively(directory, max_depth=MAX_DIRECTORY_DEPTH, current_depth=0):
@@ -22,7 +39,7 @@ def scan_directory_recursively(directory, max_depth=MAX_DIRECTORY_DEPTH, current
 
     # Separate directories and files
     subdirs = [item for item in items if item.is_dir()]
-    fasta_files = [item.name for item in items if item.is_file() and item.suffix in FASTA_EXTENSIONS]
+    fasta_files = [item.name for item in items if item.is_file() and is_fasta_file(item.name)]
 
     # If there are FASTA files in this directory, add them
     if fasta_files:
@@ -35,3 +52,59 @@ def scan_directory_recursively(directory, max_depth=MAX_DIRECTORY_DEPTH, current
             structure[subdir.name] = subdir_structure
 
     return structure
+
+
+def file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file, reusing it while the file is unchanged"""
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    cache_key = str(file_path.resolve())
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _hash_lock:
+        cached = _hash_cache.get(cache_key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+
+    with _hash_lock:
+        _hash_cache[cache_key] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def get_directory_size(directory):
+    """Total size in bytes of the files directly inside a directory"""
+    if not directory.exists():
+        return 0
+    return sum(item.stat().st_size for item in directory.iterdir() if item.is_file())
+
+
+def move_file(source, target):
+    """
+    Move a file by renaming it, so that target appears complete at once
+    Across filesystems it is copied next to target first and then renamed
+    """
+    try:
+        os.replace(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        temp = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+        try:
+            shutil.copyfile(source, temp)
+            os.replace(temp, target)
+        finally:
+            temp.unlink(missing_ok=True)
+        os.unlink(source)
+
+
+def link_or_copy(source, target):
+    """Hard link source to target, or copy it when they are on different filesystems"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
@@ -0,0 +1,145 @@
+"""
+HTTP caching utilities
+Conditional responses from validators, negotiated gzip/brotli compression and precompressed variants
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from flask import Response, jsonify, request
+from app.config import (HTTP_CACHE_DIR, COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL, COMPRESSIBLE_MIMETYPES,
+                        PRECOMPRESSED_MAX_FILES)
+from app.utils.profiling import span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Quality of responses compressed on the fly (gzip level COMPRESSION_LEVEL), and of precompressed
+# variants, which are compressed once and served many times
+BROTLI_QUALITY = 5
+PRECOMPRESSED_LEVELS = {'br': 11, 'gzip': 9}
+
+# File extension of the precompressed variants of each encoding
+ENCODING_EXTENSIONS = {'br': 'br', 'gzip': 'gz'}
+
+
+def make_etag(*parts):
+    """Opaque entity tag from the values that identify a version of a response"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def from_mtime_ns(mtime_ns):
+    """Last-Modified datetime of a modification time in nanoseconds, None for none"""
+    if not mtime_ns:
+        return None
+    return datetime.fromtimestamp(mtime_ns / 1e9, tz=timezone.utc)
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    True if the client's copy is current: its If-None-Match has etag, or,
+    without If-None-Match, If-Modified-Since is not older than last_modified
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have a precision of one second
+        return int(last_modified.timestamp()) <= int(request.if_modified_since.timestamp())
+    return False
+
+
+def cached_json(build, etag, last_modified=None, precompress=False):
+    """
+    JSON response of build() with validators, or 304 Not Modified without calling build
+    Clients revalidate on every use; with precompress the compressed variants
+    are kept in HTTP_CACHE_DIR under etag so that they are compressed once
+    """
+    if is_not_modified(etag, last_modified):
+        response = Response(status=304)
+    elif not precompress:
+        response = jsonify(build())
+    else:
+        response = _precompressed_json(build, etag)
+
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def negotiate_encoding():
+    """Preferred encoding of the client among those supported, None for identity"""
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(supported)
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with 'gzip' or 'br'; level defaults to the on-the-fly quality"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    # mtime=0 keeps the output of the same data identical
+    return gzip.compress(data, compresslevel=COMPRESSION_LEVEL if level is None else level, mtime=0)
+
+
+def _precompressed_json(build, etag):
+    """JSON response of build() in the client's encoding, reusing the variant stored for etag"""
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return jsonify(build())
+
+    path = HTTP_CACHE_DIR / f'{etag}.json.{ENCODING_EXTENSIONS[encoding]}'
+    try:
+        body = path.read_bytes()
+    except OSError:
+        response = jsonify(build())
+        with span('encode'):
+            body = compress(response.get_data(), encoding, PRECOMPRESSED_LEVELS[encoding])
+        _store_variant(path, body)
+
+    response = Response(body, mimetype='application/json')
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _store_variant(path, body):
+    """Write a precompressed variant atomically, dropping the oldest beyond PRECOMPRESSED_MAX_FILES"""
+    try:
+        HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        temp.write_bytes(body)
+        os.replace(temp, path)
+
+        variants = [entry for entry in os.scandir(HTTP_CACHE_DIR) if not entry.name.endswith('.tmp')]
+        if len(variants) > PRECOMPRESSED_MAX_FILES:
+            variants.sort(key=lambda entry: entry.stat().st_mtime_ns)
+            for entry in variants[:len(variants) - PRECOMPRESSED_MAX_FILES]:
+                os.unlink(entry.path)
+    except OSError:
+        # The variant is only a cache: serve the response anyway
+        pass
+
+
+def enable_compression(app):
+    """Compress the responses of app in the encoding negotiated with the client"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed):
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or (response.content_length or 0) < COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+        with span('encode'):
+            response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,99 @@
+"""
+Resource limit utilities
+Applies memory caps to child processes and detects memory-related terminations
+"""
+
+import logging
+import os
+import re
+import resource
+import signal
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Terminal outcomes of a run that hit a memory limit
+KILLED_OOM = 'killed_oom'
+MEMORY_LIMIT_EXCEEDED = 'memory_limit_exceeded'
+
+# Messages of programs failing to allocate under RLIMIT_AS
+ALLOCATION_FAILURE = re.compile(r'bad_alloc|out of memory|cannot allocate memory|memory exhausted|MemoryError',
+                                re.IGNORECASE)
+
+
+def set_address_space_limit(limit):
+    """Cap the virtual memory of the calling process (run in the child before exec)"""
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def create_memory_cgroup(parent, name, limit):
+    """
+    Create a cgroup v2 group below the delegated directory parent with
+    memory.max set to limit and swap disabled
+    Returns its path, or None if cgroups cannot be used here
+    """
+    parent = Path(parent)
+    try:
+        controllers = (parent / 'cgroup.subtree_control').read_text().split()
+        if 'memory' not in controllers:
+            logger.warning('Memory controller not enabled in %s, using RLIMIT_AS instead', parent)
+            return None
+
+        group = parent / name
+        group.mkdir()
+        (group / 'memory.max').write_text(str(limit))
+        swap_max = group / 'memory.swap.max'
+        if swap_max.exists():
+            swap_max.write_text('0')
+        return group
+    except OSError as e:
+        logger.warning('Could not create memory cgroup in %s: %s', parent, e)
+        return None
+
+
+def join_cgroup(group):
+    """Move the calling process into a cgroup (run in the child before exec)"""
+    with open(group / 'cgroup.procs', 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def cgroup_oom_killed(group):
+    """True if the OOM killer killed a process of the cgroup"""
+    try:
+        for line in (group / 'memory.events').read_text().splitlines():
+            key, value = line.split()
+            if key == 'oom_kill' and int(value) > 0:
+                return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def remove_cgroup(group):
+    """Remove an empty cgroup, ignoring failures"""
+    try:
+        group.rmdir()
+    except OSError as e:
+        logger.warning('Could not remove cgroup %s: %s', group, e)
+
+
+def classify_termination(return_code, memory_limit, max_rss_kb=None, stderr='', cgroup_oom=False):
+    """
+    Return KILLED_OOM, MEMORY_LIMIT_EXCEEDED or None for a finished run
+    cgroup OOM kills are exact; without a cgroup a SIGKILL close to the
+    limit is attributed to the OOM killer and allocation failures under
+    RLIMIT_AS are recognized from the exit and the error output
+    """
+    if cgroup_oom:
+        return KILLED_OOM
+    if not memory_limit or return_code == 0:
+        return None
+
+    if return_code == -signal.SIGKILL:
+        if max_rss_kb is not None and max_rss_kb * 1024 >= 0.9 * memory_limit:
+            return KILLED_OOM
+        return None
+
+    if ALLOCATION_FAILURE.search(stderr or ''):
+        return MEMORY_LIMIT_EXCEEDED
+    return None
@@ -0,0 +1,246 @@
+"""
+Metrics utilities
+Counters, gauges and histograms in the Prometheus text format, shared between processes through snapshot files
+"""
+
+import bisect
+import fcntl
+import json
+import math
+import os
+import threading
+from app.utils.procstats import get_process_start_time, is_same_process
+
+# Histogram bucket bounds in seconds, for request latencies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Snapshot of the processes that are gone, whose counters and histograms still count
+ARCHIVE_FILE = 'archive.json'
+
+
+class _Metric:
+    """A metric family: one value per combination of label values"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labelnames)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def values(self):
+        """Current values as [label values, value] pairs"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def describe(self):
+        return {'type': self.type, 'help': self.documentation, 'labelnames': list(self.labelnames)}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; function, if set, computes the values when they are collected"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Compute the gauge when collected: function returns a value, or a dict of label tuples to values"""
+        self.function = function
+
+    def values(self):
+        if self.function is None:
+            return super().values()
+        result = self.function()
+        if not isinstance(result, dict):
+            return [[[], result]]
+        return [[[str(value) for value in key], value] for key, value in result.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets, with their count and sum"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            # Per-bucket counts, the last one above every bound; made cumulative when rendered
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def values(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def describe(self):
+        return {**super().describe(), 'buckets': list(self.buckets)}
+
+
+class Registry:
+    """The metric families of a process"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """JSON serializable view of every family and its values"""
+        return {metric.name: {**metric.describe(), 'values': metric.values()} for metric in self._metrics}
+
+
+class SnapshotStore:
+    """
+    Per-process snapshot files of a registry in a directory, merged when collected
+    Counters and histograms add up over the processes, dead ones included;
+    gauges only add up over the processes still alive
+    """
+
+    def __init__(self, directory, registry):
+        self.directory = directory
+        self.registry = registry
+        self._pid = None
+        self._start_time = None
+
+    def flush(self):
+        """Write the snapshot of this process, replacing its previous one"""
+        pid = os.getpid()
+        if pid != self._pid:
+            # Forked since the last flush: this is a process of its own
+            self._pid, self._start_time = pid, get_process_start_time(pid)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        path = self.directory / f'{self._pid}-{self._start_time}.json'
+        temp = path.with_suffix('.tmp')
+        with open(temp, 'w') as f:
+            json.dump({'pid': self._pid, 'start_time': self._start_time, 'families': self.registry.snapshot()}, f)
+        os.replace(temp, path)
+
+    def collect(self):
+        """Merged families of all processes, folding the snapshots of dead processes into the archive"""
+        self.flush()
+        with open(self.directory / '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _read_json(self.directory / ARCHIVE_FILE) or {}
+            live = []
+            dead = []
+            for path in self.directory.glob('*-*.json'):
+                snapshot = _read_json(path)
+                if snapshot is None:
+                    continue
+                if is_same_process(snapshot['pid'], snapshot['start_time']):
+                    live.append(snapshot['families'])
+                else:
+                    dead.append((path, snapshot['families']))
+
+            if dead:
+                archive = merge([archive] + [families for _, families in dead], gauges=False)
+                temp = self.directory / (ARCHIVE_FILE + '.tmp')
+                with open(temp, 'w') as f:
+                    json.dump(archive, f)
+                os.replace(temp, self.directory / ARCHIVE_FILE)
+                for path, _ in dead:
+                    path.unlink(missing_ok=True)
+
+        return merge([archive] + live)
+
+
+def merge(snapshots, gauges=True):
+    """Add up the values of families with the same name and labels; gauges are dropped unless gauges"""
+    merged = {}
+    for families in snapshots:
+        for name, family in families.items():
+            if family['type'] == 'gauge' and not gauges:
+                continue
+            target = merged.setdefault(name, {**family, 'values': {}})
+            for key, value in family['values']:
+                key = tuple(key)
+                if key not in target['values']:
+                    target['values'][key] = value
+                elif family['type'] == 'histogram':
+                    counts, total = target['values'][key]
+                    target['values'][key] = [[a + b for a, b in zip(counts, value[0])], total + value[1]]
+                else:
+                    target['values'][key] += value
+
+    for family in merged.values():
+        family['values'] = [[list(key), value] for key, value in family['values'].items()]
+    return merged
+
+
+def render(families):
+    """Families in the Prometheus text exposition format"""
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for key, value in sorted(family['values']):
+            labels = dict(zip(family['labelnames'], key))
+            if family['type'] != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(family['buckets'] + [math.inf], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value, quotes=True)}"' for name, value in labels.items()) + '}'
+
+
+def _escape(text, quotes=False):
+    text = str(text).replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _format_value(value):
+    return '+Inf' if value == math.inf else repr(value)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,189 @@
+"""
+Process statistics utilities
+Waits for child processes while sampling their memory and CPU usage
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from app.config import TELEMETRY_SAMPLE_INTERVAL, TELEMETRY_MAX_SAMPLES
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def read_proc_sample(pid):
+    """
+    Return (rss_kb, cpu_seconds) of a running process from /proc
+    Returns None if the process is gone or /proc is not available
+    """
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_text()
+        status = Path(f'/proc/{pid}/status').read_text()
+    except OSError:
+        return None
+
+    # The command name may contain spaces, fields start after its closing parenthesis
+    fields = stat[stat.rindex(')') + 2:].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    rss_kb = 0
+    for line in status.splitlines():
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+            break
+
+    return rss_kb, cpu_seconds
+
+
+def get_process_start_time(pid):
+    """
+    Return the start time of a process in clock ticks since boot, or None if
+    it does not exist or is a zombie; together with the pid it identifies
+    the process even after the pid is reused
+    """
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_text()
+    except OSError:
+        return None
+
+    fields = stat[stat.rindex(')') + 2:].split()
+    if fields[0] == 'Z':
+        return None
+    return int(fields[19])
+
+
+def is_same_process(pid, start_time):
+    """True if pid is still alive and is the process that started at start_time"""
+    return start_time is not None and get_process_start_time(pid) == start_time
+
+
+def kill_process(pid, start_time):
+    """SIGKILL a process unless its pid now belongs to another process"""
+    if not is_same_process(pid, start_time):
+        return False
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def rusage_to_dict(rusage, wall_time):
+    """Resource usage of a finished child as a serializable dict"""
+    if rusage is None:
+        return None
+
+    cpu_time = rusage.ru_utime + rusage.ru_stime
+    return {
+        'user_time': rusage.ru_utime,
+        'system_time': rusage.ru_stime,
+        'cpu_time': cpu_time,
+        'cpu_utilization': cpu_time / wall_time if wall_time > 0 else None,
+        'max_rss_kb': rusage.ru_maxrss,
+        'voluntary_context_switches': rusage.ru_nvcsw,
+        'involuntary_context_switches': rusage.ru_nivcsw,
+        'minor_page_faults': rusage.ru_minflt,
+        'major_page_faults': rusage.ru_majflt
+    }
+
+
+class ProcessMonitor:
+    """
+    Reaps a Popen child with wait4 to get its own resource usage and keeps a
+    timeline of [elapsed_seconds, rss_kb, cpu_percent] samples while it runs
+    """
+
+    def __init__(self, process, interval=TELEMETRY_SAMPLE_INTERVAL, max_samples=TELEMETRY_MAX_SAMPLES):
+        self.process = process
+        self.interval = interval
+        self.max_samples = max_samples
+        self.samples = []
+        self.rusage = None
+        self.timed_out = False
+        self._start = time.monotonic()
+        self._last_cpu = 0.0
+        self._last_sample = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the child to exit, sampling it meanwhile from another thread
+        Sets process.returncode; kills the child and raises
+        subprocess.TimeoutExpired on timeout
+        """
+        if self.process.returncode is None:
+            self._done.clear()
+            sampler = threading.Thread(target=self._sample_until_done, args=(timeout,), daemon=True)
+            sampler.start()
+            try:
+                self._reap()
+            finally:
+                self._done.set()
+                sampler.join()
+
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.process.args, timeout)
+        return self.process.returncode
+
+    def timeline(self):
+        """Sampled timeline as a serializable dict"""
+        return {
+            'interval': self.interval,
+            'columns': ['elapsed', 'rss_kb', 'cpu_percent'],
+            'samples': self.samples
+        }
+
+    def _reap(self):
+        """Block until the child exits and collect its exit status and rusage"""
+        try:
+            _, status, rusage = os.wait4(self.process.pid, 0)
+        except ChildProcessError:
+            # Already reaped through Popen (e.g. by a concurrent kill), rusage is lost
+            self.process.wait()
+            return
+
+        self.rusage = rusage
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+
+    def _sample_until_done(self, timeout):
+        """Sample the child every interval and kill it once the timeout expires"""
+        deadline = None if timeout is None else self._start + timeout
+        while not self._done.is_set():
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                self.timed_out = True
+                try:
+                    # The child is not reaped before _done is set, so its pid is still ours
+                    os.kill(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                return
+
+            self._sample(now)
+            wait = self.interval if deadline is None else min(self.interval, deadline - now)
+            self._done.wait(max(wait, 0))
+
+    def _sample(self, now):
+        """Record the current RSS and CPU usage of the child"""
+        sample = read_proc_sample(self.process.pid)
+        if sample is None:
+            return
+
+        rss_kb, cpu_seconds = sample
+        elapsed = now - self._start
+        if self._last_sample is not None and now > self._last_sample:
+            cpu_percent = 100 * (cpu_seconds - self._last_cpu) / (now - self._last_sample)
+        else:
+            cpu_percent = 100 * cpu_seconds / elapsed if elapsed > 0 else 0.0
+
+        self.samples.append([round(elapsed, 3), rss_kb, round(cpu_percent, 1)])
+        self._last_cpu = cpu_seconds
+        self._last_sample = now
+
+        # Keep the timeline bounded: halve its resolution when it gets too long
+        if len(self.samples) > self.max_samples:
+            self.samples = self.samples[::2]
+            self.interval *= 2
@@ -0,0 +1,108 @@
+"""
+Profiling utilities
+Named timing spans collected per request or job, and a sampling stack profiler
+"""
+
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Spans of the request or job running in the current context, None when nothing collects them
+_current = ContextVar('profiling_spans', default=None)
+
+
+class Spans:
+    """Total time and number of occurrences of each named span"""
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def to_dict(self):
+        """{name: {'ms', 'count'}}"""
+        with self._lock:
+            return {name: {'ms': round(seconds * 1000, 3), 'count': count}
+                    for name, (seconds, count) in self.totals.items()}
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as a span of the current request or job; free when nothing collects"""
+    spans = _current.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.add(name, time.perf_counter() - started)
+
+
+def start_spans():
+    """Collect the spans of the current context; returns the token for stop_spans"""
+    return _current.set(Spans())
+
+
+def stop_spans(token):
+    """Stop collecting and return the spans collected since start_spans"""
+    spans = _current.get()
+    _current.reset(token)
+    return spans
+
+
+def format_server_timing(spans, total=None, prefix=''):
+    """Spans as the value of a Server-Timing header"""
+    entries = [
+        f'{prefix}{name};dur={value["ms"]}' + (f';desc="x{value["count"]}"' if value['count'] > 1 else '')
+        for name, value in spans.to_dict().items()
+    ]
+    if total is not None:
+        entries.append(f'{prefix}total;dur={round(total * 1000, 3)}')
+    return ', '.join(entries)
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread
+    Produces collapsed stacks (one 'frame;frame;... count' line per stack), the
+    input format of flame graph tools
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """The samples as collapsed stacks, most frequent first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
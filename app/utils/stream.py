@@ -0,0 +1,126 @@
+"""
+Output streaming utilities
+Bounded in-memory buffers fed by tailing files written by child processes
+"""
+
+import threading
+import time
+from collections import deque
+from app.config import STREAM_BUFFER_LINES, STREAM_MAX_LINE_LENGTH, STREAM_POLL_INTERVAL
+
+
+class OutputStream:
+    """
+    Ring buffer of the most recent output lines of a job
+    Each line gets an increasing sequence number so readers can resume
+    """
+
+    def __init__(self, max_lines=STREAM_BUFFER_LINES):
+        self._lines = deque(maxlen=max_lines)
+        self._next_seq = 1
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def append(self, name, line):
+        """Add a line coming from the stream called name (stdout, stderr, verbose)"""
+        if len(line) > STREAM_MAX_LINE_LENGTH:
+            line = line[:STREAM_MAX_LINE_LENGTH] + '...'
+        with self._condition:
+            self._lines.append((self._next_seq, name, line))
+            self._next_seq += 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Mark the stream as finished, waking up all readers"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def read_since(self, last_seq, timeout=None):
+        """
+        Wait for lines newer than last_seq
+        Returns (lines, skipped, closed) where skipped counts lines that
+        already left the ring buffer
+        """
+        with self._condition:
+            if self._next_seq - 1 <= last_seq and not self._closed:
+                self._condition.wait(timeout)
+
+            lines = [entry for entry in self._lines if entry[0] > last_seq]
+            skipped = 0
+            if lines:
+                skipped = lines[0][0] - last_seq - 1
+
+            return lines, skipped, self._closed and not lines
+
+
+class FileTailer:
+    """
+    Follows a file while another process writes to it, forwarding complete
+    lines to an OutputStream and keeping the last few lines in memory
+    """
+
+    def __init__(self, path, name, stream=None, tail_lines=STREAM_BUFFER_LINES):
+        self.path = path
+        self.name = name
+        self.stream = stream
+        self._tail = deque(maxlen=tail_lines)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop following the file once everything written so far is read"""
+        self._stop.set()
+        self._thread.join()
+
+    def tail(self):
+        """Last lines read from the file"""
+        return '\n'.join(self._tail)
+
+    def _emit(self, line):
+        line = line.rstrip('\r\n')
+        self._tail.append(line)
+        if self.stream is not None:
+            self.stream.append(self.name, line)
+
+    def _run(self):
+        # The writer may not have created the file yet
+        while not self.path.exists():
+            if self._stop.is_set():
+                return
+            time.sleep(STREAM_POLL_INTERVAL)
+
+        partial = ''
+        with open(self.path, 'r', errors='replace') as f:
+            while True:
+                stopping = self._stop.is_set()
+                chunk = f.readline(STREAM_MAX_LINE_LENGTH)
+                if chunk:
+                    partial += chunk
+                    if partial.endswith('\n') or len(partial) >= STREAM_MAX_LINE_LENGTH:
+                        self._emit(partial)
+                        partial = ''
+                    continue
+
+                if stopping:
+                    break
+                time.sleep(STREAM_POLL_INTERVAL)
+
+        if partial:
+            self._emit(partial)
+
+
+def read_tail(path, lines=STREAM_BUFFER_LINES):
+    """Last lines of a file, truncated like the lines of a FileTailer"""
+    tail = deque(maxlen=lines)
+    try:
+        with open(path, 'r', errors='replace') as f:
+            for line in f:
+                tail.append(line.rstrip('\r\n')[:STREAM_MAX_LINE_LENGTH])
+    except OSError:
+        pass
+    return '\n'.join(tail)
@@ -0,0 +1,106 @@
+"""
+System utility functions
+Detects the CPU and memory resources available to the application
+"""
+
+import math
+import os
+from pathlib import Path
+
+CGROUP_V2_CPU_MAX = Path('/sys/fs/cgroup/cpu.max')
+CGROUP_V1_CPU_QUOTA = Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+CGROUP_V1_CPU_PERIOD = Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+CGROUP_V2_MEMORY_MAX = Path('/sys/fs/cgroup/memory.max')
+CGROUP_V1_MEMORY_LIMIT = Path('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+PROC_MEMINFO = Path('/proc/meminfo')
+
+
+def get_usable_cpus():
+    """Return the sorted list of CPU ids this process is allowed to run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        # Platforms without sched_getaffinity
+        return list(range(os.cpu_count() or 1))
+
+
+def get_cgroup_cpu_quota():
+    """
+    Return the cgroup CPU quota as a number of CPUs
+    Returns None when no quota is set or cgroups are not available
+    """
+    try:
+        if CGROUP_V2_CPU_MAX.exists():
+            quota, period = CGROUP_V2_CPU_MAX.read_text().split()
+            if quota == 'max':
+                return None
+            return int(quota) / int(period)
+
+        if CGROUP_V1_CPU_QUOTA.exists() and CGROUP_V1_CPU_PERIOD.exists():
+            quota = int(CGROUP_V1_CPU_QUOTA.read_text())
+            period = int(CGROUP_V1_CPU_PERIOD.read_text())
+            if quota <= 0:
+                return None
+            return quota / period
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def get_core_budget():
+    """
+    Return (cpu_ids, budget) where budget is the number of cores
+    alignments may use at the same time
+    """
+    cpu_ids = get_usable_cpus()
+    budget = len(cpu_ids)
+
+    quota = get_cgroup_cpu_quota()
+    if quota is not None:
+        budget = min(budget, max(1, math.ceil(quota)))
+
+    return cpu_ids, budget
+
+
+def get_cgroup_memory_limit():
+    """
+    Return the cgroup memory limit in bytes
+    Returns None when no limit is set or cgroups are not available
+    """
+    try:
+        if CGROUP_V2_MEMORY_MAX.exists():
+            value = CGROUP_V2_MEMORY_MAX.read_text().strip()
+            return None if value == 'max' else int(value)
+
+        if CGROUP_V1_MEMORY_LIMIT.exists():
+            value = int(CGROUP_V1_MEMORY_LIMIT.read_text())
+            # v1 reports an unset limit as a huge page-aligned number
+            return value if value < 2 ** 60 else None
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def get_total_memory():
+    """Return the memory in bytes usable by this process: host RAM capped by the cgroup limit"""
+    total = None
+    try:
+        for line in PROC_MEMINFO.read_text().splitlines():
+            if line.startswith('MemTotal:'):
+                total = int(line.split()[1]) * 1024
+                break
+    except (OSError, ValueError):
+        pass
+
+    if total is None:
+        try:
+            total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (AttributeError, ValueError, OSError):
+            total = None
+
+    limit = get_cgroup_memory_limit()
+    if limit is not None:
+        total = limit if total is None else min(total, limit)
+    return total
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration
+Every setting can be overridden by its MSA_* environment variable
+"""
+
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('MSA_BIND', '0.0.0.0:5000')
+
+# Processes and threads per process. Threads keep Server-Sent Events streams from
+# blocking a whole process; one process is elected to own the job queue and the others
+# forward it job requests, so any number of processes share the same queue.
+workers = int(os.environ.get('MSA_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('MSA_THREADS', 8))
+
+# Alignments run in the background and outlive the request that started them, so the
+# request timeout has nothing to do with MAX_EXECUTION_TIMEOUT
+timeout = int(os.environ.get('MSA_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('MSA_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('MSA_KEEPALIVE', 5))
+
+# Each process builds its own app: the background watchers and the leader election are per process
+preload_app = False